@@ -0,0 +1,303 @@
+"""Benchmark offline da loja: cliques na vitrine e rajada de webhooks.
+
+    python -m bench --users 2000 --psp-latency-ms 80 --discord-latency-ms 40
+
+Roda contra um banco temporário (nunca o store.db), com Discord, PSP e
+Notifier falsos. Imprime vazão, p50/p99 e a contenção do StoreDB; use
+--json para comparar execuções entre versões.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from typing import Dict, List
+
+
+def parse_args():
+    ap = argparse.ArgumentParser(prog="python -m bench", description="Benchmark offline do bot de vendas")
+    ap.add_argument("--users", type=int, default=1000, help="clientes simulados")
+    ap.add_argument("--adds", type=int, default=3, help="cliques em 'Adicionar' por cliente antes do checkout")
+    ap.add_argument("--concurrency", type=int, default=200, help="cliques simultâneos no máximo")
+    ap.add_argument("--products", type=int, default=50, help="SKUs no catálogo")
+    ap.add_argument("--psp-latency-ms", type=float, default=50.0)
+    ap.add_argument("--psp-fail-rate", type=float, default=0.0)
+    ap.add_argument("--discord-latency-ms", type=float, default=30.0)
+    ap.add_argument("--webhook-dupes", type=int, default=2, help="reenvios de cada webhook (testa a deduplicação)")
+    ap.add_argument("--webhook-concurrency", type=int, default=100)
+    ap.add_argument("--workers", type=int, default=8, help="workers do TaskPipeline")
+    ap.add_argument("--db", help="arquivo do banco (padrão: temporário, apagado no fim)")
+    ap.add_argument("--json", action="store_true", help="saída em JSON")
+    return ap.parse_args()
+
+
+args = parse_args()
+_tmpdir = None
+if not args.db:
+    _tmpdir = tempfile.TemporaryDirectory(prefix="bench-")
+    args.db = os.path.join(_tmpdir.name, "bench.db")
+# config.py lê o ambiente no import: nada de token real, PSP falso
+os.environ["DB_PATH"] = args.db
+os.environ["PAYMENT_BACKEND"] = "fake"
+os.environ.setdefault("WEBHOOK_VERIFY_TOKEN", "bench")
+
+from src.config import WEBHOOK_VERIFY_TOKEN  # noqa: E402
+from src.db import ORDER_PAGE_MAX, StoreDB  # noqa: E402
+from src.models import Product  # noqa: E402
+from src.services.analytics import Analytics, day_range  # noqa: E402
+from src.services.cart import CartStore  # noqa: E402
+from src.services.guilds import GuildSettings  # noqa: E402
+from src.services.outbox import Outbox  # noqa: E402
+from src.services.payments import FakePSP, PaymentGateway  # noqa: E402
+from src.services.tasks import TaskPipeline, _percentile  # noqa: E402
+from src.ui.views import CartChannelManager, Vitrine, VitrineButton  # noqa: E402
+from src.webapp import app  # noqa: E402
+
+from .asgi import asgi_request  # noqa: E402
+from .fakes import FakeClient, FakeDiscord, FakeGuild, FakeInteraction, FakeMember, FakeNotifier  # noqa: E402
+
+
+def summarize(samples: List[float], elapsed: float) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0}
+    return {
+        "count": len(samples),
+        "per_second": len(samples) / elapsed if elapsed else 0.0,
+        "p50_ms": _percentile(samples, 0.50) * 1000,
+        "p99_ms": _percentile(samples, 0.99) * 1000,
+        "max_ms": max(samples) * 1000,
+    }
+
+
+async def seed(db: StoreDB, n: int) -> List[str]:
+    skus = [f"BENCH_{i:04d}" for i in range(n)]
+    for i, sku in enumerate(skus):
+        await db.upsert_product(Product(sku=sku, name=f"Produto {i}", price=round(5 + i * 1.5, 2), description="bench", category="bench"))
+    await db.warm_catalog()
+    return skus
+
+
+async def click_storm(vitrine: Vitrine, client: FakeClient, guild: FakeGuild, skus: List[str]) -> Dict[str, dict]:
+    latency: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+    gate = asyncio.Semaphore(args.concurrency)
+
+    async def click(user: FakeMember, action: str, sku: str):
+        async with gate:
+            interaction = FakeInteraction(client, guild, user)
+            started = time.perf_counter()
+            try:
+                await VitrineButton(action, sku).callback(interaction)
+            except Exception:
+                errors[action] += 1
+                return
+            latency[action].append(time.perf_counter() - started)
+
+    async def customer(user_id: int):
+        user = FakeMember(user_id)
+        for _ in range(args.adds):
+            await click(user, "add", random.choice(skus))
+        await click(user, "ver", skus[0])
+        await click(user, "checkout", skus[0])
+
+    started = time.perf_counter()
+    await asyncio.gather(*(customer(100_000 + i) for i in range(args.users)))
+    handlers = time.perf_counter() - started
+    # o trabalho lento (PSP, canal, mensagens) terminou quando as filas esvaziarem
+    await vitrine.tasks.close(timeout=3600)
+    await vitrine.outbox.close(timeout=3600)
+    drained = time.perf_counter() - started
+
+    out = {action: summarize(samples, handlers) for action, samples in latency.items()}
+    out["_totals"] = {
+        "clicks": sum(len(s) for s in latency.values()),
+        "errors": dict(errors),
+        "handlers_seconds": handlers,
+        "drain_seconds": drained,
+        "clicks_per_second": sum(len(s) for s in latency.values()) / handlers if handlers else 0.0,
+    }
+    return out
+
+
+async def all_order_ids(db: StoreDB) -> List[int]:
+    ids, before = [], None
+    while True:
+        rows = await db.query_orders(before_id=before, limit=ORDER_PAGE_MAX)
+        if not rows:
+            return ids
+        ids += [r["id"] for r in rows]
+        before = rows[-1]["id"]
+
+
+async def webhook_storm(db: StoreDB, order_ids: List[int]) -> dict:
+    # por pedido: pending, approved e reenvios dos dois, fora de ordem
+    events = []
+    for order_id in order_ids:
+        for status in ("pending", "approved"):
+            events += [{"order_id": order_id, "status": status}] * (1 + args.webhook_dupes)
+    random.shuffle(events)
+
+    latency: List[float] = []
+    results: Dict[str, int] = defaultdict(int)
+    gate = asyncio.Semaphore(args.webhook_concurrency)
+    headers = {"x-token": WEBHOOK_VERIFY_TOKEN}
+
+    async def post(payload: dict):
+        async with gate:
+            started = time.perf_counter()
+            status, body = await asgi_request(app, "POST", "/webhook/mp", payload, headers)
+            latency.append(time.perf_counter() - started)
+            if status != 200:
+                results[f"http_{status}"] += 1
+            else:
+                results["queued" if json.loads(body).get("queued") else "duplicate"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(post(p) for p in events))
+    ingest = time.perf_counter() - started
+    while (await db.webhook_queue_stats())["depth"]:
+        await asyncio.sleep(0.05)
+    drained = time.perf_counter() - started
+
+    paid, before = 0, None
+    while True:
+        rows = await db.query_orders(status="pago", before_id=before, limit=ORDER_PAGE_MAX)
+        if not rows:
+            break
+        paid += len(rows)
+        before = rows[-1]["id"]
+
+    return {
+        "requests": summarize(latency, ingest),
+        "results": dict(results),
+        "ingest_seconds": ingest,
+        "drain_seconds": drained,
+        "events_per_second": len(events) / drained if drained else 0.0,
+        "orders": len(order_ids),
+        "orders_paid": paid,
+        "processor": await app.state.webhooks.stats(),
+    }
+
+
+async def wait_deliveries(db: StoreDB) -> dict:
+    # os pedidos pagos pela rajada entram na fila de entrega; mede até ela esvaziar
+    started = time.perf_counter()
+    while True:
+        stats = await db.delivery_stats()
+        if not stats.get("pendente") and not stats.get("entregando"):
+            break
+        await asyncio.sleep(0.05)
+    out = dict(await db.delivery_stats())
+    out["drain_seconds"] = time.perf_counter() - started
+    return out
+
+
+async def analytics_report(analytics: Analytics, guild: FakeGuild) -> dict:
+    # o relatório lê só os agregados diários: o custo independe do número de pedidos
+    started = time.perf_counter()
+    report = await analytics.report(guild.id, *day_range(30))
+    return {
+        "report_ms": (time.perf_counter() - started) * 1000,
+        "revenue": report["revenue"],
+        "paid_orders": report["paid_orders"],
+        "units": report["units"],
+        "conversion": report["conversion"],
+    }
+
+
+async def run() -> dict:
+    api = FakeDiscord(latency=args.discord_latency_ms / 1000, jitter=args.discord_latency_ms / 4000)
+    db = StoreDB(args.db)
+    try:
+        skus = await seed(db, args.products)
+        guild = FakeGuild(api)
+        log_channel = guild.add_channel("log-pedidos")
+        # canal de log configurado como o /admin_config faria
+        settings = GuildSettings(db)
+        await settings.update(guild.id, order_log_channel_id=log_channel.id)
+        client = FakeClient(guild)
+        carts = CartStore(db)
+        payments = PaymentGateway(FakePSP(latency=args.psp_latency_ms / 1000, jitter=args.psp_latency_ms / 4000, fail_rate=args.psp_fail_rate))
+        tasks = TaskPipeline(workers=args.workers, max_queue=args.users * (args.adds + 2))
+        tasks.start()
+        cart_channel_mgr = CartChannelManager(db, settings)
+        client.outbox = Outbox(client, cart_channel_mgr)
+        analytics = Analytics(db)
+        vitrine = client.vitrine = Vitrine(db, cart_channel_mgr, carts, payments, tasks, client.outbox, settings, analytics)
+
+        report = {"config": {k: v for k, v in vars(args).items() if k not in ("db", "json")}}
+        report["clicks"] = await click_storm(vitrine, client, guild, skus)
+        report["pipeline"] = tasks.stats()
+        await carts.flush()
+        await payments.close()
+        report["discord_calls"] = api.calls
+
+        app.state.db = db
+        app.state.bot = None
+        app.state.notifier = FakeNotifier(api, client)
+        app.state.guild_settings = settings
+        async with app.router.lifespan_context(app):
+            report["webhooks"] = await webhook_storm(db, await all_order_ids(db))
+            report["delivery"] = await wait_deliveries(db)
+        await analytics.flush()
+        report["analytics"] = await analytics_report(analytics, guild)
+        await client.outbox.close(timeout=3600)
+        report["outbox"] = client.outbox.stats()
+        report["outbox"]["log_messages"] = log_channel.sent
+        report["db"] = db.stats()
+        return report
+    finally:
+        db.close()
+
+
+def print_report(report: dict):
+    print("== Cliques na vitrine ==")
+    for action, s in report["clicks"].items():
+        if action == "_totals":
+            continue
+        print(f"  {action:<9} n={s['count']:<6} {s['per_second']:8.1f}/s  p50={s['p50_ms']:7.1f}ms  p99={s['p99_ms']:7.1f}ms  max={s['max_ms']:7.1f}ms")
+    t = report["clicks"]["_totals"]
+    print(f"  total {t['clicks']} cliques, {t['clicks_per_second']:.1f}/s; fila esvaziou em {t['drain_seconds']:.2f}s; erros: {t['errors'] or 'nenhum'}")
+    print("== Pipeline (etapas em background) ==")
+    for k, v in sorted(report["pipeline"].items()):
+        print(f"  {k:<28} {v:10.1f}" if isinstance(v, float) else f"  {k:<28} {v:>10}")
+    w = report["webhooks"]
+    r = w["requests"]
+    print("== Rajada de webhooks ==")
+    print(f"  {r['count']} requisições: {r['per_second']:.1f}/s  p50={r['p50_ms']:.1f}ms  p99={r['p99_ms']:.1f}ms  resultados={w['results']}")
+    print(f"  fila processada em {w['drain_seconds']:.2f}s ({w['events_per_second']:.1f} eventos/s); {w['orders_paid']}/{w['orders']} pedidos pagos")
+    print(f"  processor: {w['processor']}")
+    print("== Entrega automática ==")
+    print(f"  {report['delivery']}")
+    print("== Relatório de vendas (agregados) ==")
+    print(f"  {report['analytics']}")
+    print("== Outbox (mensagens enviadas ao Discord) ==")
+    print(f"  {report['outbox']}")
+    print("== Contenção do StoreDB ==")
+    for k, v in report["db"].items():
+        print(f"  {k:<22} {v:10.2f}" if isinstance(v, float) else f"  {k:<22} {v:>10}")
+    print(f"== Chamadas simuladas ao Discord: {report['discord_calls']} ==")
+
+
+def main():
+    # com --json só o relatório vai para o stdout; avisos do app (migrações,
+    # DELIVERY_SECRET, erros) seguem visíveis no stderr
+    quiet = contextlib.redirect_stdout(sys.stderr) if args.json else contextlib.nullcontext()
+    try:
+        with quiet:
+            report = asyncio.run(run())
+    finally:
+        if _tmpdir:
+            _tmpdir.cleanup()
+    if args.json:
+        print(json.dumps(report, indent=2, default=str))
+    else:
+        print_report(report)
+
+
+main()
\ No newline at end of file
@@ -0,0 +1,54 @@
+import asyncio
+import json
+from typing import Dict, Optional, Tuple
+
+# Cliente ASGI em processo: chama o app FastAPI direto, sem socket nem
+# servidor HTTP, para que o benchmark meça só a aplicação.
+
+
+async def asgi_request(app, method: str, path: str, body: Optional[dict] = None, headers: Optional[Dict[str, str]] = None) -> Tuple[int, bytes]:
+    raw = json.dumps(body).encode() if body is not None else b""
+    path, _, query = path.partition("?")
+    header_list = [(b"content-type", b"application/json"), (b"content-length", str(len(raw)).encode())]
+    header_list += [(k.lower().encode(), v.encode()) for k, v in (headers or {}).items()]
+    scope = {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": method,
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "query_string": query.encode(),
+        "root_path": "",
+        "headers": header_list,
+        "client": ("127.0.0.1", 0),
+        "server": ("bench", 80),
+        "app": app,
+    }
+    request_sent = False
+    response_done = asyncio.Event()
+    status = 0
+    chunks = []
+
+    async def receive():
+        nonlocal request_sent
+        if not request_sent:
+            request_sent = True
+            return {"type": "http.request", "body": raw, "more_body": False}
+        # só "desconecta" depois que a resposta terminou
+        await response_done.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message):
+        nonlocal status
+        if message["type"] == "http.response.start":
+            status = message["status"]
+        elif message["type"] == "http.response.body":
+            chunks.append(message.get("body", b""))
+            if not message.get("more_body", False):
+                response_done.set()
+
+    await app(scope, receive, send)
+    response_done.set()
+    return status, b"".join(chunks)
\ No newline at end of file
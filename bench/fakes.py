@@ -0,0 +1,178 @@
+import asyncio
+import itertools
+import random
+from typing import Dict, List, Optional
+
+import discord
+
+# Objetos mínimos no lugar de discord.Interaction/Guild/TextChannel: só o que
+# Vitrine, VitrineButton e CartChannelManager usam. Cada chamada "ao Discord"
+# dorme `latency` (+/- jitter) para simular o round-trip da API.
+
+_ids = itertools.count(10_000_000)
+
+
+class FakeDiscord:
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls = 0
+
+    async def roundtrip(self):
+        self.calls += 1
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+
+
+class FakeMessage:
+    def __init__(self, channel: "FakeChannel", id: Optional[int] = None):
+        self.id = id or next(_ids)
+        self.channel = channel
+
+    async def edit(self, **kwargs):
+        await self.channel.api.roundtrip()
+        self.channel.edited += 1
+
+    async def pin(self):
+        await self.channel.api.roundtrip()
+
+
+class FakeChannel:
+    category_id = None
+
+    def __init__(self, api: FakeDiscord, guild: "FakeGuild", name: str, overwrites: Optional[dict] = None, id: Optional[int] = None):
+        self.api = api
+        self.guild = guild
+        self.id = id or next(_ids)
+        self.name = name
+        self.overwrites = overwrites or {}
+        self.sent = 0
+        self.edited = 0
+
+    async def send(self, content=None, **kwargs):
+        await self.api.roundtrip()
+        self.sent += 1
+        return FakeMessage(self)
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return FakeMessage(self, message_id)
+
+    async def delete(self, reason=None):
+        await self.api.roundtrip()
+        self.guild.channels.pop(self.id, None)
+
+
+class FakeMember:
+    def __init__(self, id: int):
+        self.id = id
+        self.name = f"cliente{id}"
+        self.mention = f"<@{id}>"
+
+
+class FakeGuild:
+    def __init__(self, api: FakeDiscord, id: int = 1):
+        self.api = api
+        self.id = id
+        self.channels: Dict[int, FakeChannel] = {}
+        self.default_role = object()
+        self.me = FakeMember(1)
+
+    @property
+    def text_channels(self) -> List[FakeChannel]:
+        return list(self.channels.values())
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return self.channels.get(channel_id)
+
+    async def create_text_channel(self, name: str, overwrites: Optional[dict] = None, category=None) -> FakeChannel:
+        # criar canal é bem mais lento que mandar mensagem no Discord real
+        await self.api.roundtrip()
+        await self.api.roundtrip()
+        channel = self.add_channel(name, overwrites=overwrites)
+        return channel
+
+    def add_channel(self, name: str, id: Optional[int] = None, overwrites: Optional[dict] = None) -> FakeChannel:
+        channel = FakeChannel(self.api, self, name, overwrites, id)
+        self.channels[channel.id] = channel
+        return channel
+
+
+class FakeResponse:
+    def __init__(self, api: FakeDiscord):
+        self.api = api
+        self._done = False
+
+    def is_done(self) -> bool:
+        return self._done
+
+    async def send_message(self, content=None, **kwargs):
+        await self.api.roundtrip()
+        self._done = True
+
+    async def defer(self, **kwargs):
+        await self.api.roundtrip()
+        self._done = True
+
+    async def edit_message(self, **kwargs):
+        await self.api.roundtrip()
+        self._done = True
+
+
+class FakeClient:
+    # vitrine e outbox são preenchidos depois, como no StoreBot.attach()
+    def __init__(self, guild: FakeGuild):
+        self.vitrine = None
+        self.outbox = None
+        self.guilds = [guild]
+
+    async def wait_until_ready(self):
+        pass
+
+    def get_guild(self, guild_id: int) -> Optional[FakeGuild]:
+        return next((g for g in self.guilds if g.id == guild_id), None)
+
+    def get_channel(self, channel_id: int) -> Optional[FakeChannel]:
+        return next((c for g in self.guilds if (c := g.get_channel(channel_id))), None)
+
+    async def fetch_channel(self, channel_id: int):
+        raise discord.NotFound(_FakeHTTPResponse(404), "canal desconhecido")
+
+
+class _FakeHTTPResponse:
+    def __init__(self, status: int):
+        self.status = status
+        self.reason = "fake"
+
+
+class FakeInteraction:
+    def __init__(self, client: FakeClient, guild: FakeGuild, user: FakeMember):
+        self.id = next(_ids)
+        self.client = client
+        self.guild = guild
+        self.guild_id = guild.id
+        self.user = user
+        self.created_at = discord.utils.utcnow()
+        self.response = FakeResponse(guild.api)
+        self.extras: dict = {}
+
+    async def edit_original_response(self, **kwargs):
+        await self.guild.api.roundtrip()
+
+
+class FakeNotifier:
+    # substitui o Notifier do webapp: DM vira um round-trip simulado e o log
+    # vai para o Outbox, como no bot de verdade
+    def __init__(self, api: FakeDiscord, client: FakeClient):
+        self.api = api
+        self.client = client
+        self.sent = 0
+
+    def post_log(self, channel_id: int, embed: discord.Embed, guild_id: Optional[int] = None):
+        self.client.outbox.log(channel_id, embed, guild_id)
+
+    async def send_dm(self, user_id: int, content: str):
+        await self.api.roundtrip()
+        self.sent += 1
+
+    async def send_to_channel(self, channel_id: int, route: str = "log", **kwargs):
+        await self.api.roundtrip()
+        self.sent += 1
\ No newline at end of file
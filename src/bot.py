@@ -1,58 +1,225 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from typing import List
+
 import discord
 from discord.ext import commands
 from discord import app_commands
-from .config import DISCORD_BOT_TOKEN, DISCORD_GUILD_ID, DB_PATH, CART_CATEGORY_ID, PRODUCT_IMAGE_8BALL_GUIDE, DELIVERY_URL_8BALL_GUIDE
+from .config import (
+    DISCORD_BOT_TOKEN, DISCORD_GUILD_ID, CART_CATEGORY_ID, ORDER_LOG_CHANNEL_ID,
+    CART_CACHE_SIZE, CART_TTL_SECONDS, CART_FLUSH_SECONDS, TASK_WORKERS, TASK_QUEUE_SIZE, TASK_RETRIES,
+    CART_CHANNEL_IDLE_HOURS, OUTBOX_WINDOW_SECONDS, ORDER_PENDING_TTL_HOURS, RECONCILE_AFTER_MINUTES,
+    RECONCILE_CONCURRENCY, ORDER_ARCHIVE_DAYS, MAINTENANCE_INTERVAL_SECONDS,
+    BOT_WORKERS, SHARD_COUNT, SHARD_IDS, WORKER_INDEX, GUILD_SETTINGS_TTL_SECONDS, ANALYTICS_FLUSH_SECONDS,
+    SHUTDOWN_TIMEOUT_SECONDS,
+)
+from . import metrics
 from .db import StoreDB
+from .services.analytics import Analytics, day_range
+from .services.cart import CartStore
+from .services.guilds import GuildConfig, GuildSettings
+from .services.maintenance import OrderMaintenance
+from .services.orders import ORDER_TRANSITIONS
+from .services.outbox import Outbox
+from .services.payments import PaymentGateway
+from .services.tasks import TaskPipeline
 from .models import Product
-from .ui.views import ProdutoView, CartChannelManager
+from .ui.embeds import product_embed
+from .catalog import fold
+from .formatting import brl
+from .ui.views import CartChannelManager, LojaView, PedidosView, Vitrine, VitrineButton, produto_view
+
+
+class StoreTree(app_commands.CommandTree):
+    # marca o início de cada slash command; on_app_command_completion/on_error fecham a medição
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        interaction.extras["started"] = time.perf_counter()
+        return True
+
+    async def on_error(self, interaction: discord.Interaction, error: app_commands.AppCommandError):
+        _observe_command(interaction, "error")
+        await super().on_error(interaction, error)
+
+
+def _observe_command(interaction: discord.Interaction, result: str):
+    started = interaction.extras.get("started")
+    if started is not None and interaction.command is not None:
+        metrics.INTERACTION_SECONDS.observe(time.perf_counter() - started, kind="command", name=interaction.command.qualified_name, result=result)
+
+
+# SHARD_COUNT > 0: AutoShardedBot, com os shards deste processo em SHARD_IDS
+_BotBase = commands.AutoShardedBot if SHARD_COUNT else commands.Bot
+# o worker 0 (ou o processo único) sincroniza os comandos e roda a manutenção de pedidos
+PRIMARY_WORKER = WORKER_INDEX == 0
+
+
+class StoreBot(_BotBase):
+    # o StoreDB é criado uma única vez em main() e injetado via attach()
+    db: StoreDB
+    guild_settings: GuildSettings
+    analytics: Analytics
+    carts: CartStore
+    payments: PaymentGateway
+    tasks: TaskPipeline
+    cart_channel_mgr: CartChannelManager
+    outbox: Outbox
+    vitrine: Vitrine
+    maintenance: OrderMaintenance
+
+    def attach(self, db: StoreDB):
+        self.db = db
+        self._background: List[asyncio.Task] = []
+        self.guild_settings = GuildSettings(
+            db, GuildConfig(cart_category_id=CART_CATEGORY_ID, order_log_channel_id=ORDER_LOG_CHANNEL_ID),
+            ttl=GUILD_SETTINGS_TTL_SECONDS, default_guild_id=int(DISCORD_GUILD_ID) if DISCORD_GUILD_ID else None,
+        )
+        self.analytics = Analytics(db, flush_interval=ANALYTICS_FLUSH_SECONDS)
+        self.carts = CartStore(db, max_entries=CART_CACHE_SIZE, ttl=CART_TTL_SECONDS, flush_interval=CART_FLUSH_SECONDS)
+        self.payments = PaymentGateway()
+        self.tasks = TaskPipeline(workers=TASK_WORKERS, max_queue=TASK_QUEUE_SIZE, retries=TASK_RETRIES)
+        self.cart_channel_mgr = CartChannelManager(db, self.guild_settings)
+        # o limite global do Discord é por token: dividido entre os workers
+        self.outbox = Outbox(self, self.cart_channel_mgr, window=OUTBOX_WINDOW_SECONDS,
+                             global_budget=(40.0 / BOT_WORKERS, max(1, 50 // BOT_WORKERS)))
+        self.vitrine = Vitrine(db, self.cart_channel_mgr, self.carts, self.payments, self.tasks, self.outbox, self.guild_settings, self.analytics)
+        self.maintenance = OrderMaintenance(
+            db, self.payments,
+            pending_ttl=timedelta(hours=ORDER_PENDING_TTL_HOURS),
+            reconcile_after=timedelta(minutes=RECONCILE_AFTER_MINUTES),
+            archive_after=timedelta(days=ORDER_ARCHIVE_DAYS) if ORDER_ARCHIVE_DAYS else None,
+            concurrency=RECONCILE_CONCURRENCY,
+            interval=MAINTENANCE_INTERVAL_SECONDS,
+        )
+
+    def spawn(self, coro) -> asyncio.Task:
+        # jobs em background do bot, cancelados no close() antes das filas esvaziarem
+        task = self.loop.create_task(coro)
+        self._background.append(task)
+        return task
+
+    async def close(self):
+        if self.is_closed():
+            return
+        # termina o trabalho em background e grava o estado em memória antes de desconectar
+        for t in self._background:
+            t.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        self._background = []
+        await self.tasks.close(SHUTDOWN_TIMEOUT_SECONDS)
+        await self.outbox.close(SHUTDOWN_TIMEOUT_SECONDS)
+        try:
+            await self.carts.flush()
+        except Exception as e:
+            print("Cart flush error:", e)
+        await self.analytics.flush()
+        await self.payments.close()
+        await super().close()
+
 
 intents = discord.Intents.default()
 intents.message_content = False
-bot = commands.Bot(command_prefix="!", intents=intents)
+_shard_options = {"shard_count": SHARD_COUNT, "shard_ids": SHARD_IDS} if SHARD_COUNT else {}
+bot = StoreBot(command_prefix="!", intents=intents, tree_cls=StoreTree, **_shard_options)
 
-db = StoreDB(DB_PATH)
 
-# cria produto inicial se banco estiver vazio
-if not db.list_products():
-    db.upsert_product(Product(
-        sku="8BALL_GUIDE_PRO",
-        name="8 Ball Pool – Guia Pro (PDF)",
-        price=29.90,
-        description="Guia avançado de estratégias: mira, break, rotação e posicionamento.",
-        category="jogos"
-    ), delivery_url=DELIVERY_URL_8BALL_GUIDE)
+@bot.event
+async def setup_hook():
+    # catálogo e produto inicial já foram preparados por main.startup()
+    await bot.cart_channel_mgr.load()
+    bot.spawn(bot.carts.run_flusher())
+    bot.spawn(bot.analytics.run_flusher())
+    if CART_CHANNEL_IDLE_HOURS:
+        bot.spawn(bot.cart_channel_mgr.run_reaper(bot, CART_CHANNEL_IDLE_HOURS * 3600))
+    # expira/reconcilia/arquiva pedidos; as transições entram na fila de webhooks.
+    # Os jobs varrem o banco inteiro, então só um worker roda
+    if PRIMARY_WORKER:
+        bot.spawn(bot.maintenance.run())
+        bot.spawn(_backfill_analytics())
+    bot.tasks.start()
+    # um único handler persistente para todos os botões de vitrine já postados
+    bot.add_dynamic_items(VitrineButton)
 
-cart_channel_mgr = CartChannelManager(db, CART_CATEGORY_ID)
+
+async def _backfill_analytics():
+    # pedidos de antes dos agregados; em lotes, retomando do cursor após restart
+    try:
+        n = await bot.analytics.backfill()
+        if n:
+            print(f"Relatórios: {n} pedidos antigos somados aos agregados")
+    except Exception as e:
+        metrics.record_error("analytics", "Relatórios: backfill falhou:", e)
 
 
 @bot.event
 async def on_ready():
+    # comandos são por aplicação, não por shard: basta um worker sincronizar
+    if PRIMARY_WORKER:
+        try:
+            if DISCORD_GUILD_ID:
+                await bot.tree.sync(guild=discord.Object(id=int(DISCORD_GUILD_ID)))
+            else:
+                await bot.tree.sync()
+        except Exception as e:
+            metrics.record_error("sync", "Sync error:", e)
     try:
-        if DISCORD_GUILD_ID:
-            await bot.tree.sync(guild=discord.Object(id=int(DISCORD_GUILD_ID)))
-        else:
-            await bot.tree.sync()
+        await bot.cart_channel_mgr.reconcile(bot.guilds)
     except Exception as e:
-        print("Sync error:", e)
+        metrics.record_error("reconcile", "Cart channel reconcile error:", e)
     print(f"✅ Logado como {bot.user} (ID: {bot.user.id})")
 
 
+@bot.event
+async def on_app_command_completion(interaction: discord.Interaction, command):
+    _observe_command(interaction, "ok")
+
+
+@bot.event
+async def on_guild_channel_delete(channel: discord.abc.GuildChannel):
+    await bot.cart_channel_mgr.forget_channel(channel.id)
+
+
 # ----------------------------
 # 📣 COMANDO ANTIGO (se quiser manter por compatibilidade)
 # ----------------------------
 @bot.command(name="postar_produto")
 @commands.has_permissions(administrator=True)
 async def postar_produto(ctx: commands.Context, sku: str):
-    row = db.get_product_row(sku)
-    if not row:
+    entry = await bot.db.get_catalog_entry(sku)
+    if not entry:
         await ctx.send("SKU não encontrado.")
         return
-    embed = discord.Embed(title=row["name"], description=row["description"] or "")
-    embed.add_field(name="Preço", value=f"R$ {row['price']:.2f}".replace('.', ','))
-    if sku == "8BALL_GUIDE_PRO" and PRODUCT_IMAGE_8BALL_GUIDE:
-        embed.set_thumbnail(url=PRODUCT_IMAGE_8BALL_GUIDE)
-    view = ProdutoView(db, sku, cart_channel_mgr)
-    await ctx.send(embed=embed, view=view)
+    embed = product_embed(entry)
+    msg = await ctx.send(embed=embed, view=produto_view(sku))
+    await bot.db.add_showcase_message(msg.id, msg.channel.id, ctx.guild.id if ctx.guild else None, sku)
+
+
+# ----------------------------
+# 🛍️ SLASH COMMANDS (CLIENTE)
+# ----------------------------
+
+# autocomplete tem ~3s para responder: tudo sai do catálogo em memória
+async def sku_autocomplete(interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+    products = await bot.db.autocomplete_products(current, 25)
+    return [app_commands.Choice(name=f"{p.name} ({p.sku})"[:100], value=p.sku) for p in products]
+
+
+async def categoria_autocomplete(interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
+    typed = fold(current)
+    categories = [c for c in await bot.db.list_categories() if fold(c).startswith(typed)]
+    return [app_commands.Choice(name=c[:100], value=c[:100]) for c in categories[:25]]
+
+
+@bot.tree.command(name="loja", description="Navegar pelos produtos da loja")
+@app_commands.describe(categoria="Filtrar por categoria", busca="Buscar por nome ou descrição")
+@app_commands.autocomplete(categoria=categoria_autocomplete)
+async def loja(interaction: discord.Interaction, categoria: str | None = None, busca: str | None = None):
+    view = LojaView(bot.db, categoria, busca)
+    text = await view.load()
+    if not view.products:
+        await interaction.response.send_message("Nenhum produto encontrado.", ephemeral=True)
+        return
+    await interaction.response.send_message(text, view=view, ephemeral=True)
 
 
 # ----------------------------
@@ -75,6 +242,7 @@ def admin_only():
     descricao="Descrição (opcional)",
     delivery_url="Link de entrega/download (opcional)"
 )
+@app_commands.autocomplete(sku=sku_autocomplete, categoria=categoria_autocomplete)
 async def admin_add_produto(
     interaction: discord.Interaction,
     sku: str,
@@ -84,54 +252,181 @@ async def admin_add_produto(
     descricao: str | None = None,
     delivery_url: str | None = None
 ):
+    if not VitrineButton.accepts(sku):
+        await interaction.response.send_message("SKU inválido: use até 86 caracteres, sem ':'.", ephemeral=True)
+        return
     p = Product(sku=sku, name=nome, price=preco, description=descricao or "", category=categoria)
-    db.upsert_product(p, delivery_url=delivery_url)
+    await bot.db.upsert_product(p, delivery_url=delivery_url)
     await interaction.response.send_message(f"✅ Produto salvo: **{p.name}** `{p.sku}` — R$ {preco:.2f}", ephemeral=True)
 
 
 @bot.tree.command(name="admin_set_delivery", description="(Admin) Definir/alterar delivery_url de um SKU")
 @admin_only()
+@app_commands.autocomplete(sku=sku_autocomplete)
 async def admin_set_delivery(interaction: discord.Interaction, sku: str, delivery_url: str):
-    row = db.get_product_row(sku)
-    if not row:
+    if not await bot.db.get_catalog_entry(sku):
         await interaction.response.send_message("SKU não encontrado.", ephemeral=True)
         return
-    db.set_delivery_url(sku, delivery_url)
+    await bot.db.set_delivery_url(sku, delivery_url)
     await interaction.response.send_message("✅ delivery_url atualizado.", ephemeral=True)
 
 
 @bot.tree.command(name="admin_listar_pedidos", description="(Admin) Lista últimos pedidos")
 @admin_only()
-async def admin_listar_pedidos(interaction: discord.Interaction, limite: int = 10):
-    cur = db.conn.cursor()
-    rows = cur.execute(
-        "SELECT id, user_id, total, status, created_at FROM orders ORDER BY id DESC LIMIT ?",
-        (limite,)
-    ).fetchall()
-    if not rows:
+@app_commands.describe(
+    limite="Pedidos por página (máx. 25)",
+    status="Filtrar por status",
+    usuario="Filtrar por cliente",
+    dias="Só pedidos dos últimos N dias"
+)
+@app_commands.choices(status=[app_commands.Choice(name=s, value=s) for s in ORDER_TRANSITIONS])
+async def admin_listar_pedidos(
+    interaction: discord.Interaction,
+    limite: app_commands.Range[int, 1, 25] = 10,
+    status: str | None = None,
+    usuario: discord.User | None = None,
+    dias: app_commands.Range[int, 1, 3650] | None = None
+):
+    filters = {
+        "guild_id": interaction.guild_id,
+        "status": status,
+        "user_id": usuario.id if usuario else None,
+        "since": datetime.utcnow() - timedelta(days=dias) if dias else None,
+    }
+    view = PedidosView(bot.db, filters, limite)
+    text = await view.load()
+    if not text:
         await interaction.response.send_message("Sem pedidos ainda.", ephemeral=True)
         return
-    lines = [f"#{r['id']} • user:{r['user_id']} • {r['status']} • R$ {r['total']:.2f}" for r in rows]
-    await interaction.response.send_message("\n".join(lines), ephemeral=True)
+    await interaction.response.send_message(text, view=view, ephemeral=True)
+
+
+@bot.tree.command(name="admin_reentregar", description="(Admin) Reenviar os links de download de um pedido pago")
+@admin_only()
+async def admin_reentregar(interaction: discord.Interaction, pedido: int):
+    if not await bot.db.retry_delivery(pedido, guild_id=interaction.guild_id):
+        await interaction.response.send_message("Pedido não encontrado ou não está pago.", ephemeral=True)
+        return
+    await interaction.response.send_message(f"✅ Pedido #{pedido} voltou para a fila de entrega.", ephemeral=True)
+
+
+@bot.tree.command(name="admin_relatorio", description="(Admin) Vendas, conversão e mais vendidos desta guild")
+@admin_only()
+@app_commands.describe(dias="Período em dias, incluindo hoje")
+async def admin_relatorio(interaction: discord.Interaction, dias: app_commands.Range[int, 1, 365] = 30):
+    start, end = day_range(dias)
+    report = await bot.analytics.report(interaction.guild_id, start, end, top=5)
+    conversion = report["conversion"]
+    embed = discord.Embed(title=f"📊 Vendas dos últimos {dias} dias", color=discord.Color.blurple())
+    embed.add_field(name="Receita", value=brl(report["revenue"]))
+    embed.add_field(name="Pedidos pagos", value=str(report["paid_orders"]))
+    embed.add_field(name="Ticket médio", value=brl(report["average_ticket"]))
+    embed.add_field(
+        name="Conversão",
+        value=f"Carrinho → pago: {_percent(conversion['cart_to_paid'])}\nPedido → pago: {_percent(conversion['order_to_paid'])}",
+        inline=False,
+    )
+    top = [f"`{r['sku']}` — {r['units']} un. · {brl(r['revenue'])}" for r in report["top_skus"]]
+    embed.add_field(name="Mais vendidos", value="\n".join(top) or "Sem vendas no período.", inline=False)
+    embed.set_footer(text=f"Desde {start} (UTC)")
+    await interaction.response.send_message(embed=embed, ephemeral=True)
+
+
+def _percent(value: float | None) -> str:
+    return f"{value:.1%}" if value is not None else "—"
+
+
+def _mention(channel_id: int | None, guild: discord.Guild | None) -> str:
+    channel = guild.get_channel(channel_id) if guild and channel_id else None
+    return channel.mention if channel else "não definido"
+
+
+@bot.tree.command(name="admin_config", description="(Admin) Categoria dos carrinhos e canal de log desta guild")
+@admin_only()
+@app_commands.describe(
+    categoria_carrinho="Categoria onde os canais de carrinho são criados",
+    canal_log="Canal que recebe o log de pedidos"
+)
+async def admin_config(
+    interaction: discord.Interaction,
+    categoria_carrinho: discord.CategoryChannel | None = None,
+    canal_log: discord.TextChannel | None = None
+):
+    if categoria_carrinho or canal_log:
+        config = await bot.guild_settings.update(
+            interaction.guild_id,
+            cart_category_id=categoria_carrinho.id if categoria_carrinho else None,
+            order_log_channel_id=canal_log.id if canal_log else None,
+        )
+    else:
+        config = await bot.guild_settings.get(interaction.guild_id)
+    await interaction.response.send_message(
+        f"Categoria dos carrinhos: {_mention(config.cart_category_id, interaction.guild)}\n"
+        f"Canal de log: {_mention(config.order_log_channel_id, interaction.guild)}",
+        ephemeral=True,
+    )
 
 
 @bot.tree.command(name="admin_postar_produto", description="(Admin) Postar um produto na vitrine (canal atual)")
 @admin_only()
+@app_commands.autocomplete(sku=sku_autocomplete)
 async def admin_postar_produto(interaction: discord.Interaction, sku: str):
-    row = db.get_product_row(sku)
-    if not row:
+    entry = await bot.db.get_catalog_entry(sku)
+    if not entry:
         await interaction.response.send_message("SKU não encontrado.", ephemeral=True)
         return
-    embed = discord.Embed(title=row["name"], description=row["description"] or "")
-    embed.add_field(name="Preço", value=f"R$ {row['price']:.2f}".replace('.', ','))
-    if sku == "8BALL_GUIDE_PRO" and PRODUCT_IMAGE_8BALL_GUIDE:
-        embed.set_thumbnail(url=PRODUCT_IMAGE_8BALL_GUIDE)
-    view = ProdutoView(db, sku, cart_channel_mgr)
+    embed = product_embed(entry)
     await interaction.response.send_message("✅ Produto postado!", ephemeral=True)
-    await interaction.channel.send(embed=embed, view=view)
+    msg = await interaction.channel.send(embed=embed, view=produto_view(sku))
+    await bot.db.add_showcase_message(msg.id, msg.channel.id, interaction.guild_id, sku)
+
+
+@bot.tree.command(name="admin_atualizar_vitrine", description="(Admin) Atualiza preço/descrição de todas as vitrines postadas")
+@admin_only()
+@app_commands.describe(sku="Só as vitrines deste SKU (opcional)")
+@app_commands.autocomplete(sku=sku_autocomplete)
+async def admin_atualizar_vitrine(interaction: discord.Interaction, sku: str | None = None):
+    await interaction.response.defer(ephemeral=True, thinking=True)
+    rows = await bot.db.list_showcase_messages(sku, guild_id=interaction.guild_id)
+    updated, gone = 0, []
+    channels = {}
+    for r in rows:
+        entry = await bot.db.get_catalog_entry(r["sku"])
+        if entry is None:
+            gone.append(int(r["message_id"]))
+            continue
+        channel_id = int(r["channel_id"])
+        if channel_id not in channels:
+            # fora do cache não quer dizer apagado (threads, guilds de outro shard)
+            try:
+                channels[channel_id] = bot.get_channel(channel_id) or await bot.fetch_channel(channel_id)
+            except discord.NotFound:
+                channels[channel_id] = None
+            except discord.HTTPException as e:
+                # sem permissão ou falha temporária: mantém no registro
+                print("Vitrine: canal indisponível", channel_id, e)
+                channels[channel_id] = False
+        channel = channels[channel_id]
+        if channel is None:
+            gone.append(int(r["message_id"]))
+            continue
+        if channel is False:
+            continue
+        try:
+            await channel.get_partial_message(int(r["message_id"])).edit(embed=product_embed(entry), view=produto_view(r["sku"]))
+            updated += 1
+        except discord.NotFound:
+            gone.append(int(r["message_id"]))
+        except discord.HTTPException as e:
+            print("Vitrine: falha ao atualizar mensagem", r["message_id"], e)
+    # mensagens apagadas ou de produtos removidos saem do registro
+    await bot.db.delete_showcase_messages(gone)
+    await interaction.followup.send(f"✅ {updated} vitrine(s) atualizada(s), {len(gone)} removida(s) do registro.", ephemeral=True)
 
 
-def run_bot():
+async def run_bot():
+    # roda no mesmo event loop do servidor web; main() já chamou bot.attach(db)
     if not DISCORD_BOT_TOKEN:
         raise RuntimeError("Defina DISCORD_BOT_TOKEN no .env")
-    bot.run(DISCORD_BOT_TOKEN)
\ No newline at end of file
+    async with bot:
+        await bot.start(DISCORD_BOT_TOKEN)
\ No newline at end of file
@@ -0,0 +1,129 @@
+import bisect
+import time
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from .formatting import brl
+from .models import Product
+
+
+@dataclass(frozen=True)
+class CatalogEntry:
+    product: Product
+    delivery_url: Optional[str]
+    price_text: str
+    # versão do catálogo em que a entrada foi gravada; usada como chave dos embeds pré-montados
+    version: int
+
+
+def fold(text: str) -> str:
+    # minúsculas e sem acento: "Ação" e "acao" caem no mesmo termo
+    decomposed = unicodedata.normalize("NFKD", text or "")
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch)).lower()
+
+
+def entry_from_row(r, version: int) -> CatalogEntry:
+    p = Product(sku=r["sku"], name=r["name"], price=r["price"], description=r["description"], category=r["category"])
+    return CatalogEntry(product=p, delivery_url=r["delivery_url"], price_text=brl(p.price), version=version)
+
+
+class Catalog:
+    """Cópia em memória da tabela products.
+
+    `version` espelha o contador `catalog_version` da tabela meta. Escritas deste
+    processo atualizam a cópia na hora (write-through); escritas de outros
+    processos são detectadas comparando o contador, no máximo a cada
+    `refresh_seconds`.
+
+    Junto com a cópia ficam os índices derivados, refeitos a cada mudança
+    (escrita de catálogo é rara, leitura é a cada clique/tecla): produtos por
+    categoria em ordem de nome e um índice de prefixos ordenado (SKU, nome e
+    cada palavra do nome) para o autocomplete responder sem ir ao banco.
+    """
+
+    def __init__(self, refresh_seconds: float = 5.0):
+        self.refresh_seconds = refresh_seconds
+        self.version = -1
+        self.checked_at = 0.0
+        self._entries: Dict[str, CatalogEntry] = {}
+        self._sorted: List[Product] = []
+        self._by_category: Dict[str, List[Product]] = {}
+        # (termo normalizado, sku), ordenado para busca por prefixo com bisect
+        self._prefixes: List[Tuple[str, str]] = []
+        self._folded: Dict[str, str] = {}
+
+    @property
+    def loaded(self) -> bool:
+        return self.version >= 0
+
+    def is_fresh(self) -> bool:
+        return self.loaded and time.monotonic() - self.checked_at < self.refresh_seconds
+
+    def load(self, rows: Iterable, version: int):
+        self._rebuild({r["sku"]: entry_from_row(r, version) for r in rows})
+        self.version = version
+        self.checked_at = time.monotonic()
+
+    def _rebuild(self, entries: Dict[str, CatalogEntry]):
+        folded = {sku: fold(e.product.name) for sku, e in entries.items()}
+        ordered = sorted((e.product for e in entries.values()), key=lambda p: folded[p.sku])
+        by_category: Dict[str, List[Product]] = {}
+        prefixes = []
+        for p in ordered:
+            by_category.setdefault(p.category or "geral", []).append(p)
+            name = folded[p.sku]
+            terms = {fold(p.sku), name, *name.split()}
+            prefixes += [(t, p.sku) for t in terms if t]
+        prefixes.sort()
+        # troca tudo de uma vez: leitores concorrentes veem a versão velha ou a nova
+        self._entries, self._sorted, self._by_category, self._prefixes, self._folded = entries, ordered, by_category, prefixes, folded
+
+    def apply(self, row, version: int) -> bool:
+        # só aplica se for a próxima versão; do contrário outro processo escreveu
+        # no meio e a cópia precisa ser recarregada por inteiro
+        if version != self.version + 1:
+            self.version = -1
+            return False
+        entries = dict(self._entries)
+        entries[row["sku"]] = entry_from_row(row, version)
+        self._rebuild(entries)
+        self.version = version
+        return True
+
+    def get(self, sku: str) -> Optional[CatalogEntry]:
+        return self._entries.get(sku)
+
+    def products(self, category: Optional[str] = None) -> List[Product]:
+        if category is None:
+            return list(self._sorted)
+        return list(self._by_category.get(category, ()))
+
+    def categories(self) -> List[str]:
+        return sorted(self._by_category, key=fold)
+
+    def prefix_search(self, text: str, limit: int = 25) -> List[Product]:
+        """Produtos cujo SKU, nome ou alguma palavra do nome começa com `text`.
+
+        Com várias palavras, todas precisam ser prefixo de alguma palavra do
+        nome. Nomes que começam com o texto vêm primeiro.
+        """
+        words = fold(text).split()
+        if not words:
+            return self._sorted[:limit]
+        query = " ".join(words)
+        keys, folded = self._prefixes, self._folded
+        found: Dict[str, Product] = {}
+        # o termo mais longo é o mais seletivo
+        probe = max(words, key=len) if len(words) > 1 else query
+        i = bisect.bisect_left(keys, (probe,))
+        while i < len(keys) and keys[i][0].startswith(probe) and len(found) < limit * 4:
+            sku = keys[i][1]
+            entry = self._entries.get(sku)
+            if entry is not None and sku not in found:
+                name_words = folded[sku].split()
+                if len(words) == 1 or all(any(w.startswith(q) for w in name_words) for q in words):
+                    found[sku] = entry.product
+            i += 1
+        ranked = sorted(found.values(), key=lambda p: (not folded[p.sku].startswith(query), folded[p.sku]))
+        return ranked[:limit]
\ No newline at end of file
@@ -11,14 +11,96 @@ DB_PATH = os.getenv("DB_PATH", "store.db")
 CURRENCY = "BRL"
 
 
-# Categoria e canal de logs
+def _shard_ids(value: str):
+    # "0-3", "0,2,5" ou vazio (todos os shards)
+    ids = []
+    for part in filter(None, (p.strip() for p in value.split(","))):
+        lo, _, hi = part.partition("-")
+        ids.extend(range(int(lo), int(hi or lo) + 1))
+    return ids or None
+
+
+# Processos e shards. BOT_WORKERS > 1 faz o main.py subir um servidor web e N
+# workers do bot; SHARD_COUNT > 0 liga o AutoShardedBot. PROCESS_ROLE,
+# WORKER_INDEX e SHARD_IDS normalmente são definidos pelo próprio launcher.
+BOT_WORKERS = int(os.getenv("BOT_WORKERS", "1"))
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0"))
+SHARD_IDS = _shard_ids(os.getenv("SHARD_IDS", ""))
+PROCESS_ROLE = os.getenv("PROCESS_ROLE", "")
+WORKER_INDEX = int(os.getenv("WORKER_INDEX", "0"))
+HTTP_PORT = int(os.getenv("HTTP_PORT", "8000"))
+# cada worker serve /metrics e /stats em 127.0.0.1:(WORKER_HTTP_PORT + índice)
+WORKER_HTTP_PORT = int(os.getenv("WORKER_HTTP_PORT", "9100"))
+# tempo máximo de cada etapa do encerramento (webhooks/entregas, depois filas do bot)
+SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("SHUTDOWN_TIMEOUT_SECONDS", "10"))
+
+
+# Banco de dados
+DB_READERS = int(os.getenv("DB_READERS", "4"))
+DB_WRITE_BATCH = int(os.getenv("DB_WRITE_BATCH", "64"))
+# intervalo máximo para perceber mudanças de catálogo feitas por outro processo
+CATALOG_REFRESH_SECONDS = float(os.getenv("CATALOG_REFRESH_SECONDS", "5"))
+
+
+# Carrinhos (cache write-behind)
+CART_CACHE_SIZE = int(os.getenv("CART_CACHE_SIZE", "10000"))
+CART_TTL_SECONDS = float(os.getenv("CART_TTL_SECONDS", "900"))
+CART_FLUSH_SECONDS = float(os.getenv("CART_FLUSH_SECONDS", "2"))
+
+
+# Trabalho em background das interações (checkout, mensagens de carrinho)
+TASK_WORKERS = int(os.getenv("TASK_WORKERS", "8"))
+TASK_QUEUE_SIZE = int(os.getenv("TASK_QUEUE_SIZE", "2000"))
+TASK_RETRIES = int(os.getenv("TASK_RETRIES", "3"))
+
+
+# Categoria e canal de logs: padrão para guilds sem /admin_config (instalação de uma guild só)
+GUILD_SETTINGS_TTL_SECONDS = float(os.getenv("GUILD_SETTINGS_TTL_SECONDS", "60"))
 CART_CATEGORY_ID = int(os.getenv("CART_CATEGORY_ID", "0")) or None
 ORDER_LOG_CHANNEL_ID = int(os.getenv("ORDER_LOG_CHANNEL_ID", "0")) or None
+# canais de carrinho sem uso há mais que isso são apagados (0 desativa)
+CART_CHANNEL_IDLE_HOURS = float(os.getenv("CART_CHANNEL_IDLE_HOURS", "72"))
+# janela para juntar atualizações de carrinho/log no mesmo canal antes de enviar
+OUTBOX_WINDOW_SECONDS = float(os.getenv("OUTBOX_WINDOW_SECONDS", "0.5"))
+
+# Manutenção de pedidos (expiração, reconciliação com o PSP, arquivamento)
+ORDER_PENDING_TTL_HOURS = float(os.getenv("ORDER_PENDING_TTL_HOURS", "48"))
+RECONCILE_AFTER_MINUTES = float(os.getenv("RECONCILE_AFTER_MINUTES", "15"))
+RECONCILE_CONCURRENCY = int(os.getenv("RECONCILE_CONCURRENCY", "4"))
+# pedidos encerrados há mais que isso vão para orders_history (0 desativa)
+ORDER_ARCHIVE_DAYS = float(os.getenv("ORDER_ARCHIVE_DAYS", "90"))
+MAINTENANCE_INTERVAL_SECONDS = float(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "300"))
 
 
 # Mercado Pago
 MP_ACCESS_TOKEN = os.getenv("MP_ACCESS_TOKEN")
 WEBHOOK_VERIFY_TOKEN = os.getenv("WEBHOOK_VERIFY_TOKEN", "changeme")
+WEBHOOK_WORKERS = int(os.getenv("WEBHOOK_WORKERS", "2"))
+
+# Pagamentos: PAYMENT_BACKEND vazio usa Mercado Pago se houver token; "fake" usa o PSP local
+PAYMENT_BACKEND = os.getenv("PAYMENT_BACKEND", "").lower()
+PAYMENT_TIMEOUT_SECONDS = float(os.getenv("PAYMENT_TIMEOUT_SECONDS", "10"))
+PAYMENT_MAX_CONCURRENCY = int(os.getenv("PAYMENT_MAX_CONCURRENCY", "8"))
+FAKE_PSP_LATENCY_MS = float(os.getenv("FAKE_PSP_LATENCY_MS", "50"))
+
+
+# Entrega automática: links de download assinados (HMAC) servidos pelo webapp
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "http://localhost:8000").rstrip("/")
+DELIVERY_SECRET = os.getenv("DELIVERY_SECRET", "")
+DELIVERY_LINK_TTL_HOURS = float(os.getenv("DELIVERY_LINK_TTL_HOURS", "72"))
+DELIVERY_WORKERS = int(os.getenv("DELIVERY_WORKERS", "16"))
+DELIVERY_RETRIES = int(os.getenv("DELIVERY_RETRIES", "3"))
+
+# Relatórios de vendas: /analytics/* no webapp só respondem com ANALYTICS_TOKEN definido
+ANALYTICS_TOKEN = os.getenv("ANALYTICS_TOKEN", "")
+ANALYTICS_FLUSH_SECONDS = float(os.getenv("ANALYTICS_FLUSH_SECONDS", "30"))
+# /metrics, /stats/* e /debug/traces no endereço público só com METRICS_TOKEN
+# (header x-token ou Authorization: Bearer); os workers em 127.0.0.1 não pedem
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", "")
+
+# Observabilidade: spans recentes ficam em memória e saem em /debug/traces
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "0") == "1"
+TRACE_BUFFER_SIZE = int(os.getenv("TRACE_BUFFER_SIZE", "2000"))
 
 
 # Produtos default
@@ -1,116 +1,854 @@
+import asyncio
 import json
+import queue
 import sqlite3
-from datetime import datetime
-from typing import Optional, Dict, List
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Any, Callable, Iterable, Optional, Dict, List, Tuple
 
+from . import metrics
+from .catalog import Catalog, CatalogEntry
+from .migrations import migrate
 from .models import Product
 
+# maior página aceita por query_orders
+ORDER_PAGE_MAX = 50
+
+# limite de parâmetros por consulta IN (SQLITE_MAX_VARIABLE_NUMBER antigo é 999)
+_IN_CHUNK = 500
+
+# status que entram no funil de vendas (funnel_daily), além de "carrinho" e "pedido"
+FUNNEL_STATUSES = ("pago", "expirado", "pagamento_recusado")
+
+DB_QUERY_SECONDS = metrics.histogram("storedb_query_seconds", "Duração das operações do StoreDB (inclui espera na fila/pool)", ("op", "kind"))
+DB_LOCK_WAIT_SECONDS = metrics.histogram("storedb_lock_wait_seconds", "Espera pelo BEGIN IMMEDIATE a cada commit do writer")
+DB_QUEUE_WAIT_SECONDS = metrics.histogram("storedb_write_queue_wait_seconds", "Tempo de uma escrita na fila do writer até o início do lote")
+DB_BATCH_SIZE = metrics.histogram("storedb_write_batch_size", "Escritas por commit (group commit)", buckets=(1, 2, 4, 8, 16, 32, 64, 128))
+DB_WRITE_ERRORS = metrics.counter("storedb_write_errors_total", "Jobs de escrita que falharam")
+DB_WRITE_QUEUE_DEPTH = metrics.gauge("storedb_write_queue_depth", "Escritas aguardando o writer")
+
+
+def _connect(path: str) -> sqlite3.Connection:
+    # isolation_level=None: transações são abertas explicitamente pelo writer
+    conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA busy_timeout=5000")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    return conn
+
+
+def _row_to_product(r) -> Product:
+    return Product(sku=r["sku"], name=r["name"], price=r["price"], description=r["description"], category=r["category"])
+
+
+class _Writer(threading.Thread):
+    """Thread dona da única conexão de escrita.
+
+    Faz group commit: drena até `max_batch` jobs da fila e aplica todos numa só
+    transação (um fsync por lote). Cada job roda num SAVEPOINT próprio, então a
+    falha de um não desfaz os outros.
+    """
+
+    def __init__(self, path: str, max_batch: int = 64):
+        super().__init__(name="storedb-writer", daemon=True)
+        self.conn = _connect(path)
+        self.jobs: "queue.Queue" = queue.Queue()
+        self.max_batch = max_batch
+        self.stats = {
+            "writes": 0,
+            "commits": 0,
+            "queue_wait_total": 0.0,
+            "queue_wait_max": 0.0,
+            "lock_wait_total": 0.0,
+            "lock_wait_max": 0.0,
+        }
+
+    def _drain(self, first) -> list:
+        batch = [first]
+        while len(batch) < self.max_batch:
+            try:
+                job = self.jobs.get_nowait()
+            except queue.Empty:
+                break
+            if job is None:
+                self.jobs.put(None)
+                break
+            batch.append(job)
+        return batch
+
+    def run(self):
+        while True:
+            job = self.jobs.get()
+            if job is None:
+                break
+            batch = [(fn, fut, queued_at) for fn, fut, queued_at in self._drain(job) if fut.set_running_or_notify_cancel()]
+            if batch:
+                self._commit(batch)
+        self.conn.close()
+
+    def _commit(self, batch: list):
+        started = time.monotonic()
+        results = []
+        try:
+            self.conn.execute("BEGIN IMMEDIATE")
+            lock_wait = time.monotonic() - started
+            for fn, fut, queued_at in batch:
+                self.conn.execute("SAVEPOINT job")
+                try:
+                    results.append((fut, fn(self.conn), None))
+                    self.conn.execute("RELEASE job")
+                except Exception as e:
+                    self.conn.execute("ROLLBACK TO job")
+                    self.conn.execute("RELEASE job")
+                    results.append((fut, None, e))
+            self.conn.execute("COMMIT")
+        except BaseException as e:
+            if self.conn.in_transaction:
+                self.conn.execute("ROLLBACK")
+            for fn, fut, queued_at in batch:
+                fut.set_exception(e)
+            return
+
+        st = self.stats
+        st["writes"] += len(batch)
+        st["commits"] += 1
+        st["lock_wait_total"] += lock_wait
+        st["lock_wait_max"] = max(st["lock_wait_max"], lock_wait)
+        DB_LOCK_WAIT_SECONDS.observe(lock_wait)
+        DB_BATCH_SIZE.observe(len(batch))
+        for fn, fut, queued_at in batch:
+            wait = started - queued_at
+            st["queue_wait_total"] += wait
+            st["queue_wait_max"] = max(st["queue_wait_max"], wait)
+            DB_QUEUE_WAIT_SECONDS.observe(wait)
+        for fut, result, error in results:
+            if error is not None:
+                DB_WRITE_ERRORS.inc()
+                fut.set_exception(error)
+            else:
+                fut.set_result(result)
+
+
 class StoreDB:
-    def __init__(self, path: str):
-        self.conn = sqlite3.connect(path)
-        self.conn.row_factory = sqlite3.Row
-        self._setup()
+    """Camada de dados assíncrona.
 
-    def _setup(self):
-        c = self.conn.cursor()
-        c.execute(
-            """
-            CREATE TABLE IF NOT EXISTS products (
-                sku TEXT PRIMARY KEY,
-                name TEXT NOT NULL,
-                price REAL NOT NULL,
-                description TEXT,
-                category TEXT,
-                delivery_url TEXT
+    Escritas vão para uma fila atendida por uma thread dedicada (um único writer,
+    sem disputa de lock entre conexões); leituras rodam num pool de conexões
+    somente-leitura. Com WAL, leitores não bloqueiam o writer e vice-versa.
+    Todos os métodos públicos são awaitables e nunca bloqueiam o event loop.
+
+    Uma única instância deve ser compartilhada pelo processo inteiro (bot e
+    webhook), para que todas as escritas passem pelo mesmo writer.
+    """
+
+    def __init__(self, path: str, readers: int = 4, write_batch: int = 64, catalog_refresh: float = 5.0):
+        self.path = path
+        self.catalog = Catalog(refresh_seconds=catalog_refresh)
+        self._writer = _Writer(path, max_batch=write_batch)
+        self._setup(self._writer.conn)
+        self._writer.start()
+        self._local = threading.local()
+        self._reader_conns: List[sqlite3.Connection] = []
+        self._readers = ThreadPoolExecutor(max_workers=readers, thread_name_prefix="storedb-reader")
+        metrics.REGISTRY.on_collect(lambda: DB_WRITE_QUEUE_DEPTH.set(self._writer.jobs.qsize()))
+
+    def _setup(self, conn: sqlite3.Connection):
+        conn.execute("PRAGMA journal_mode=WAL")
+        migrate(conn)
+
+    # Execução
+    def _reader_conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = _connect(self.path)
+            conn.execute("PRAGMA query_only=ON")
+            self._local.conn = conn
+            self._reader_conns.append(conn)
+        return conn
+
+    # `op` (o nome do método público) vira o label das métricas de consulta
+    async def _read(self, op: str, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        loop = asyncio.get_running_loop()
+        with DB_QUERY_SECONDS.time(op=op, kind="read"):
+            return await loop.run_in_executor(self._readers, lambda: fn(self._reader_conn()))
+
+    async def _write(self, op: str, fn: Callable[[sqlite3.Connection], Any]) -> Any:
+        fut: Future = Future()
+        with DB_QUERY_SECONDS.time(op=op, kind="write"):
+            self._writer.jobs.put((fn, fut, time.monotonic()))
+            return await asyncio.wrap_future(fut)
+
+    def stats(self) -> Dict[str, float]:
+        st = dict(self._writer.stats)
+        commits = st["commits"] or 1
+        writes = st["writes"] or 1
+        st["queue_depth"] = self._writer.jobs.qsize()
+        st["avg_batch"] = st["writes"] / commits
+        st["avg_queue_wait_ms"] = st.pop("queue_wait_total") / writes * 1000
+        st["avg_lock_wait_ms"] = st.pop("lock_wait_total") / commits * 1000
+        st["max_queue_wait_ms"] = st.pop("queue_wait_max") * 1000
+        st["max_lock_wait_ms"] = st.pop("lock_wait_max") * 1000
+        return st
+
+    def close(self):
+        self._writer.jobs.put(None)
+        self._writer.join()
+        self._readers.shutdown(wait=True)
+        for conn in self._reader_conns:
+            conn.close()
+        self._reader_conns.clear()
+
+    # Catálogo
+    @staticmethod
+    def _bump_catalog(c: sqlite3.Connection, sku: str):
+        # incrementa o contador na mesma transação da escrita, para que outros
+        # processos percebam a mudança
+        c.execute("UPDATE meta SET value = value + 1 WHERE key='catalog_version'")
+        version = c.execute("SELECT value FROM meta WHERE key='catalog_version'").fetchone()[0]
+        return c.execute("SELECT * FROM products WHERE sku=?", (sku,)).fetchone(), version
+
+    async def warm_catalog(self) -> Catalog:
+        def load(c: sqlite3.Connection):
+            version = c.execute("SELECT value FROM meta WHERE key='catalog_version'").fetchone()[0]
+            return c.execute("SELECT * FROM products").fetchall(), version
+
+        rows, version = await self._read("warm_catalog", load)
+        self.catalog.load(rows, version)
+        return self.catalog
+
+    async def _fresh_catalog(self) -> Catalog:
+        cat = self.catalog
+        if cat.is_fresh():
+            return cat
+        if cat.loaded:
+            version = await self._read("_fresh_catalog", lambda c: c.execute("SELECT value FROM meta WHERE key='catalog_version'").fetchone()[0])
+            if version == cat.version:
+                cat.checked_at = time.monotonic()
+                return cat
+        return await self.warm_catalog()
+
+    def _apply_catalog_write(self, result):
+        row, version = result
+        if row is not None:
+            self.catalog.apply(row, version)
+
+    # Produtos
+    async def upsert_product(self, p: Product, delivery_url: Optional[str] = None):
+        # UPSERT e não REPLACE: mantém o rowid, que é a chave do products_fts
+        def write(c: sqlite3.Connection):
+            c.execute(
+                "INSERT INTO products (sku,name,price,description,category,delivery_url) VALUES (?,?,?,?,?,?) "
+                "ON CONFLICT(sku) DO UPDATE SET name=excluded.name, price=excluded.price, description=excluded.description, "
+                "category=excluded.category, delivery_url=excluded.delivery_url",
+                (p.sku, p.name, p.price, p.description, p.category, delivery_url),
             )
-            """
-        )
-        c.execute(
-            """
-            CREATE TABLE IF NOT EXISTS carts (
-                user_id TEXT PRIMARY KEY,
-                items_json TEXT NOT NULL DEFAULT '{}'
+            return self._bump_catalog(c, p.sku)
+
+        self._apply_catalog_write(await self._write("upsert_product", write))
+
+
+    async def get_catalog_entry(self, sku: str) -> Optional[CatalogEntry]:
+        return (await self._fresh_catalog()).get(sku)
+
+
+    async def get_product(self, sku: str) -> Optional[Product]:
+        entry = await self.get_catalog_entry(sku)
+        return entry.product if entry else None
+
+
+    async def get_product_row(self, sku: str):
+        return await self._read("get_product_row", lambda c: c.execute("SELECT * FROM products WHERE sku=?", (sku,)).fetchone())
+
+
+    async def get_products(self, skus: Iterable[str]) -> Dict[str, Product]:
+        cat = await self._fresh_catalog()
+        found = {}
+        for sku in skus:
+            entry = cat.get(sku)
+            if entry:
+                found[sku] = entry.product
+        return found
+
+
+    async def get_product_rows(self, skus: Iterable[str]) -> Dict[str, sqlite3.Row]:
+        # uma consulta IN por lote em vez de uma ida ao banco por SKU
+        wanted = list(dict.fromkeys(skus))
+        if not wanted:
+            return {}
+
+        def fetch(c: sqlite3.Connection):
+            rows = []
+            for i in range(0, len(wanted), _IN_CHUNK):
+                chunk = wanted[i:i + _IN_CHUNK]
+                marks = ",".join("?" * len(chunk))
+                rows += c.execute(f"SELECT * FROM products WHERE sku IN ({marks})", chunk).fetchall()
+            return rows
+
+        return {r["sku"]: r for r in await self._read("get_product_rows", fetch)}
+
+
+    async def list_products(self, category: Optional[str] = None) -> List[Product]:
+        return (await self._fresh_catalog()).products(category)
+
+
+    async def list_categories(self) -> List[str]:
+        return (await self._fresh_catalog()).categories()
+
+
+    async def search_products(self, text: str, category: Optional[str] = None, limit: int = 100) -> List[Product]:
+        """Busca de texto (nome, descrição, categoria) no products_fts, por relevância.
+
+        Cada palavra vira um prefixo ("gui" acha "guia"); os produtos saem do
+        catálogo em memória, o banco só devolve os SKUs.
+        """
+        words = [w for w in "".join(ch if ch.isalnum() else " " for ch in text).split()]
+        if not words:
+            return []
+        query = " ".join(f'"{w}"*' for w in words)
+        if category:
+            query = f'({query}) AND category : "{category.replace(chr(34), "")}"'
+        rows = await self._read("search_products", lambda c: c.execute(
+            "SELECT p.sku FROM products_fts f JOIN products p ON p.rowid = f.rowid "
+            "WHERE products_fts MATCH ? ORDER BY f.rank LIMIT ?",
+            (query, limit),
+        ).fetchall())
+        cat = await self._fresh_catalog()
+        return [entry.product for entry in (cat.get(r["sku"]) for r in rows) if entry is not None]
+
+
+    async def autocomplete_products(self, text: str, limit: int = 25) -> List[Product]:
+        # índice de prefixos em memória; o FTS só entra quando nenhum nome/SKU começa com o texto
+        found = (await self._fresh_catalog()).prefix_search(text, limit)
+        if not found and text.strip():
+            found = await self.search_products(text, limit=limit)
+        return found
+
+
+    async def set_delivery_url(self, sku: str, url: str):
+        def write(c: sqlite3.Connection):
+            c.execute("UPDATE products SET delivery_url=? WHERE sku=?", (url, sku))
+            return self._bump_catalog(c, sku)
+
+        self._apply_catalog_write(await self._write("set_delivery_url", write))
+
+
+    # Vitrine (mensagens postadas, para atualizar em lote)
+    async def add_showcase_message(self, message_id: int, channel_id: int, guild_id: Optional[int], sku: str):
+        now = datetime.utcnow().isoformat()
+        await self._write("add_showcase_message", lambda c: c.execute(
+            "REPLACE INTO showcase_messages (message_id, channel_id, guild_id, sku, posted_at) VALUES (?,?,?,?,?)",
+            (str(message_id), str(channel_id), str(guild_id) if guild_id else None, sku, now),
+        ))
+
+
+    async def list_showcase_messages(self, sku: Optional[str] = None, guild_id: Optional[int] = None):
+        where, params = [], []
+        if sku:
+            where.append("sku=?")
+            params.append(sku)
+        if guild_id is not None:
+            where.append("guild_id=?")
+            params.append(str(guild_id))
+        sql = "SELECT * FROM showcase_messages"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        return await self._read("list_showcase_messages", lambda c: c.execute(sql, params).fetchall())
+
+
+    async def delete_showcase_messages(self, message_ids: Iterable[int]):
+        ids = [(str(mid),) for mid in message_ids]
+        if ids:
+            await self._write("delete_showcase_messages", lambda c: c.executemany("DELETE FROM showcase_messages WHERE message_id=?", ids))
+
+
+    # Carrinho (uma linha por item, por guild; o cache write-behind fica em services.cart.CartStore)
+    async def get_cart(self, guild_id: int, user_id: int) -> Dict[str, int]:
+        rows = await self._read("get_cart", lambda c: c.execute(
+            "SELECT sku, qty FROM cart_items WHERE guild_id=? AND user_id=?", (str(guild_id), str(user_id))
+        ).fetchall())
+        return {r["sku"]: r["qty"] for r in rows}
+
+
+    async def save_cart(self, guild_id: int, user_id: int, items: Dict[str, int]):
+        await self.save_carts({(guild_id, user_id): items})
+
+
+    async def save_carts(self, carts: Dict[Tuple[int, int], Dict[str, int]]):
+        # (guild_id, user_id) -> itens; substitui vários carrinhos numa única escrita
+        def write(c: sqlite3.Connection):
+            for (guild_id, user_id), items in carts.items():
+                c.execute("DELETE FROM cart_items WHERE guild_id=? AND user_id=?", (str(guild_id), str(user_id)))
+                c.executemany(
+                    "INSERT INTO cart_items (guild_id, user_id, sku, qty) VALUES (?,?,?,?)",
+                    [(str(guild_id), str(user_id), sku, qty) for sku, qty in items.items() if qty > 0],
+                )
+
+        if carts:
+            await self._write("save_carts", write)
+
+
+    async def add_cart_item(self, guild_id: int, user_id: int, sku: str, qty: int = 1):
+        # incremento atômico no próprio banco, sem ler-modificar-gravar
+        key = (str(guild_id), str(user_id), sku)
+
+        def write(c: sqlite3.Connection):
+            c.execute(
+                "INSERT INTO cart_items (guild_id, user_id, sku, qty) VALUES (?,?,?,?) "
+                "ON CONFLICT(guild_id, user_id, sku) DO UPDATE SET qty = qty + excluded.qty",
+                (*key, qty),
             )
-            """
-        )
+            c.execute("DELETE FROM cart_items WHERE guild_id=? AND user_id=? AND sku=? AND qty <= 0", key)
+
+        await self._write("add_cart_item", write)
+
+
+    async def clear_cart(self, guild_id: int, user_id: int):
+        await self._write("clear_cart", lambda c: c.execute(
+            "DELETE FROM cart_items WHERE guild_id=? AND user_id=?", (str(guild_id), str(user_id))
+        ))
+
+
+    # Configuração por guild (o cache fica em services.guilds.GuildSettings)
+    async def get_guild_settings(self, guild_id: int):
+        return await self._read("get_guild_settings", lambda c: c.execute("SELECT * FROM guild_settings WHERE guild_id=?", (str(guild_id),)).fetchone())
+
+
+    async def set_guild_settings(self, guild_id: int, cart_category_id: Optional[int] = None, order_log_channel_id: Optional[int] = None):
+        # None mantém o valor atual
+        now = datetime.utcnow().isoformat()
+        await self._write("set_guild_settings", lambda c: c.execute(
+            "INSERT INTO guild_settings (guild_id, cart_category_id, order_log_channel_id, updated_at) VALUES (?,?,?,?) "
+            "ON CONFLICT(guild_id) DO UPDATE SET "
+            "cart_category_id=COALESCE(excluded.cart_category_id, cart_category_id), "
+            "order_log_channel_id=COALESCE(excluded.order_log_channel_id, order_log_channel_id), "
+            "updated_at=excluded.updated_at",
+            (str(guild_id), str(cart_category_id) if cart_category_id else None,
+             str(order_log_channel_id) if order_log_channel_id else None, now),
+        ))
+
+
+    # Canais de carrinho (registro user -> canal; o índice em memória fica no CartChannelManager)
+    async def list_cart_channels(self):
+        return await self._read("list_cart_channels", lambda c: c.execute("SELECT guild_id, user_id, channel_id, last_active, message_id FROM cart_channels").fetchall())
+
+
+    async def set_cart_channel(self, guild_id: int, user_id: int, channel_id: int):
+        now = datetime.utcnow().isoformat()
+        await self._write("set_cart_channel", lambda c: c.execute(
+            "REPLACE INTO cart_channels (guild_id, user_id, channel_id, last_active) VALUES (?,?,?,?)",
+            (str(guild_id), str(user_id), str(channel_id), now),
+        ))
+
+
+    async def set_cart_message(self, channel_id: int, message_id: Optional[int]):
+        await self._write("set_cart_message", lambda c: c.execute(
+            "UPDATE cart_channels SET message_id=? WHERE channel_id=?",
+            (str(message_id) if message_id else None, str(channel_id)),
+        ))
+
+
+    async def delete_cart_channels(self, channel_ids: Iterable[int]):
+        ids = [(str(cid),) for cid in channel_ids]
+        if ids:
+            await self._write("delete_cart_channels", lambda c: c.executemany("DELETE FROM cart_channels WHERE channel_id=?", ids))
+
+
+    async def touch_cart_channels(self, touched: Dict[int, str]):
+        # channel_id -> último uso (ISO); gravado em lote pelo reaper
+        if touched:
+            await self._write("touch_cart_channels", lambda c: c.executemany(
+                "UPDATE cart_channels SET last_active=? WHERE channel_id=? AND last_active < ?",
+                [(ts, str(cid), ts) for cid, ts in touched.items()],
+            ))
+
+
+    async def idle_cart_channels(self, before: str):
+        return await self._read("idle_cart_channels", lambda c: c.execute(
+            "SELECT guild_id, user_id, channel_id FROM cart_channels WHERE last_active < ?", (before,)
+        ).fetchall())
+
+
+    # Pedidos
+    async def create_order(self, user_id: int, items: Dict[str, int], total: float, payment_link=None, external_ref=None, guild_id: Optional[int] = None) -> int:
+        created_at = datetime.utcnow().isoformat()
+
+        def write(c: sqlite3.Connection):
+            order_id = c.execute(
+                "INSERT INTO orders (user_id, items_json, total, status, payment_link, external_ref, created_at, guild_id) VALUES (?,?,?,?,?,?,?,?)",
+                (str(user_id), json.dumps(items), total, "pendente", payment_link, external_ref, created_at, str(guild_id) if guild_id else None),
+            ).lastrowid
+            self._count_funnel(c, guild_id, created_at[:10], "pedido", 1, total)
+            return order_id
+
+        return await self._write("create_order", write)
+
+
+    async def update_order_status(self, order_id: int, status: str, payment_link=None):
+        await self._write("update_order_status", lambda c: c.execute(
+            "UPDATE orders SET status=?, payment_link=COALESCE(?, payment_link) WHERE id=?", (status, payment_link, order_id)
+        ))
+
+
+    async def get_order(self, order_id: int):
+        return await self._read("get_order", lambda c: c.execute("SELECT * FROM orders WHERE id=?", (order_id,)).fetchone())
+
+
+    async def get_order_by_external_ref(self, external_ref: str):
+        return await self._read("get_order_by_external_ref", lambda c: c.execute("SELECT * FROM orders WHERE external_ref=?", (external_ref,)).fetchone())
+
+
+    async def query_orders(
+        self,
+        user_id: Optional[int] = None,
+        status: Optional[str] = None,
+        guild_id: Optional[int] = None,
+        since: Optional[datetime] = None,
+        until: Optional[datetime] = None,
+        before_id: Optional[int] = None,
+        after_id: Optional[int] = None,
+        limit: int = 10,
+    ) -> List[sqlite3.Row]:
+        """Pedidos mais recentes primeiro, paginados por chave (id).
+
+        Próxima página: before_id = menor id da página atual. Página anterior:
+        after_id = maior id da página atual. Nunca usa OFFSET, então o custo
+        não cresce com o número da página.
+        """
+        where, params = [], []
+        if user_id is not None:
+            where.append("user_id=?")
+            params.append(str(user_id))
+        if guild_id is not None:
+            where.append("guild_id=?")
+            params.append(str(guild_id))
+        if status:
+            where.append("status=?")
+            params.append(status)
+        if since:
+            where.append("created_at >= ?")
+            params.append(since.isoformat())
+        if until:
+            where.append("created_at < ?")
+            params.append(until.isoformat())
+        if before_id is not None:
+            where.append("id < ?")
+            params.append(before_id)
+        if after_id is not None:
+            where.append("id > ?")
+            params.append(after_id)
+        limit = max(1, min(limit, ORDER_PAGE_MAX))
+        # para voltar uma página lê em ordem crescente a partir de after_id e inverte
+        order = "ASC" if after_id is not None and before_id is None else "DESC"
+        sql = "SELECT id, user_id, total, status, created_at FROM orders"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += f" ORDER BY id {order} LIMIT ?"
+        params.append(limit)
+        rows = await self._read("query_orders", lambda c: c.execute(sql, params).fetchall())
+        return rows[::-1] if order == "ASC" else rows
+
+
+    async def set_order_status_if(self, order_id: int, expected: str, status: str) -> bool:
+        # troca condicional (compare-and-set): falha se outro processo mudou o status antes.
+        # Ao virar "pago" o pedido entra na fila de entrega e nos agregados na mesma escrita.
+        now = datetime.utcnow().isoformat()
+
+        def write(c: sqlite3.Connection):
+            row = c.execute(
+                "UPDATE orders SET status=?, status_at=?, delivery_status=CASE WHEN ?='pago' THEN 'pendente' ELSE delivery_status END "
+                "WHERE id=? AND status=? RETURNING guild_id, items_json, total",
+                (status, now, status, order_id, expected),
+            ).fetchone()
+            if row is not None:
+                self._rollup_order(c, row, status, now[:10])
+            return row is not None
+
+        return await self._write("set_order_status_if", write)
+
+
+    # Agregados de vendas (lidos por services.analytics.Analytics)
+    @staticmethod
+    def _count_funnel(c: sqlite3.Connection, guild_id, day: str, stage: str, count: int, amount: float):
         c.execute(
-            """
-            CREATE TABLE IF NOT EXISTS orders (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                user_id TEXT NOT NULL,
-                items_json TEXT NOT NULL,
-                total REAL NOT NULL,
-                status TEXT NOT NULL,
-                payment_link TEXT,
-                external_ref TEXT,
-                created_at TEXT NOT NULL
-            )
-            """
+            "INSERT INTO funnel_daily (guild_id, day, stage, count, amount) VALUES (?,?,?,?,?) "
+            "ON CONFLICT(guild_id, day, stage) DO UPDATE SET count = count + excluded.count, amount = amount + excluded.amount",
+            (str(guild_id or ""), day, stage, count, amount),
         )
-        self.conn.commit()
 
-    # Produtos
-    def upsert_product(self, p: Product, delivery_url: Optional[str] = None):
-        self.conn.execute(
-            "REPLACE INTO products (sku,name,price,description,category,delivery_url) VALUES (?,?,?,?,?,?)",
-            (p.sku, p.name, p.price, p.description, p.category, delivery_url),
+    @staticmethod
+    def _rollup_order(c: sqlite3.Connection, order, status: str, day: str):
+        # incrementa funil e vendas por SKU de um pedido que acabou de mudar para `status`
+        if status not in FUNNEL_STATUSES:
+            return
+        StoreDB._count_funnel(c, order["guild_id"], day, status, 1, order["total"])
+        if status != "pago":
+            return
+        items = {sku: qty for sku, qty in (json.loads(order["items_json"]) or {}).items() if qty > 0}
+        if not items:
+            return
+        # a receita do pedido é dividida entre os SKUs pelo peso preço x quantidade
+        marks = ",".join("?" * len(items))
+        prices = {r[0]: r[1] for r in c.execute(f"SELECT sku, price FROM products WHERE sku IN ({marks})", list(items))}
+        weights = {sku: prices.get(sku, 0.0) * qty for sku, qty in items.items()}
+        total_weight = sum(weights.values())
+        c.executemany(
+            "INSERT INTO sales_daily (guild_id, day, sku, units, revenue, orders) VALUES (?,?,?,?,?,1) "
+            "ON CONFLICT(guild_id, day, sku) DO UPDATE SET units = units + excluded.units, "
+            "revenue = revenue + excluded.revenue, orders = orders + 1",
+            [
+                (str(order["guild_id"] or ""), day, sku, qty,
+                 order["total"] * (weights[sku] / total_weight if total_weight else 1 / len(items)))
+                for sku, qty in items.items()
+            ],
         )
-        self.conn.commit()
 
+    async def count_funnel(self, counts: Dict[Tuple[str, str, str], int]):
+        # (guild_id, dia, etapa) -> quantidade; contadores acumulados em memória (carrinhos)
+        rows = [(guild_id, day, stage, n) for (guild_id, day, stage), n in counts.items() if n]
+        if rows:
+            await self._write("count_funnel", lambda c: [self._count_funnel(c, *row, 0.0) for row in rows])
 
-    def get_product(self, sku: str) -> Optional[Product]:
-        r = self.conn.execute("SELECT * FROM products WHERE sku=?", (sku,)).fetchone()
-        if not r:
-            return None
-        return Product(sku=r["sku"], name=r["name"], price=r["price"], description=r["description"], category=r["category"])
+    async def sales_by_day(self, guild_id: Optional[int], start: str, end: str) -> List[sqlite3.Row]:
+        # [start, end) em dias 'AAAA-MM-DD'; o custo depende do período, não do histórico
+        return await self._read("sales_by_day", lambda c: c.execute(
+            "SELECT day, sku, units, revenue, orders FROM sales_daily WHERE guild_id=? AND day >= ? AND day < ? ORDER BY day, sku",
+            (str(guild_id or ""), start, end),
+        ).fetchall())
 
+    async def sales_by_sku(self, guild_id: Optional[int], start: str, end: str, limit: int) -> List[sqlite3.Row]:
+        return await self._read("sales_by_sku", lambda c: c.execute(
+            "SELECT sku, SUM(units) AS units, SUM(revenue) AS revenue, SUM(orders) AS orders FROM sales_daily "
+            "WHERE guild_id=? AND day >= ? AND day < ? GROUP BY sku ORDER BY revenue DESC LIMIT ?",
+            (str(guild_id or ""), start, end, limit),
+        ).fetchall())
 
-    def get_product_row(self, sku: str):
-        return self.conn.execute("SELECT * FROM products WHERE sku=?", (sku,)).fetchone()
+    async def funnel(self, guild_id: Optional[int], start: str, end: str) -> Dict[str, Tuple[int, float]]:
+        rows = await self._read("funnel", lambda c: c.execute(
+            "SELECT stage, SUM(count), SUM(amount) FROM funnel_daily WHERE guild_id=? AND day >= ? AND day < ? GROUP BY stage",
+            (str(guild_id or ""), start, end),
+        ).fetchall())
+        return {r[0]: (r[1], r[2]) for r in rows}
 
+    async def backfill_analytics(self, after_id: int, since: str, limit: int) -> Tuple[Optional[int], int]:
+        """Soma aos agregados um lote de pedidos anteriores aos agregados (id > after_id).
 
-    def list_products(self) -> List[Product]:
-        rows = self.conn.execute("SELECT * FROM products ORDER BY name").fetchall()
-        return [Product(sku=r["sku"], name=r["name"], price=r["price"], description=r["description"], category=r["category"]) for r in rows]
+        Lê orders e orders_history e grava o cursor na mesma transação, então
+        um restart no meio não conta nada duas vezes. Devolve o último id do
+        lote (None quando acabou) e quantos pedidos entraram.
+        """
+        def write(c: sqlite3.Connection):
+            rows = c.execute(
+                "SELECT id, guild_id, items_json, total, status, created_at, status_at FROM orders WHERE id > ? "
+                "UNION ALL "
+                "SELECT id, guild_id, items_json, total, status, created_at, status_at FROM orders_history WHERE id > ? "
+                "ORDER BY id LIMIT ?",
+                (after_id, after_id, limit),
+            ).fetchall()
+            for r in rows:
+                day = r["created_at"][:10]
+                if r["created_at"] < since:
+                    self._count_funnel(c, r["guild_id"], day, "pedido", 1, r["total"])
+                if r["status_at"] is None:
+                    # status nunca mudou com os agregados ligados: conta no dia da criação
+                    self._rollup_order(c, r, r["status"], day)
+            last = rows[-1]["id"] if rows else None
+            now = datetime.utcnow().isoformat()
+            c.execute(
+                "REPLACE INTO job_state (name, cursor, updated_at) VALUES ('analytics_backfill', ?, ?)",
+                (str(last) if last is not None else "done", now),
+            )
+            return last, len(rows)
 
+        return await self._write("backfill_analytics", write)
 
-    def set_delivery_url(self, sku: str, url: str):
-        self.conn.execute("UPDATE products SET delivery_url=? WHERE sku=?", (url, sku))
-        self.conn.commit()
 
+    # Entregas
+    async def claim_deliveries(self, limit: int, stale_after: float = 600.0) -> List[sqlite3.Row]:
+        # reserva um lote ('pendente' -> 'entregando') atomicamente, como em
+        # claim_webhook_events; reservas de um worker que morreu voltam depois de `stale_after`
+        now = datetime.utcnow()
+        stale = (now - timedelta(seconds=stale_after)).isoformat()
 
-    # Carrinho
-    def get_cart(self, user_id: int) -> Dict[str, int]:
-        r = self.conn.execute("SELECT items_json FROM carts WHERE user_id=?", (str(user_id),)).fetchone()
-        return json.loads(r["items_json"]) if r else {}
+        def claim(c: sqlite3.Connection):
+            return c.execute(
+                """
+                UPDATE orders SET delivery_status='entregando', delivery_claimed_at=?
+                WHERE id IN (
+                    SELECT id FROM orders WHERE delivery_status='pendente'
+                    UNION ALL
+                    SELECT id FROM orders WHERE delivery_status='entregando' AND delivery_claimed_at < ?
+                    ORDER BY id LIMIT ?
+                )
+                RETURNING id, user_id, items_json, delivery_attempts
+                """,
+                (now.isoformat(), stale, limit),
+            ).fetchall()
 
+        rows = await self._write("claim_deliveries", claim)
+        return sorted(rows, key=lambda r: r["id"])
 
-    def save_cart(self, user_id: int, items: Dict[str, int]):
-        payload = json.dumps(items)
-        self.conn.execute("REPLACE INTO carts (user_id, items_json) VALUES (?,?)", (str(user_id), payload))
-        self.conn.commit()
 
+    async def finish_delivery(self, order_id: int, status: str):
+        # status: 'entregue' | 'falhou' | 'pendente' (nova tentativa depois)
+        now = datetime.utcnow().isoformat()
+        await self._write("finish_delivery", lambda c: c.execute(
+            "UPDATE orders SET delivery_status=?, delivery_attempts=delivery_attempts+1, delivery_claimed_at=NULL, "
+            "delivered_at=CASE WHEN ?='entregue' THEN ? ELSE delivered_at END WHERE id=? AND delivery_status='entregando'",
+            (status, status, now, order_id),
+        ))
 
-    def clear_cart(self, user_id: int):
-        self.conn.execute("DELETE FROM carts WHERE user_id=?", (str(user_id),))
-        self.conn.commit()
 
+    async def release_deliveries(self, order_ids: Iterable[int]):
+        ids = [(oid,) for oid in order_ids]
+        if ids:
+            await self._write("release_deliveries", lambda c: c.executemany(
+                "UPDATE orders SET delivery_status='pendente', delivery_claimed_at=NULL WHERE id=? AND delivery_status='entregando'", ids
+            ))
+
+
+    async def retry_delivery(self, order_id: int, guild_id: Optional[int] = None) -> bool:
+        sql = "UPDATE orders SET delivery_status='pendente' WHERE id=? AND status='pago' AND delivery_status IS NOT 'entregando'"
+        params: list = [order_id]
+        if guild_id is not None:
+            sql += " AND guild_id=?"
+            params.append(str(guild_id))
+        changed = await self._write("retry_delivery", lambda c: c.execute(sql, params).rowcount)
+        return changed == 1
+
+
+    async def delivery_stats(self) -> Dict[str, int]:
+        rows = await self._read("delivery_stats", lambda c: c.execute(
+            "SELECT delivery_status, COUNT(*) FROM orders WHERE delivery_status IS NOT NULL GROUP BY delivery_status"
+        ).fetchall())
+        return {r[0]: r[1] for r in rows}
+
+
+    async def orders_to_reconcile(self, after_id: int, created_before: datetime, limit: int) -> List[sqlite3.Row]:
+        # pedidos em aberto, em ordem de id a partir do cursor do job
+        return await self._read("orders_to_reconcile", lambda c: c.execute(
+            "SELECT id, status, external_ref, created_at FROM orders "
+            "WHERE status IN ('pendente', 'aguardando_pagamento') AND id > ? AND created_at < ? ORDER BY id LIMIT ?",
+            (after_id, created_before.isoformat(), limit),
+        ).fetchall())
+
+
+    async def stale_orders(self, after_id: int, created_before: datetime, limit: int) -> List[sqlite3.Row]:
+        return await self._read("stale_orders", lambda c: c.execute(
+            "SELECT id, status FROM orders "
+            "WHERE status IN ('pendente', 'aguardando_pagamento') AND id > ? AND created_at < ? ORDER BY id LIMIT ?",
+            (after_id, created_before.isoformat(), limit),
+        ).fetchall())
+
+
+    async def archive_orders(self, statuses: Iterable[str], created_before: datetime, limit: int) -> int:
+        """Move até `limit` pedidos encerrados para orders_history; devolve quantos."""
+        statuses = list(statuses)
+        marks = ",".join("?" * len(statuses))
+        now = datetime.utcnow().isoformat()
+
+        def move(c: sqlite3.Connection):
+            ids = [r[0] for r in c.execute(
+                f"SELECT id FROM orders WHERE status IN ({marks}) AND created_at < ? ORDER BY id LIMIT ?",
+                (*statuses, created_before.isoformat(), limit),
+            )]
+            if ids:
+                id_marks = ",".join("?" * len(ids))
+                c.execute(
+                    "INSERT OR REPLACE INTO orders_history (id, user_id, items_json, total, status, created_at, archived_at, guild_id, status_at) "
+                    f"SELECT id, user_id, items_json, total, status, created_at, ?, guild_id, status_at FROM orders WHERE id IN ({id_marks})",
+                    (now, *ids),
+                )
+                c.execute(f"DELETE FROM orders WHERE id IN ({id_marks})", ids)
+            return len(ids)
+
+        return await self._write("archive_orders", move)
+
+
+    # Estado dos jobs de manutenção
+    async def get_job_state(self, name: str) -> Optional[str]:
+        row = await self._read("get_job_state", lambda c: c.execute("SELECT cursor FROM job_state WHERE name=?", (name,)).fetchone())
+        return row["cursor"] if row else None
+
+
+    async def set_job_state(self, name: str, cursor: Optional[str]):
+        now = datetime.utcnow().isoformat()
+        await self._write("set_job_state", lambda c: c.execute("REPLACE INTO job_state (name, cursor, updated_at) VALUES (?,?,?)", (name, cursor, now)))
+
+
+    # Fila de webhooks
+    async def enqueue_webhook_event(self, event_id: str, order_id: int, status: str, payload: dict) -> bool:
+        now = datetime.utcnow().isoformat()
+        inserted = await self._write("enqueue_webhook_event", lambda c: c.execute(
+            "INSERT OR IGNORE INTO webhook_events (event_id, order_id, status, payload, received_at) VALUES (?,?,?,?,?)",
+            (event_id, order_id, status, json.dumps(payload), now),
+        ).rowcount)
+        return inserted == 1
+
+
+    async def enqueue_webhook_events(self, events: Iterable[tuple]) -> int:
+        # (event_id, order_id, status, payload) em lote; devolve quantos eram novos
+        now = datetime.utcnow().isoformat()
+        rows = [(event_id, order_id, status, json.dumps(payload), now) for event_id, order_id, status, payload in events]
+        if not rows:
+            return 0
+        return await self._write("enqueue_webhook_events", lambda c: c.executemany(
+            "INSERT OR IGNORE INTO webhook_events (event_id, order_id, status, payload, received_at) VALUES (?,?,?,?,?)", rows
+        ).rowcount)
+
+
+    async def prune_webhook_events(self, processed_before: datetime, limit: int) -> int:
+        # eventos já resolvidos só servem para deduplicar reenvios recentes
+        return await self._write("prune_webhook_events", lambda c: c.execute(
+            "DELETE FROM webhook_events WHERE event_id IN ("
+            "SELECT event_id FROM webhook_events WHERE processed_at < ? AND state IN ('done', 'skipped', 'failed') LIMIT ?)",
+            (processed_before.isoformat(), limit),
+        ).rowcount)
+
+
+    async def claim_webhook_events(self, limit: int, stale_after: float = 300.0) -> List[sqlite3.Row]:
+        # marca um lote como 'processing' atomicamente; eventos presos em
+        # 'processing' há mais de `stale_after` (worker morreu) voltam a ser elegíveis
+        now = datetime.utcnow()
+        stale = (now - timedelta(seconds=stale_after)).isoformat()
+
+        def claim(c: sqlite3.Connection):
+            return c.execute(
+                """
+                UPDATE webhook_events SET state='processing', claimed_at=?, attempts=attempts+1
+                WHERE event_id IN (
+                    SELECT event_id FROM webhook_events
+                    WHERE state='queued' OR (state='processing' AND claimed_at < ?)
+                    ORDER BY received_at LIMIT ?
+                )
+                RETURNING event_id, order_id, status, received_at, attempts
+                """,
+                (now.isoformat(), stale, limit),
+            ).fetchall()
+
+        rows = await self._write("claim_webhook_events", claim)
+        return sorted(rows, key=lambda r: r["received_at"])
 
-    # Pedidos
-    def create_order(self, user_id: int, items: Dict[str, int], total: float, payment_link=None, external_ref=None) -> int:
-        cur = self.conn.cursor()
-        cur.execute(
-            "INSERT INTO orders (user_id, items_json, total, status, payment_link, external_ref, created_at) VALUES (?,?,?,?,?,?,?)",
-            (str(user_id), json.dumps(items), total, "pendente", payment_link, external_ref, datetime.utcnow().isoformat()),
-        )
-        self.conn.commit()
-        return cur.lastrowid
 
+    async def finish_webhook_events(self, states: Dict[str, str]):
+        # event_id -> 'done' | 'skipped' | 'queued' (devolve para nova tentativa) | 'failed'
+        now = datetime.utcnow().isoformat()
+        if states:
+            await self._write("finish_webhook_events", lambda c: c.executemany(
+                "UPDATE webhook_events SET state=?, processed_at=? WHERE event_id=?",
+                [(state, now, event_id) for event_id, state in states.items()],
+            ))
 
-    def update_order_status(self, order_id: int, status: str, payment_link=None):
-        self.conn.execute("UPDATE orders SET status=?, payment_link=COALESCE(?, payment_link) WHERE id=?", (status, payment_link, order_id))
-        self.conn.commit()
 
+    async def webhook_queue_stats(self) -> Dict[str, float]:
+        def stats(c: sqlite3.Connection):
+            return c.execute(
+                "SELECT COUNT(*) AS depth, MIN(received_at) AS oldest FROM webhook_events WHERE state IN ('queued', 'processing')"
+            ).fetchone()
 
-    def get_order(self, order_id: int):
-        return self.conn.execute("SELECT * FROM orders WHERE id=?", (order_id,)).fetchone()
\ No newline at end of file
+        r = await self._read("webhook_queue_stats", stats)
+        lag = 0.0
+        if r["oldest"]:
+            lag = (datetime.utcnow() - datetime.fromisoformat(r["oldest"])).total_seconds()
+        return {"depth": r["depth"], "lag_seconds": lag}
\ No newline at end of file
@@ -0,0 +1,2 @@
+def brl(value: float) -> str:
+    return f"R$ {value:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
\ No newline at end of file
@@ -1,24 +1,164 @@
 import asyncio
+import contextlib
+import os
+import secrets
+import signal
+import subprocess
+import sys
+import time
 import uvicorn
-from .bot import run_bot
+from .bot import bot, run_bot
+from .config import (
+    DB_PATH, DB_READERS, DB_WRITE_BATCH, CATALOG_REFRESH_SECONDS, DELIVERY_URL_8BALL_GUIDE,
+    BOT_WORKERS, SHARD_COUNT, PROCESS_ROLE, WORKER_INDEX, HTTP_PORT, WORKER_HTTP_PORT, SHUTDOWN_TIMEOUT_SECONDS,
+)
+from .db import StoreDB
+from .models import Product
+from .services.notifier import Notifier
 from .webapp import app
 
+# intervalo entre IDENTIFYs de shards (max_concurrency 1 do gateway)
+IDENTIFY_INTERVAL = 5.0
 
-async def start_web():
-    config = uvicorn.Config(app, host="0.0.0.0", port=8000, log_level="info")
-    server = uvicorn.Server(config)
-    await server.serve()
 
+class _Server(uvicorn.Server):
+    # SIGINT/SIGTERM ficam com main(), que encerra web e bot na ordem certa
+    # (o uvicorn re-levantaria o sinal ao sair e mataria o processo no meio)
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
 
-async def main():
-    await asyncio.gather(
-        asyncio.to_thread(run_bot),
-        start_web(),
-    )
+
+async def startup(db: StoreDB):
+    # cria produto inicial se banco estiver vazio
+    if not await db.list_products():
+        await db.upsert_product(Product(
+            sku="8BALL_GUIDE_PRO",
+            name="8 Ball Pool – Guia Pro (PDF)",
+            price=29.90,
+            description="Guia avançado de estratégias: mira, break, rotação e posicionamento.",
+            category="jogos"
+        ), delivery_url=DELIVERY_URL_8BALL_GUIDE)
+    # catálogo em memória antes do primeiro request/clique (/ready depende disso)
+    await db.warm_catalog()
+
+
+async def main(with_bot: bool = True, host: str = "0.0.0.0", port: int = HTTP_PORT):
+    """Sobe o processo: banco, bot e webapp são montados uma vez aqui e compartilhados.
+
+    Ao receber SIGINT/SIGTERM (ou se web ou bot parar), encerra em ordem:
+    /ready passa a responder 503, o servidor para de aceitar requests e
+    termina webhooks e entregas em andamento, o bot esvazia pipeline e
+    Outbox e grava carrinhos e contadores, e por fim o banco fecha.
+    """
+    # um único StoreDB por processo, compartilhado entre bot e webhook
+    db = StoreDB(DB_PATH, readers=DB_READERS, write_batch=DB_WRITE_BATCH, catalog_refresh=CATALOG_REFRESH_SECONDS)
+    app.state.db = db
+    app.state.local_only = host in ("127.0.0.1", "localhost", "::1")
+    app.state.bot = app.state.notifier = app.state.guild_settings = None
+    if with_bot:
+        bot.attach(db)
+        app.state.bot = bot
+        app.state.notifier = Notifier(bot)
+        app.state.guild_settings = bot.guild_settings
+    await startup(db)
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stop.set)
+        except (NotImplementedError, RuntimeError):
+            # Windows: Ctrl+C chega como KeyboardInterrupt
+            pass
+
+    server = _Server(uvicorn.Config(app, host=host, port=port, log_level="info"))
+    web = asyncio.create_task(server.serve())
+    # bot e uvicorn no mesmo event loop: o webhook fala com o bot sem cruzar threads
+    bot_task = asyncio.create_task(run_bot()) if with_bot else None
+    stopping = asyncio.create_task(stop.wait())
+    tasks = [t for t in (web, bot_task, stopping) if t is not None]
+    try:
+        done, _ = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+        for t in done:
+            t.result()
+    finally:
+        app.state.stopping = True
+        stopping.cancel()
+        # o lifespan do webapp termina webhooks e entregas enquanto o bot segue conectado
+        server.should_exit = True
+        await asyncio.wait([web], timeout=3 * SHUTDOWN_TIMEOUT_SECONDS)
+        # antes do login o AutoShardedBot não sabe fechar; nesse caso o
+        # cancelamento sai do `async with bot` de run_bot(), que chama close()
+        if bot_task is not None and bot.is_ready() and not bot.is_closed():
+            await bot.close()
+        for t in tasks:
+            t.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        db.close()
+
+
+def launch(workers: int) -> int:
+    """Sobe o servidor web e `workers` processos do bot, cada um com uma faixa de shards.
+
+    O web só recebe HTTP (webhooks entram na fila do banco); cada worker roda
+    seus shards, o WebhookProcessor e o DeliveryEngine, e serve /metrics em
+    127.0.0.1:(WORKER_HTTP_PORT + índice). Se um processo cair, derruba os
+    outros e sai com erro, para o supervisor (systemd, docker) reiniciar tudo.
+    """
+    shard_count = SHARD_COUNT or workers
+    if workers > shard_count:
+        print(f"⚠️ {workers} workers para {shard_count} shards; usando {shard_count}")
+        workers = shard_count
+    env = dict(os.environ)
+    if not env.get("DELIVERY_SECRET"):
+        # os links de download precisam do mesmo segredo em todos os processos
+        print("⚠️ DELIVERY_SECRET não definido; usando um segredo temporário")
+        env["DELIVERY_SECRET"] = secrets.token_urlsafe(32)
+
+    def spawn(role: str, **extra) -> subprocess.Popen:
+        return subprocess.Popen([sys.executable, "-m", "src.main"], env={**env, "PROCESS_ROLE": role, **extra})
+
+    # SIGTERM no launcher vira SystemExit, para o finally encerrar os filhos
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    procs = []
+    try:
+        procs.append(spawn("web"))
+        for i in range(workers):
+            lo, hi = i * shard_count // workers, (i + 1) * shard_count // workers - 1
+            if i:
+                # os shards do worker anterior identificam um a cada IDENTIFY_INTERVAL
+                time.sleep(IDENTIFY_INTERVAL * (lo - (i - 1) * shard_count // workers))
+            procs.append(spawn("bot", WORKER_INDEX=str(i), SHARD_COUNT=str(shard_count), SHARD_IDS=f"{lo}-{hi}"))
+            print(f"Worker {i}: shards {lo}-{hi} de {shard_count}")
+        while True:
+            for p in procs:
+                code = p.poll()
+                if code is not None:
+                    print(f"Processo {p.pid} saiu com código {code}; encerrando os demais")
+                    return code or 1
+            time.sleep(1.0)
+    finally:
+        for p in procs:
+            if p.poll() is None:
+                p.terminate()
+        for p in procs:
+            try:
+                # cada filho encerra em etapas de até SHUTDOWN_TIMEOUT_SECONDS
+                p.wait(timeout=4 * SHUTDOWN_TIMEOUT_SECONDS)
+            except subprocess.TimeoutExpired:
+                p.kill()
 
 
 if __name__ == "__main__":
     try:
-        asyncio.run(main())
+        if PROCESS_ROLE == "web":
+            asyncio.run(main(with_bot=False))
+        elif PROCESS_ROLE == "bot":
+            asyncio.run(main(host="127.0.0.1", port=WORKER_HTTP_PORT + WORKER_INDEX))
+        elif BOT_WORKERS > 1:
+            sys.exit(launch(BOT_WORKERS))
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
         print("Encerrando...")
\ No newline at end of file
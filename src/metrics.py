@@ -0,0 +1,216 @@
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Deque, Dict, Iterable, List, Optional, Tuple
+
+from .config import TRACING_ENABLED, TRACE_BUFFER_SIZE
+
+# Métricas no formato de exposição do Prometheus, sem dependências externas.
+# Um único REGISTRY por processo; os módulos declaram suas métricas no import
+# e o FastAPI expõe tudo em GET /metrics.
+
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+LabelKey = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Iterable[str], values: Iterable[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = labelnames
+        # o writer do StoreDB e os event loops atualizam métricas de threads diferentes
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, object]) -> LabelKey:
+        return tuple(str(labels.get(n, "")) for n in self.labelnames)
+
+    def header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._values: Dict[LabelKey, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [f"{self.name}{_fmt_labels(self.labelnames, k)} {v}" for k, v in items]
+
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = buckets
+        # por label: (contagem por bucket, soma, total)
+        self._values: Dict[LabelKey, Tuple[List[int], float, int]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            counts, total, n = self._values.get(key) or ([0] * len(self.buckets), 0.0, 0)
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[i] += 1
+                    break
+            self._values[key] = (counts, total + value, n + 1)
+
+    @contextmanager
+    def time(self, **labels):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = [(k, list(c), s, n) for k, (c, s, n) in self._values.items()]
+        lines = self.header()
+        for key, counts, total, n in items:
+            for bound, acc in zip(self.buckets, itertools.accumulate(counts)):
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {acc}")
+            inf = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, inf)} {n}")
+            lines.append(f"{self.name}_sum{_fmt_labels(self.labelnames, key)} {total}")
+            lines.append(f"{self.name}_count{_fmt_labels(self.labelnames, key)} {n}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._collectors: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def _get(self, cls, name: str, *args, **kwargs):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = self._metrics[name] = cls(name, *args, **kwargs)
+            return metric
+
+    def counter(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._get(Counter, name, help, labelnames)
+
+    def gauge(self, name: str, help: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._get(Gauge, name, help, labelnames)
+
+    def histogram(self, name: str, help: str, labelnames: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get(Histogram, name, help, labelnames, buckets=buckets)
+
+    def on_collect(self, fn: Callable[[], None]):
+        # atualiza gauges (profundidade de filas etc.) logo antes de cada render
+        self._collectors.append(fn)
+
+    def render(self) -> str:
+        for fn in list(self._collectors):
+            try:
+                fn()
+            except Exception as e:
+                print("Metrics collector error:", e)
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for m in metrics:
+            lines += m.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+counter = REGISTRY.counter
+gauge = REGISTRY.gauge
+histogram = REGISTRY.histogram
+
+ERRORS = counter("errors_total", "Erros capturados e registrados, por local", ("where",))
+# comandos e botões do Discord: duração do handler, por tipo/nome e resultado
+INTERACTION_SECONDS = histogram("discord_interaction_seconds", "Duração dos handlers de comandos e botões", ("kind", "name", "result"))
+
+
+def record_error(where: str, message: str, error: BaseException):
+    ERRORS.inc(where=where)
+    print(message, error)
+
+
+# Tracing: spans leves guardados num buffer circular. O trace_id de um clique
+# é o id da interação; spans de pedido carregam order_id, então
+# /debug/traces?order_id=N liga o clique ao webhook que pagou o pedido.
+
+_trace_id: ContextVar[Optional[str]] = ContextVar("trace_id", default=None)
+
+
+class Tracer:
+    def __init__(self, enabled: bool = False, capacity: int = 2000):
+        self.enabled = enabled
+        self.spans: Deque[dict] = deque(maxlen=capacity)
+
+    @contextmanager
+    def span(self, name: str, trace_id: Optional[str] = None, **attrs):
+        trace_id = trace_id or _trace_id.get()
+        token = _trace_id.set(trace_id)
+        record = {"name": name, "trace_id": trace_id, **attrs}
+        started = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record["error"] = repr(e)
+            raise
+        finally:
+            _trace_id.reset(token)
+            if self.enabled:
+                record["duration_ms"] = (time.perf_counter() - started) * 1000
+                record["ts"] = time.time()
+                self.spans.append(record)
+
+    def find(self, trace_id: Optional[str] = None, order_id: Optional[int] = None, limit: int = 100) -> List[dict]:
+        out = []
+        for s in reversed(self.spans):
+            if trace_id and s.get("trace_id") != trace_id:
+                continue
+            if order_id is not None and s.get("order_id") != order_id:
+                continue
+            out.append(s)
+            if len(out) >= limit:
+                break
+        return out
+
+
+TRACER = Tracer(enabled=TRACING_ENABLED, capacity=TRACE_BUFFER_SIZE)
+span = TRACER.span
\ No newline at end of file
@@ -0,0 +1,392 @@
+import sqlite3
+from datetime import datetime
+from typing import Callable, List, Tuple
+
+from .config import DISCORD_GUILD_ID
+
+# Migrações de esquema versionadas por PRAGMA user_version.
+#
+# Cada migração roda numa transação própria junto com a atualização do
+# user_version, e usa IF NOT EXISTS/INSERT OR IGNORE para ser idempotente:
+# bancos criados antes do controle de versão (user_version = 0, mas já com
+# parte das tabelas) passam por todas sem erro. Nunca altere uma migração já
+# publicada; acrescente uma nova no fim da lista.
+
+
+def _base_schema(c: sqlite3.Connection):
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS products (
+            sku TEXT PRIMARY KEY,
+            name TEXT NOT NULL,
+            price REAL NOT NULL,
+            description TEXT,
+            category TEXT,
+            delivery_url TEXT
+        )
+        """
+    )
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS orders (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id TEXT NOT NULL,
+            items_json TEXT NOT NULL,
+            total REAL NOT NULL,
+            status TEXT NOT NULL,
+            payment_link TEXT,
+            external_ref TEXT,
+            created_at TEXT NOT NULL
+        )
+        """
+    )
+
+
+def _cart_items(c: sqlite3.Connection):
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS cart_items (
+            user_id TEXT NOT NULL,
+            sku TEXT NOT NULL,
+            qty INTEGER NOT NULL,
+            PRIMARY KEY (user_id, sku)
+        ) WITHOUT ROWID
+        """
+    )
+    # carrinhos antigos guardados como JSON em carts.items_json
+    if c.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name='carts'").fetchone():
+        c.execute(
+            "INSERT OR IGNORE INTO cart_items (user_id, sku, qty) "
+            "SELECT carts.user_id, j.key, j.value FROM carts, json_each(carts.items_json) AS j WHERE j.value > 0"
+        )
+        c.execute("DROP TABLE carts")
+
+
+def _catalog_version(c: sqlite3.Connection):
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+        """
+    )
+    c.execute("INSERT OR IGNORE INTO meta (key, value) VALUES ('catalog_version', 0)")
+
+
+def _cart_channels(c: sqlite3.Connection):
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS cart_channels (
+            guild_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            channel_id TEXT NOT NULL UNIQUE,
+            last_active TEXT NOT NULL,
+            PRIMARY KEY (guild_id, user_id)
+        )
+        """
+    )
+
+
+def _webhook_events(c: sqlite3.Connection):
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS webhook_events (
+            event_id TEXT PRIMARY KEY,
+            order_id INTEGER NOT NULL,
+            status TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            state TEXT NOT NULL DEFAULT 'queued',
+            attempts INTEGER NOT NULL DEFAULT 0,
+            received_at TEXT NOT NULL,
+            claimed_at TEXT,
+            processed_at TEXT
+        )
+        """
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_webhook_events_state ON webhook_events (state, received_at)")
+
+
+def _order_indexes(c: sqlite3.Connection):
+    # cobrem as listagens (id, user_id, total, status, created_at) sem tocar na tabela
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_user ON orders (user_id, id, status, total, created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_status ON orders (status, id, user_id, total, created_at)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_created ON orders (created_at, id)")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_external_ref ON orders (external_ref) WHERE external_ref IS NOT NULL")
+
+
+def _showcase_messages(c: sqlite3.Connection):
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS showcase_messages (
+            message_id TEXT PRIMARY KEY,
+            channel_id TEXT NOT NULL,
+            guild_id TEXT,
+            sku TEXT NOT NULL,
+            posted_at TEXT NOT NULL
+        )
+        """
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_showcase_messages_sku ON showcase_messages (sku)")
+
+
+def _cart_message(c: sqlite3.Connection):
+    # mensagem fixada do carrinho, editada a cada atualização em vez de postar outra
+    columns = {r[1] for r in c.execute("PRAGMA table_info(cart_channels)")}
+    if "message_id" not in columns:
+        c.execute("ALTER TABLE cart_channels ADD COLUMN message_id TEXT")
+
+
+def _order_maintenance(c: sqlite3.Connection):
+    # pedidos antigos já encerrados saem de orders para cá, só com o essencial
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS orders_history (
+            id INTEGER PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            items_json TEXT NOT NULL,
+            total REAL NOT NULL,
+            status TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            archived_at TEXT NOT NULL
+        )
+        """
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_history_user ON orders_history (user_id, id)")
+    # cursor/última execução de cada job de manutenção, para retomar após restart
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS job_state (
+            name TEXT PRIMARY KEY,
+            cursor TEXT,
+            updated_at TEXT NOT NULL
+        )
+        """
+    )
+    c.execute("CREATE INDEX IF NOT EXISTS idx_webhook_events_processed ON webhook_events (processed_at) WHERE processed_at IS NOT NULL")
+
+
+def _delivery_status(c: sqlite3.Connection):
+    # NULL: nada a entregar (ainda); 'pendente' -> 'entregue' | 'falhou'
+    columns = {r[1] for r in c.execute("PRAGMA table_info(orders)")}
+    if "delivery_status" not in columns:
+        c.execute("ALTER TABLE orders ADD COLUMN delivery_status TEXT")
+    if "delivery_attempts" not in columns:
+        c.execute("ALTER TABLE orders ADD COLUMN delivery_attempts INTEGER NOT NULL DEFAULT 0")
+    if "delivered_at" not in columns:
+        c.execute("ALTER TABLE orders ADD COLUMN delivered_at TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_delivery_pending ON orders (id) WHERE delivery_status = 'pendente'")
+
+
+def _rebuild_cart_items(c: sqlite3.Connection, single):
+    # sobra de uma tentativa anterior interrompida fora de transação
+    c.execute("DROP TABLE IF EXISTS cart_items_new")
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS cart_items_new (
+            guild_id TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            sku TEXT NOT NULL,
+            qty INTEGER NOT NULL,
+            PRIMARY KEY (guild_id, user_id, sku)
+        ) WITHOUT ROWID
+        """
+    )
+    # mesma guild dos pedidos; sem ela, a do canal de carrinho do usuário
+    # (_multi_guild já garantiu que uma das duas existe)
+    c.execute(
+        "INSERT OR IGNORE INTO cart_items_new (guild_id, user_id, sku, qty) "
+        "SELECT COALESCE(?, (SELECT cc.guild_id FROM cart_channels cc WHERE cc.user_id = ci.user_id LIMIT 1)), "
+        "ci.user_id, ci.sku, ci.qty FROM cart_items ci",
+        (single,),
+    )
+    c.execute("DROP TABLE cart_items")
+    c.execute("ALTER TABLE cart_items_new RENAME TO cart_items")
+
+
+def _require_guild(c: sqlite3.Connection):
+    # sem guild para os dados antigos, eles ficariam órfãos (ou numa guild
+    # inventada); melhor parar a migração e pedir a configuração
+    orphans = 0
+    for table in ("orders", "orders_history"):
+        columns = {r[1] for r in c.execute(f"PRAGMA table_info({table})")}
+        where = " WHERE guild_id IS NULL" if "guild_id" in columns else ""
+        orphans += c.execute(f"SELECT COUNT(*) FROM {table}{where}").fetchone()[0]
+    if "guild_id" not in {r[1] for r in c.execute("PRAGMA table_info(cart_items)")}:
+        orphans += c.execute(
+            "SELECT COUNT(*) FROM cart_items ci "
+            "WHERE NOT EXISTS (SELECT 1 FROM cart_channels cc WHERE cc.user_id = ci.user_id)"
+        ).fetchone()[0]
+    if orphans:
+        raise RuntimeError(
+            f"Migração por guild: {orphans} pedido(s)/item(ns) de carrinho antigos sem guild conhecida. "
+            "Defina DISCORD_GUILD_ID no .env com a guild da loja e inicie de novo."
+        )
+
+
+def _multi_guild(c: sqlite3.Connection):
+    # configuração por guild (antes vinha só de CART_CATEGORY_ID/ORDER_LOG_CHANNEL_ID)
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS guild_settings (
+            guild_id TEXT PRIMARY KEY,
+            cart_category_id TEXT,
+            order_log_channel_id TEXT,
+            updated_at TEXT NOT NULL
+        )
+        """
+    )
+    # numa instalação de uma guild só, os dados antigos são todos dela
+    guilds = [r[0] for r in c.execute(
+        "SELECT guild_id FROM cart_channels UNION SELECT guild_id FROM showcase_messages WHERE guild_id IS NOT NULL"
+    )]
+    single = guilds[0] if len(guilds) == 1 else None
+    if single is None and DISCORD_GUILD_ID:
+        # nada registrado para inferir (ex.: vindo do esquema original): a guild
+        # configurada no .env fica com os pedidos e carrinhos antigos
+        single = str(DISCORD_GUILD_ID).strip()
+    if single is None:
+        _require_guild(c)
+
+    # carrinho por guild: o mesmo usuário tem um carrinho em cada loja.
+    # Só reconstrói se cart_items ainda não tem guild_id (banco sem user_version)
+    cart_columns = {r[1] for r in c.execute("PRAGMA table_info(cart_items)")}
+    if "guild_id" not in cart_columns:
+        _rebuild_cart_items(c, single)
+
+    for table in ("orders", "orders_history"):
+        columns = {r[1] for r in c.execute(f"PRAGMA table_info({table})")}
+        if "guild_id" not in columns:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN guild_id TEXT")
+        if single:
+            c.execute(f"UPDATE {table} SET guild_id=? WHERE guild_id IS NULL", (single,))
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_guild ON orders (guild_id, id)")
+
+    # entrega com reserva ('entregando'), para vários workers consumirem a mesma fila
+    columns = {r[1] for r in c.execute("PRAGMA table_info(orders)")}
+    if "delivery_claimed_at" not in columns:
+        c.execute("ALTER TABLE orders ADD COLUMN delivery_claimed_at TEXT")
+    c.execute("CREATE INDEX IF NOT EXISTS idx_orders_delivery_claimed ON orders (delivery_claimed_at) WHERE delivery_status = 'entregando'")
+
+
+def _products_fts(c: sqlite3.Connection):
+    # índice de texto sobre products (external content: o texto fica só em
+    # products; triggers mantêm o índice). prefix='2 3' acelera buscas "gu*"
+    c.execute(
+        """
+        CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+            name, description, category,
+            content='products', content_rowid='rowid',
+            tokenize='unicode61 remove_diacritics 2', prefix='2 3'
+        )
+        """
+    )
+    c.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS products_fts_insert AFTER INSERT ON products BEGIN
+            INSERT INTO products_fts (rowid, name, description, category)
+            VALUES (new.rowid, new.name, new.description, new.category);
+        END
+        """
+    )
+    c.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS products_fts_delete AFTER DELETE ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, description, category)
+            VALUES ('delete', old.rowid, old.name, old.description, old.category);
+        END
+        """
+    )
+    c.execute(
+        """
+        CREATE TRIGGER IF NOT EXISTS products_fts_update AFTER UPDATE ON products BEGIN
+            INSERT INTO products_fts (products_fts, rowid, name, description, category)
+            VALUES ('delete', old.rowid, old.name, old.description, old.category);
+            INSERT INTO products_fts (rowid, name, description, category)
+            VALUES (new.rowid, new.name, new.description, new.category);
+        END
+        """
+    )
+    c.execute("INSERT INTO products_fts (products_fts) VALUES ('rebuild')")
+
+
+def _analytics(c: sqlite3.Connection):
+    # agregados diários mantidos na mesma escrita que muda o status do pedido;
+    # relatórios leem só estas tabelas, nunca orders.items_json
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS sales_daily (
+            guild_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            sku TEXT NOT NULL,
+            units INTEGER NOT NULL DEFAULT 0,
+            revenue REAL NOT NULL DEFAULT 0,
+            orders INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, day, sku)
+        ) WITHOUT ROWID
+        """
+    )
+    c.execute(
+        """
+        CREATE TABLE IF NOT EXISTS funnel_daily (
+            guild_id TEXT NOT NULL,
+            day TEXT NOT NULL,
+            stage TEXT NOT NULL,
+            count INTEGER NOT NULL DEFAULT 0,
+            amount REAL NOT NULL DEFAULT 0,
+            PRIMARY KEY (guild_id, day, stage)
+        ) WITHOUT ROWID
+        """
+    )
+    # status_at: quando o status mudou pela última vez com os agregados ligados.
+    # NULL = status anterior a esta migração, contado pelo backfill
+    for table in ("orders", "orders_history"):
+        columns = {r[1] for r in c.execute(f"PRAGMA table_info({table})")}
+        if "status_at" not in columns:
+            c.execute(f"ALTER TABLE {table} ADD COLUMN status_at TEXT")
+    # pedidos criados antes daqui entram no funil pelo backfill (Analytics.backfill)
+    now = datetime.utcnow().isoformat()
+    c.execute("INSERT OR IGNORE INTO job_state (name, cursor, updated_at) VALUES ('analytics_since', ?, ?)", (now, now))
+
+
+MIGRATIONS: List[Tuple[int, str, Callable[[sqlite3.Connection], None]]] = [
+    (1, "esquema base", _base_schema),
+    (2, "carrinho normalizado em cart_items", _cart_items),
+    (3, "versão do catálogo", _catalog_version),
+    (4, "registro de canais de carrinho", _cart_channels),
+    (5, "fila de webhooks", _webhook_events),
+    (6, "índices de pedidos", _order_indexes),
+    (7, "mensagens de vitrine", _showcase_messages),
+    (8, "mensagem fixada do carrinho", _cart_message),
+    (9, "histórico de pedidos e estado dos jobs", _order_maintenance),
+    (10, "status de entrega dos pedidos", _delivery_status),
+    (11, "configuração e carrinhos por guild", _multi_guild),
+    (12, "busca de texto no catálogo", _products_fts),
+    (13, "agregados de vendas", _analytics),
+]
+
+
+def migrate(conn: sqlite3.Connection) -> int:
+    """Aplica as migrações pendentes; devolve a versão final do esquema.
+
+    Espera uma conexão em modo autocommit (isolation_level=None).
+    """
+    current = conn.execute("PRAGMA user_version").fetchone()[0]
+    for version, name, apply in MIGRATIONS:
+        if version <= current:
+            continue
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # outro processo pode ter migrado enquanto esperávamos o lock
+            if conn.execute("PRAGMA user_version").fetchone()[0] >= version:
+                conn.execute("COMMIT")
+                continue
+            apply(conn)
+            conn.execute(f"PRAGMA user_version = {version}")
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        print(f"DB: migração {version} aplicada ({name})")
+        current = version
+    return current
\ No newline at end of file
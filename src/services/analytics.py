@@ -0,0 +1,115 @@
+import asyncio
+import csv
+import io
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from .. import metrics
+from ..db import StoreDB
+
+ANALYTICS_BACKFILLED = metrics.counter("analytics_backfill_orders_total", "Pedidos antigos somados aos agregados pelo backfill")
+
+
+def day_range(days: int, today: Optional[date] = None) -> Tuple[str, str]:
+    # últimos `days` dias, incluindo hoje, como [início, fim) em 'AAAA-MM-DD'
+    end = (today or datetime.utcnow().date()) + timedelta(days=1)
+    return (end - timedelta(days=days)).isoformat(), end.isoformat()
+
+
+class Analytics:
+    """Relatórios de vendas a partir dos agregados diários.
+
+    sales_daily (receita e unidades por SKU por dia) e funnel_daily (eventos
+    do funil por dia) são incrementados pelo StoreDB na mesma escrita que cria
+    o pedido ou muda seu status; aqui só se lê um intervalo de dias, então o
+    custo de um relatório não cresce com o histórico de pedidos. Carrinhos
+    abertos são contados em memória e gravados a cada `flush_interval`.
+    """
+
+    def __init__(self, db: StoreDB, flush_interval: float = 30.0):
+        self.db = db
+        self.flush_interval = flush_interval
+        self._carts: Dict[Tuple[str, str, str], int] = defaultdict(int)
+
+    def count_cart(self, guild_id: Optional[int]):
+        # chamado quando um carrinho ganha o primeiro item (não bloqueia)
+        self._carts[(str(guild_id or ""), datetime.utcnow().date().isoformat(), "carrinho")] += 1
+
+    async def flush(self):
+        counts, self._carts = self._carts, defaultdict(int)
+        try:
+            await self.db.count_funnel(counts)
+        except Exception as e:
+            # devolve os contadores para a próxima tentativa
+            for key, n in counts.items():
+                self._carts[key] += n
+            metrics.record_error("analytics", "Relatórios: falha ao gravar contadores:", e)
+
+    async def run_flusher(self):
+        try:
+            while True:
+                await asyncio.sleep(self.flush_interval)
+                await self.flush()
+        finally:
+            await self.flush()
+
+    async def backfill(self, chunk: int = 500) -> int:
+        """Soma aos agregados os pedidos anteriores a eles, em lotes de `chunk`.
+
+        Retoma do cursor salvo em job_state; depois de terminado não faz nada.
+        """
+        cursor = await self.db.get_job_state("analytics_backfill")
+        if cursor == "done":
+            return 0
+        since = await self.db.get_job_state("analytics_since") or ""
+        after, total = int(cursor or 0), 0
+        while True:
+            last, n = await self.db.backfill_analytics(after, since, chunk)
+            total += n
+            if last is None:
+                break
+            after = last
+        ANALYTICS_BACKFILLED.inc(total)
+        return total
+
+    async def report(self, guild_id: Optional[int], start: str, end: str, top: int = 10) -> dict:
+        # [start, end) em dias 'AAAA-MM-DD'
+        rows = await self.db.sales_by_day(guild_id, start, end)
+        top_rows = await self.db.sales_by_sku(guild_id, start, end, top)
+        funnel = await self.db.funnel(guild_id, start, end)
+        daily: Dict[str, Dict[str, float]] = {}
+        for r in rows:
+            d = daily.setdefault(r["day"], {"revenue": 0.0, "units": 0})
+            d["revenue"] += r["revenue"]
+            d["units"] += r["units"]
+        paid, revenue = funnel.get("pago", (0, 0.0))
+        carts = funnel.get("carrinho", (0, 0.0))[0]
+        orders = funnel.get("pedido", (0, 0.0))[0]
+        return {
+            "guild_id": str(guild_id or ""),
+            "start": start,
+            "end": end,
+            "revenue": round(revenue, 2),
+            "paid_orders": paid,
+            "units": sum(d["units"] for d in daily.values()),
+            "average_ticket": round(revenue / paid, 2) if paid else 0.0,
+            "conversion": {
+                "cart_to_paid": round(paid / carts, 4) if carts else None,
+                "order_to_paid": round(paid / orders, 4) if orders else None,
+            },
+            "funnel": {stage: {"count": n, "amount": round(amount, 2)} for stage, (n, amount) in funnel.items()},
+            "top_skus": [
+                {"sku": r["sku"], "units": r["units"], "revenue": round(r["revenue"], 2), "orders": r["orders"]}
+                for r in top_rows
+            ],
+            "daily": [{"day": day, "revenue": round(d["revenue"], 2), "units": d["units"]} for day, d in sorted(daily.items())],
+        }
+
+    async def sales_csv(self, guild_id: Optional[int], start: str, end: str) -> str:
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["day", "sku", "units", "revenue", "orders"])
+        for r in await self.db.sales_by_day(guild_id, start, end):
+            writer.writerow([r["day"], r["sku"], r["units"], f"{r['revenue']:.2f}", r["orders"]])
+        return out.getvalue()
\ No newline at end of file
@@ -1,21 +1,138 @@
-from typing import Dict, Tuple
+import asyncio
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Set, Tuple
 from ..db import StoreDB
+from ..formatting import brl
+from ..models import Product
 
+# carrinho por (guild_id, user_id): cada guild é uma loja separada
+CartKey = Tuple[int, int]
 
-def brl(value: float) -> str:
-    return f"R$ {value:,.2f}".replace(",", "_").replace(".", ",").replace("_", ".")
 
+class CartStore:
+    """Cache write-behind dos carrinhos.
 
+    Os carrinhos quentes ficam em memória (LRU com TTL) e as operações de item
+    são atômicas sob um lock, então cliques duplos não perdem incrementos. As
+    alterações são apenas marcadas como sujas e gravadas em lote por `flush()`,
+    chamado periodicamente por `run_flusher()` e no encerramento.
+    """
 
+    def __init__(self, db: StoreDB, max_entries: int = 10_000, ttl: float = 900.0, flush_interval: float = 2.0):
+        self.db = db
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.flush_interval = flush_interval
+        # threading.Lock e não asyncio.Lock: o store pode ser usado por mais de um event loop
+        self._lock = threading.Lock()
+        self._carts: "OrderedDict[CartKey, Dict[str, int]]" = OrderedDict()
+        self._touched: Dict[CartKey, float] = {}
+        self._dirty: Set[CartKey] = set()
 
-def cart_summary(db: StoreDB, user_id: int) -> Tuple[str, float, Dict[str,int]]:
-    items = db.get_cart(user_id)
+    async def _load(self, key: CartKey) -> None:
+        with self._lock:
+            if key in self._carts:
+                return
+        items = await self.db.get_cart(*key)
+        with self._lock:
+            # outra corrotina pode ter carregado (e alterado) enquanto esperávamos
+            if key not in self._carts:
+                self._carts[key] = items
+                self._touched[key] = time.monotonic()
+
+    def _touch(self, key: CartKey) -> Dict[str, int]:
+        self._carts.move_to_end(key)
+        self._touched[key] = time.monotonic()
+        return self._carts[key]
+
+    def _evict(self) -> None:
+        # só descarta carrinhos limpos; os sujos saem depois do próximo flush
+        now = time.monotonic()
+        for key in list(self._carts):
+            over = len(self._carts) > self.max_entries
+            expired = now - self._touched[key] > self.ttl
+            if not over and not expired:
+                break
+            if key in self._dirty:
+                continue
+            del self._carts[key]
+            del self._touched[key]
+
+    async def get(self, key: CartKey) -> Dict[str, int]:
+        while True:
+            await self._load(key)
+            with self._lock:
+                # pode ter sido despejado por um flush em outra thread; recarrega
+                if key in self._carts:
+                    return dict(self._touch(key))
+
+    async def add_item(self, key: CartKey, sku: str, qty: int = 1) -> Dict[str, int]:
+        while True:
+            await self._load(key)
+            with self._lock:
+                if key not in self._carts:
+                    continue
+                items = self._touch(key)
+                new_qty = items.get(sku, 0) + qty
+                if new_qty > 0:
+                    items[sku] = new_qty
+                else:
+                    items.pop(sku, None)
+                self._dirty.add(key)
+                return dict(items)
+
+    async def remove_item(self, key: CartKey, sku: str, qty: int = 1) -> Dict[str, int]:
+        return await self.add_item(key, sku, -qty)
+
+    async def clear(self, key: CartKey) -> None:
+        with self._lock:
+            self._carts[key] = {}
+            self._touch(key)
+            self._dirty.add(key)
+
+    async def flush(self) -> int:
+        with self._lock:
+            snapshot = {key: dict(self._carts[key]) for key in self._dirty}
+            self._dirty.clear()
+        try:
+            await self.db.save_carts(snapshot)
+        except Exception:
+            with self._lock:
+                self._dirty.update(snapshot)
+            raise
+        finally:
+            with self._lock:
+                self._evict()
+        return len(snapshot)
+
+    async def run_flusher(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            try:
+                await self.flush()
+            except Exception as e:
+                print("Cart flush error:", e)
+
+
+async def cart_summary(
+    db: StoreDB,
+    key: CartKey,
+    items: Optional[Dict[str, int]] = None,
+    products: Optional[Dict[str, Product]] = None,
+) -> Tuple[str, float, Dict[str,int]]:
+    # quem já tem o carrinho/produtos em mãos passa adiante e evita reconsultar
+    if items is None:
+        items = await db.get_cart(*key)
     if not items:
         return "Seu carrinho está vazio.", 0.0, {}
+    if products is None:
+        products = await db.get_products(items)
     lines = []
     total = 0.0
     for sku, qty in items.items():
-        p = db.get_product(sku)
+        p = products.get(sku)
         if not p:
             continue
         subtotal = p.price * qty
@@ -0,0 +1,199 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import secrets
+import time
+from datetime import datetime
+from urllib.parse import quote
+from typing import Dict, List, Optional, Set
+
+import discord
+
+from .. import metrics
+from ..db import StoreDB
+
+DELIVERIES = metrics.counter("delivery_total", "Entregas por resultado", ("result",))
+DELIVERY_QUEUE = metrics.gauge("delivery_inflight", "Pedidos em entrega no momento")
+DELIVERY_SECONDS = metrics.histogram("delivery_seconds", "Duração de uma entrega (links + DM)")
+DOWNLOADS = metrics.counter("download_requests_total", "Acessos à rota de download por resultado", ("result",))
+
+# limite de caracteres de uma mensagem do Discord, com folga
+_DM_LIMIT = 1900
+
+
+def sign_download(secret: bytes, order_id: int, sku: str, expires: int) -> str:
+    mac = hmac.new(secret, f"{order_id}:{sku}:{expires}".encode(), hashlib.sha256).digest()
+    return base64.urlsafe_b64encode(mac[:18]).decode()
+
+
+def verify_download(secret: bytes, order_id: int, sku: str, expires: int, signature: str, now: Optional[float] = None) -> bool:
+    if expires < (now or time.time()):
+        return False
+    return hmac.compare_digest(sign_download(secret, order_id, sku, expires), signature)
+
+
+def download_secret(configured: str) -> bytes:
+    if configured:
+        return configured.encode()
+    # sem segredo configurado os links só valem até o próximo restart
+    print("⚠️ DELIVERY_SECRET não definido; usando um segredo temporário")
+    return secrets.token_bytes(32)
+
+
+def _chunks(lines: List[str], limit: int = _DM_LIMIT) -> List[str]:
+    out, current = [], ""
+    for line in lines:
+        if current and len(current) + len(line) + 1 > limit:
+            out.append(current)
+            current = ""
+        current = f"{current}\n{line}" if current else line
+    if current:
+        out.append(current)
+    return out
+
+
+class DeliveryEngine:
+    """Entrega automática dos pedidos pagos.
+
+    A fila é a própria tabela orders (delivery_status='pendente', marcado na
+    mesma escrita que põe o pedido em "pago"), então nada se perde num
+    restart. Um alimentador reserva lotes ('entregando', seguro com vários
+    processos) e `workers` tarefas montam os links assinados e mandam a DM,
+    com retry e backoff.
+    """
+
+    def __init__(self, db: StoreDB, notifier, secret: bytes, base_url: str, link_ttl: float,
+                 workers: int = 16, retries: int = 3, backoff: float = 2.0, batch_size: int = 200, poll_interval: float = 5.0):
+        self.db = db
+        self.notifier = notifier
+        self.secret = secret
+        self.base_url = base_url
+        self.link_ttl = link_ttl
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._queue: "asyncio.Queue" = asyncio.Queue(workers * 4)
+        self._inflight: Set[int] = set()
+        self._wake = asyncio.Event()
+        self._tasks: list = []
+        metrics.REGISTRY.on_collect(lambda: DELIVERY_QUEUE.set(len(self._inflight)))
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._feeder(), name="delivery-feeder")]
+            self._tasks += [asyncio.create_task(self._worker(), name=f"delivery-{i}") for i in range(self.workers)]
+
+    def wake(self):
+        self._wake.set()
+
+    async def close(self, timeout: float = 10.0):
+        # para de reservar e deixa os workers entregarem o que já está na fila (até `timeout`)
+        if self._tasks:
+            feeder, workers = self._tasks[0], self._tasks[1:]
+            feeder.cancel()
+            await asyncio.gather(feeder, return_exceptions=True)
+            try:
+                await asyncio.wait_for(self._queue.join(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            for t in workers:
+                t.cancel()
+            await asyncio.gather(*workers, return_exceptions=True)
+        self._tasks = []
+        # devolve as reservas para outro worker (ou o próximo start) pegar já
+        if self._inflight:
+            try:
+                await self.db.release_deliveries(self._inflight)
+            except Exception as e:
+                metrics.record_error("delivery", "Entrega: falha ao devolver reservas:", e)
+            self._inflight.clear()
+
+    def link(self, order_id: int, sku: str, expires: int) -> str:
+        sig = sign_download(self.secret, order_id, sku, expires)
+        return f"{self.base_url}/download/{order_id}/{quote(sku, safe='')}?exp={expires}&sig={sig}"
+
+    async def _feeder(self):
+        while True:
+            # limpa antes de reservar: um wake() durante a reserva dispara outra
+            self._wake.clear()
+            free = self._queue.maxsize - self._queue.qsize()
+            try:
+                rows = await self.db.claim_deliveries(max(1, min(free, self.batch_size)))
+            except Exception as e:
+                metrics.record_error("delivery", "Entrega: falha ao ler fila:", e)
+                rows = []
+            for r in rows:
+                self._inflight.add(r["id"])
+                await self._queue.put(r)
+            if rows:
+                continue
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    async def _worker(self):
+        while True:
+            row = await self._queue.get()
+            try:
+                status = await self._deliver_with_retry(row)
+                await self.db.finish_delivery(row["id"], status)
+                DELIVERIES.inc(result=status)
+            except Exception as e:
+                metrics.record_error("delivery", f"Entrega: falha no pedido #{row['id']}:", e)
+            finally:
+                self._inflight.discard(row["id"])
+                self._queue.task_done()
+
+    async def _deliver_with_retry(self, row) -> str:
+        user_id = int(row["user_id"])
+        # mensagens montadas uma vez (mesmos links em todas as tentativas);
+        # `sent` conta as já enviadas para retomar do primeiro trecho pendente
+        chunks: Optional[List[str]] = None
+        sent = 0
+        for attempt in range(self.retries + 1):
+            try:
+                with DELIVERY_SECONDS.time(), metrics.span("delivery", order_id=row["id"]):
+                    if chunks is None:
+                        chunks = await self.messages(row["id"], json.loads(row["items_json"]) or {})
+                    while sent < len(chunks):
+                        await self.notifier.send_dm(user_id, chunks[sent])
+                        sent += 1
+                return "entregue"
+            except discord.Forbidden:
+                # DM fechada: não adianta repetir; fica para reentrega manual
+                return "falhou"
+            except Exception as e:
+                if attempt >= self.retries:
+                    metrics.record_error("delivery", f"Entrega: pedido #{row['id']} desistiu após {attempt + 1} tentativas:", e)
+                    return "falhou"
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+        return "falhou"
+
+    async def deliver(self, order_id: int, user_id: int, items: Dict[str, int]):
+        for content in await self.messages(order_id, items):
+            await self.notifier.send_dm(user_id, content)
+
+    async def messages(self, order_id: int, items: Dict[str, int]) -> List[str]:
+        # uma consulta para todos os SKUs do pedido
+        products = await self.db.get_product_rows(items)
+        expires = int(time.time() + self.link_ttl)
+        until = datetime.utcfromtimestamp(expires).strftime("%d/%m %H:%M UTC")
+        lines = [f"✅ Pagamento do Pedido #{order_id} confirmado! Seus downloads (válidos até {until}):"]
+        manual = []
+        for sku in items:
+            p = products.get(sku)
+            if p is not None and p["delivery_url"]:
+                lines.append(f"• **{p['name']}**: {self.link(order_id, sku, expires)}")
+            else:
+                manual.append(p["name"] if p is not None else sku)
+        if manual:
+            lines.append("Nosso time vai entregar manualmente: " + ", ".join(manual))
+        return _chunks(lines)
+
+    def stats(self) -> Dict[str, int]:
+        return {"inflight": len(self._inflight), "queued": self._queue.qsize()}
\ No newline at end of file
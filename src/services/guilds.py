@@ -0,0 +1,57 @@
+import time
+from dataclasses import dataclass, replace
+from typing import Dict, Optional, Tuple
+
+from ..db import StoreDB
+
+
+@dataclass(frozen=True)
+class GuildConfig:
+    cart_category_id: Optional[int] = None
+    order_log_channel_id: Optional[int] = None
+
+
+class GuildSettings:
+    """Configuração por guild (categoria dos carrinhos, canal de log de pedidos).
+
+    A tabela guild_settings é a fonte da verdade; aqui fica um cache com
+    validade de `ttl` segundos, porque quem lê pode não ser o processo que
+    alterou (o webhook de qualquer worker procura o canal de log da guild do
+    pedido). Campos não configurados caem em `defaults`, que vêm das variáveis
+    de ambiente da instalação de uma guild só e por isso valem apenas para
+    `default_guild_id` (DISCORD_GUILD_ID); as outras guilds começam vazias.
+    """
+
+    def __init__(self, db: StoreDB, defaults: GuildConfig = GuildConfig(), ttl: float = 60.0, default_guild_id: Optional[int] = None):
+        self.db = db
+        self.defaults = defaults
+        self.default_guild_id = default_guild_id
+        self.ttl = ttl
+        self._cache: Dict[int, Tuple[float, GuildConfig]] = {}
+
+    def _base(self, guild_id: Optional[int]) -> GuildConfig:
+        # o canal de log/categoria do .env é de uma guild; aplicá-lo a outra
+        # mandaria os pedidos dela para um canal alheio
+        return self.defaults if guild_id and guild_id == self.default_guild_id else GuildConfig()
+
+    async def get(self, guild_id: Optional[int]) -> GuildConfig:
+        if not guild_id:
+            return GuildConfig()
+        hit = self._cache.get(guild_id)
+        if hit and time.monotonic() - hit[0] < self.ttl:
+            return hit[1]
+        row = await self.db.get_guild_settings(guild_id)
+        config = self._base(guild_id)
+        if row is not None:
+            config = replace(
+                config,
+                cart_category_id=int(row["cart_category_id"]) if row["cart_category_id"] else config.cart_category_id,
+                order_log_channel_id=int(row["order_log_channel_id"]) if row["order_log_channel_id"] else config.order_log_channel_id,
+            )
+        self._cache[guild_id] = (time.monotonic(), config)
+        return config
+
+    async def update(self, guild_id: int, cart_category_id: Optional[int] = None, order_log_channel_id: Optional[int] = None) -> GuildConfig:
+        await self.db.set_guild_settings(guild_id, cart_category_id=cart_category_id, order_log_channel_id=order_log_channel_id)
+        self._cache.pop(guild_id, None)
+        return await self.get(guild_id)
\ No newline at end of file
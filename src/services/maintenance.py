@@ -0,0 +1,126 @@
+import asyncio
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional
+
+from .. import metrics
+from ..db import StoreDB
+from .orders import CLOSED_STATUSES, ORDER_TRANSITIONS, map_psp_status
+from .payments import PaymentGateway
+
+MAINTENANCE_ACTIONS = metrics.counter("order_maintenance_total", "Ações dos jobs de manutenção de pedidos", ("job",))
+
+
+class OrderMaintenance:
+    """Jobs periódicos sobre pedidos, rodando dentro do processo do bot.
+
+    - reconcile: consulta o PSP pelos pedidos em aberto há mais de
+      `reconcile_after` e enfileira em webhook_events as mudanças que o
+      webhook não entregou;
+    - expire: enfileira "expirado" para pedidos em aberto há mais de
+      `pending_ttl`;
+    - archive: move pedidos encerrados há mais de `archive_after` para
+      orders_history e limpa eventos de webhook já resolvidos.
+
+    As transições passam pela mesma fila do /webhook/mp, então o
+    WebhookProcessor aplica com as mesmas regras (compare-and-set, transições
+    válidas, notificação). Cada lote grava seu cursor em job_state: um restart
+    continua de onde parou.
+    """
+
+    def __init__(self, db: StoreDB, payments: PaymentGateway, pending_ttl: timedelta, reconcile_after: timedelta,
+                 archive_after: Optional[timedelta] = None, concurrency: int = 4, batch_size: int = 100, interval: float = 300.0):
+        self.db = db
+        self.payments = payments
+        self.pending_ttl = pending_ttl
+        self.reconcile_after = reconcile_after
+        self.archive_after = archive_after
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.interval = interval
+        self.last_run: Dict[str, int] = {}
+
+    async def _cursor(self, name: str) -> int:
+        return int(await self.db.get_job_state(name) or 0)
+
+    async def reconcile(self) -> int:
+        created_before = datetime.utcnow() - self.reconcile_after
+        gate = asyncio.Semaphore(self.concurrency)
+
+        async def check(row) -> List[tuple]:
+            ref = row["external_ref"] or str(row["id"])
+            async with gate:
+                try:
+                    payments = await self.payments.search_payments(ref)
+                except Exception as e:
+                    # fica para a próxima volta do cursor
+                    metrics.record_error("reconcile", f"Reconciliação: falha ao consultar pedido #{row['id']}:", e)
+                    return []
+            events = []
+            for p in payments:
+                status = map_psp_status(p.get("status", ""))
+                if status in ORDER_TRANSITIONS:
+                    events.append((f"psp:{p['id']}:{status}", row["id"], status, {"source": "reconcile", "payment_id": p["id"], "status": p["status"]}))
+            return events
+
+        queued = 0
+        cursor = await self._cursor("reconcile")
+        while True:
+            rows = await self.db.orders_to_reconcile(cursor, created_before, self.batch_size)
+            if not rows:
+                # fim da passada: a próxima começa do início
+                await self.db.set_job_state("reconcile", "0")
+                break
+            results = await asyncio.gather(*(check(r) for r in rows))
+            queued += await self.db.enqueue_webhook_events([ev for events in results for ev in events])
+            cursor = rows[-1]["id"]
+            await self.db.set_job_state("reconcile", str(cursor))
+        MAINTENANCE_ACTIONS.inc(queued, job="reconcile")
+        return queued
+
+    async def expire(self) -> int:
+        created_before = datetime.utcnow() - self.pending_ttl
+        queued = 0
+        cursor = await self._cursor("expire")
+        while True:
+            rows = await self.db.stale_orders(cursor, created_before, self.batch_size)
+            if not rows:
+                await self.db.set_job_state("expire", "0")
+                break
+            queued += await self.db.enqueue_webhook_events(
+                (f"expire:{r['id']}", r["id"], "expirado", {"source": "expiry"}) for r in rows
+            )
+            cursor = rows[-1]["id"]
+            await self.db.set_job_state("expire", str(cursor))
+        MAINTENANCE_ACTIONS.inc(queued, job="expire")
+        return queued
+
+    async def archive(self) -> int:
+        if self.archive_after is None:
+            return 0
+        before = datetime.utcnow() - self.archive_after
+        archived = 0
+        while True:
+            moved = await self.db.archive_orders(CLOSED_STATUSES, before, self.batch_size)
+            archived += moved
+            if moved < self.batch_size:
+                break
+        while await self.db.prune_webhook_events(before, 1000) == 1000:
+            pass
+        MAINTENANCE_ACTIONS.inc(archived, job="archive")
+        return archived
+
+    async def run_once(self) -> Dict[str, int]:
+        # reconcilia antes de expirar: um pedido pago sem webhook não deve expirar
+        out = {}
+        for name, job in (("reconciled", self.reconcile), ("expired", self.expire), ("archived", self.archive)):
+            try:
+                out[name] = await job()
+            except Exception as e:
+                metrics.record_error("maintenance", f"Manutenção de pedidos ({name}) falhou:", e)
+        self.last_run = out
+        return out
+
+    async def run(self):
+        while True:
+            await self.run_once()
+            await asyncio.sleep(self.interval)
\ No newline at end of file
@@ -0,0 +1,126 @@
+import asyncio
+import time
+from collections import defaultdict
+from concurrent.futures import Future
+from typing import Any, Awaitable, Callable, Dict, Optional, Tuple
+
+import discord
+
+from .. import metrics
+
+NOTIFY_SENDS = metrics.counter("discord_notify_total", "Envios do Notifier por rota e resultado", ("route", "result"))
+NOTIFY_SECONDS = metrics.histogram("discord_notify_seconds", "Duração de um envio do Notifier (inclui espera do rate limit e retries)", ("route",))
+
+# rota -> (envios por segundo, rajada); valores conservadores abaixo dos limites do Discord
+DEFAULT_BUDGETS: Dict[str, Tuple[float, int]] = {
+    "dm": (5.0, 10),
+    "log": (1.0, 5),
+    "default": (10.0, 20),
+}
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return
+            await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class Notifier:
+    """Ponte entre qualquer loop/thread e o event loop do bot.
+
+    `call()` agenda a corrotina no loop do bot (run_coroutine_threadsafe) e
+    devolve o resultado para o loop de quem chamou. Cada rota tem seu próprio
+    orçamento de envios (token bucket, consumido no loop do bot) e falhas
+    transitórias do Discord são repetidas com backoff.
+    """
+
+    def __init__(self, client: discord.Client, budgets: Dict[str, Tuple[float, int]] = None, retries: int = 3, backoff: float = 1.0):
+        self.client = client
+        self.retries = retries
+        self.backoff = backoff
+        # orçamentos parciais completam os padrões (a rota "default" sempre existe)
+        merged = {**DEFAULT_BUDGETS, **(budgets or {})}
+        self._budgets = {route: TokenBucket(rate, burst) for route, (rate, burst) in merged.items()}
+        self.counts: Dict[str, int] = defaultdict(int)
+
+    def _bot_loop(self):
+        loop = getattr(self.client, "loop", None)
+        return loop if isinstance(loop, asyncio.AbstractEventLoop) and loop.is_running() else None
+
+    def submit(self, route: str, factory: Callable[[], Awaitable[Any]]) -> Future:
+        loop = self._bot_loop()
+        if loop is None:
+            raise RuntimeError("bot ainda não iniciado")
+        return asyncio.run_coroutine_threadsafe(self._run(route, factory), loop)
+
+    async def call(self, route: str, factory: Callable[[], Awaitable[Any]], ready_timeout: float = 60.0) -> Any:
+        # espera o bot subir (o webhook pode chegar antes do login)
+        deadline = time.monotonic() + ready_timeout
+        while self._bot_loop() is None:
+            if time.monotonic() > deadline:
+                raise RuntimeError("bot não ficou pronto a tempo")
+            await asyncio.sleep(0.5)
+        return await asyncio.wrap_future(self.submit(route, factory))
+
+    def _count(self, route: str, result: str):
+        self.counts[f"{route}.{result}"] += 1
+        NOTIFY_SENDS.inc(route=route, result=result)
+
+    async def _run(self, route: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        await self.client.wait_until_ready()
+        with NOTIFY_SECONDS.time(route=route):
+            return await self._send(route, factory)
+
+    async def _send(self, route: str, factory: Callable[[], Awaitable[Any]]) -> Any:
+        bucket = self._budgets.get(route) or self._budgets["default"]
+        for attempt in range(self.retries + 1):
+            await bucket.acquire()
+            try:
+                result = await factory()
+            except discord.Forbidden:
+                # DM fechada, sem permissão no canal: não adianta repetir
+                self._count(route, "forbidden")
+                raise
+            except (discord.HTTPException, OSError, asyncio.TimeoutError) as e:
+                status = getattr(e, "status", 0)
+                if (status and 400 <= status < 500 and status != 429) or attempt >= self.retries:
+                    self._count(route, "failed")
+                    raise
+                self._count(route, "retried")
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+            else:
+                self._count(route, "sent")
+                return result
+
+    # atalhos usados pelo webhook
+    async def send_dm(self, user_id: int, content: str):
+        async def send():
+            user = self.client.get_user(user_id) or await self.client.fetch_user(user_id)
+            return await user.send(content)
+        return await self.call("dm", send)
+
+    def post_log(self, channel_id: int, embed: discord.Embed, guild_id: Optional[int] = None):
+        # entra no lote de log do Outbox do bot (até 10 embeds por mensagem)
+        loop = self._bot_loop()
+        if loop is None:
+            raise RuntimeError("bot ainda não iniciado")
+        self._count("log", "queued")
+        loop.call_soon_threadsafe(self.client.outbox.log, channel_id, embed, guild_id)
+
+    async def send_to_channel(self, channel_id: int, route: str = "log", **kwargs):
+        async def send():
+            channel = self.client.get_channel(channel_id) or await self.client.fetch_channel(channel_id)
+            return await channel.send(**kwargs)
+        return await self.call(route, send)
\ No newline at end of file
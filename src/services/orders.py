@@ -0,0 +1,45 @@
+from typing import Dict, Iterable, Optional
+
+# status do PSP -> status interno do pedido
+MP_STATUS_MAP = {
+    "approved": "pago",
+    "rejected": "pagamento_recusado",
+    "pending": "aguardando_pagamento",
+    "in_process": "aguardando_pagamento",
+    "cancelled": "expirado",
+}
+
+# transições válidas; "pago" é terminal. Um pagamento aprovado depois da
+# expiração ainda vale (o dinheiro entrou), por isso expirado -> pago.
+ORDER_TRANSITIONS: Dict[str, frozenset] = {
+    "pendente": frozenset({"aguardando_pagamento", "pagamento_recusado", "pago", "expirado"}),
+    "aguardando_pagamento": frozenset({"pagamento_recusado", "pago", "expirado"}),
+    "pagamento_recusado": frozenset({"aguardando_pagamento", "pago"}),
+    "expirado": frozenset({"pago"}),
+    "pago": frozenset(),
+}
+
+# status que não esperam mais nada do cliente; candidatos a arquivamento
+CLOSED_STATUSES = ("pago", "expirado", "pagamento_recusado")
+
+
+def map_psp_status(status: str) -> str:
+    return MP_STATUS_MAP.get(status, status)
+
+
+def can_transition(current: str, target: str) -> bool:
+    return target in ORDER_TRANSITIONS.get(current, frozenset())
+
+
+def fold_transitions(current: str, targets: Iterable[str]) -> Optional[str]:
+    """Aplica em ordem as transições válidas e devolve o status final.
+
+    Várias atualizações do mesmo pedido viram uma única escrita; as inválidas
+    (fora de sequência, repetidas, desconhecidas) são ignoradas. Devolve None
+    se nada muda.
+    """
+    status = current
+    for target in targets:
+        if can_transition(status, target):
+            status = target
+    return status if status != current else None
\ No newline at end of file
@@ -0,0 +1,188 @@
+import asyncio
+from collections import defaultdict, deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import discord
+
+from .. import metrics
+from .notifier import TokenBucket
+
+# embeds por mensagem aceitos pelo Discord
+MAX_EMBEDS = 10
+
+OUTBOX_OPS = metrics.counter("outbox_ops_total", "Operações do Outbox por tipo e resultado", ("op", "result"))
+OUTBOX_COALESCED = metrics.counter("outbox_coalesced_total", "Atualizações absorvidas por outra (carrinho) ou agrupadas (log)", ("op",))
+OUTBOX_PENDING = metrics.gauge("outbox_pending", "Itens aguardando envio no Outbox")
+
+
+class _ChannelQueue:
+    def __init__(self, rate: float, burst: int):
+        self.channel = None
+        self.cart: Optional[Tuple[Optional[str], discord.Embed]] = None
+        self.sends: Deque[dict] = deque()
+        # (guild do pedido, embed): só sai se o canal for dessa guild
+        self.logs: List[Tuple[Optional[int], discord.Embed]] = []
+        self.bucket = TokenBucket(rate, burst)
+        self.task: Optional[asyncio.Task] = None
+
+    def pending(self) -> int:
+        return (self.cart is not None) + len(self.sends) + len(self.logs)
+
+
+class Outbox:
+    """Fila de saída por canal para mensagens do bot.
+
+    Os handlers só enfileiram (chamadas síncronas, sem await) e seguem; um
+    task por canal com trabalho pendente espera `window` segundos para juntar
+    rajadas e então envia respeitando o orçamento do canal e o global:
+
+    - update_cart: só o último estado importa; vira um edit da mensagem
+      fixada do carrinho (criada e fixada na primeira vez);
+    - log: embeds acumulados saem juntos, até 10 por mensagem, e só num
+      canal da guild do pedido;
+    - send: mensagens avulsas, na ordem em que chegaram.
+    """
+
+    def __init__(self, client: discord.Client, cart_messages, window: float = 0.5,
+                 channel_budget: Tuple[float, int] = (1.0, 5), global_budget: Tuple[float, int] = (40.0, 50),
+                 retries: int = 3, backoff: float = 1.0):
+        # cart_messages: quem guarda o id da mensagem fixada (CartChannelManager)
+        self.client = client
+        self.cart_messages = cart_messages
+        self.window = window
+        self.channel_budget = channel_budget
+        self.retries = retries
+        self.backoff = backoff
+        self._global = TokenBucket(*global_budget)
+        self._queues: Dict[int, _ChannelQueue] = {}
+        self.counts: Dict[str, int] = defaultdict(int)
+        metrics.REGISTRY.on_collect(lambda: OUTBOX_PENDING.set(self.pending()))
+
+    def _queue(self, channel_id: int, channel=None) -> _ChannelQueue:
+        q = self._queues.get(channel_id)
+        if q is None:
+            q = self._queues[channel_id] = _ChannelQueue(*self.channel_budget)
+        if channel is not None:
+            q.channel = channel
+        if q.task is None or q.task.done():
+            q.task = asyncio.create_task(self._drain(channel_id, q), name=f"outbox-{channel_id}")
+        return q
+
+    # Enfileiramento (não bloqueia)
+    def update_cart(self, channel: discord.abc.Messageable, content: Optional[str], embed: discord.Embed):
+        q = self._queue(channel.id, channel)
+        if q.cart is not None:
+            self.counts["cart.coalesced"] += 1
+            OUTBOX_COALESCED.inc(op="cart")
+        q.cart = (content, embed)
+
+    def send(self, channel: discord.abc.Messageable, content: Optional[str] = None, **kwargs):
+        self._queue(channel.id, channel).sends.append(dict(content=content, **kwargs))
+
+    def log(self, channel_id: int, embed: discord.Embed, guild_id: Optional[int] = None):
+        q = self._queue(channel_id)
+        if q.logs:
+            OUTBOX_COALESCED.inc(op="log")
+        q.logs.append((guild_id, embed))
+
+    def pending(self) -> int:
+        return sum(q.pending() for q in self._queues.values())
+
+    # Envio
+    async def _drain(self, channel_id: int, q: _ChannelQueue):
+        await self.client.wait_until_ready()
+        await asyncio.sleep(self.window)
+        while q.pending():
+            if q.sends:
+                op, kwargs = "send", q.sends.popleft()
+                call = lambda channel: channel.send(**kwargs)
+            elif q.logs:
+                entries, q.logs = q.logs[:MAX_EMBEDS], q.logs[MAX_EMBEDS:]
+                op = "log"
+                call = lambda channel: self._send_logs(channel, entries)
+            else:
+                (content, embed), q.cart = q.cart, None
+                op = "cart"
+                call = lambda channel: self._edit_cart(channel, content, embed)
+            if not await self._deliver(channel_id, q, op, call):
+                # canal sumiu ou sem permissão: descarta o resto
+                dropped = q.pending()
+                q.cart, q.logs = None, []
+                q.sends.clear()
+                self.counts["dropped"] += dropped
+                break
+        if self._queues.get(channel_id) is q and not q.pending():
+            del self._queues[channel_id]
+
+    async def _deliver(self, channel_id: int, q: _ChannelQueue, op: str, call) -> bool:
+        for attempt in range(self.retries + 1):
+            await q.bucket.acquire()
+            await self._global.acquire()
+            try:
+                channel = q.channel or self.client.get_channel(channel_id) or await self.client.fetch_channel(channel_id)
+                q.channel = channel
+                await call(channel)
+            except (discord.NotFound, discord.Forbidden) as e:
+                self._count(op, "gone")
+                print(f"Outbox: canal {channel_id} indisponível:", e)
+                return False
+            except (discord.HTTPException, OSError, asyncio.TimeoutError) as e:
+                status = getattr(e, "status", 0)
+                if (status and 400 <= status < 500 and status != 429) or attempt >= self.retries:
+                    self._count(op, "failed")
+                    print(f"Outbox: falha ao enviar ({op}) no canal {channel_id}:", e)
+                    return True
+                self._count(op, "retried")
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+            else:
+                self._count(op, "sent")
+                return True
+        return True
+
+    async def _send_logs(self, channel, entries: List[Tuple[Optional[int], discord.Embed]]):
+        guild = getattr(channel, "guild", None)
+        embeds = [embed for guild_id, embed in entries if guild_id is None or (guild is not None and guild.id == guild_id)]
+        if len(embeds) < len(entries):
+            # canal de log configurado aponta para outra guild: não vaza o pedido
+            self._count("log", "foreign")
+            print(f"Outbox: {len(entries) - len(embeds)} log(s) descartado(s); canal {channel.id} não é da guild do pedido")
+        if embeds:
+            await channel.send(embeds=embeds)
+
+    async def _edit_cart(self, channel, content: Optional[str], embed: discord.Embed):
+        message_id = self.cart_messages.cart_message(channel.id)
+        if message_id:
+            try:
+                await channel.get_partial_message(message_id).edit(content=content, embed=embed)
+                return
+            except discord.NotFound:
+                # mensagem apagada pelo usuário: cria outra
+                pass
+        message = await channel.send(content=content, embed=embed)
+        try:
+            await message.pin()
+        except discord.HTTPException:
+            # sem permissão de fixar ou limite de pins: segue só editando
+            pass
+        await self.cart_messages.set_cart_message(channel.id, message.id)
+
+    def _count(self, op: str, result: str):
+        self.counts[f"{op}.{result}"] += 1
+        OUTBOX_OPS.inc(op=op, result=result)
+
+    def stats(self) -> Dict[str, int]:
+        out: Dict[str, int] = dict(self.counts)
+        out["pending"] = self.pending()
+        out["channels"] = len(self._queues)
+        return out
+
+    async def close(self, timeout: float = 10.0):
+        # envia o que ainda está na fila (sem esperar a janela de agrupamento)
+        self.window = 0
+        tasks = [q.task for q in self._queues.values() if q.task and not q.task.done()]
+        if tasks:
+            done, pending = await asyncio.wait(tasks, timeout=timeout)
+            for t in pending:
+                t.cancel()
+            # espera o cancelamento terminar antes do cliente fechar a sessão
+            await asyncio.gather(*pending, return_exceptions=True)
\ No newline at end of file
@@ -1,32 +1,224 @@
-from typing import Optional
-from ..config import MP_ACCESS_TOKEN
+import asyncio
+import hashlib
+import itertools
+import json
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import aiohttp
+
+from .. import metrics
+from ..config import MP_ACCESS_TOKEN, PAYMENT_BACKEND, PAYMENT_TIMEOUT_SECONDS, PAYMENT_MAX_CONCURRENCY, FAKE_PSP_LATENCY_MS
+
+# Abstração simples para pagamento. Você pode plugar outros PSPs futuramente:
+# basta um backend com `async create_preference(data, idempotency_key)` que devolva
+# o JSON da preferência (com init_point) e `async search_payments(external_reference)`
+# que devolva os pagamentos da referência (dicts com "id" e "status").
+
+MP_PREFERENCES_URL = "https://api.mercadopago.com/checkout/preferences"
+MP_PAYMENTS_SEARCH_URL = "https://api.mercadopago.com/v1/payments/search"
+
+PSP_SECONDS = metrics.histogram("psp_request_seconds", "Latência das chamadas ao PSP", ("backend", "outcome"))
+PSP_SLOT_WAIT_SECONDS = metrics.histogram("psp_slot_wait_seconds", "Espera por uma vaga no limite de chamadas simultâneas ao PSP")
+
+
+class PaymentError(Exception):
+    pass
+
+
+@dataclass
+class PaymentLink:
+    order_id: int
+    url: str
+    preference_id: Optional[str]
+    expires_at: float
+
+
+def idempotency_key(user_id: int, items: Dict[str, int], amount: float, guild_id: Optional[int] = None) -> str:
+    # mesmo cliente + mesmos itens + mesmo total (na mesma guild) => mesma preferência
+    parts = [str(user_id), sorted(items.items()), f"{amount:.2f}"]
+    if guild_id:
+        parts.append(str(guild_id))
+    payload = json.dumps(parts)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+class MercadoPagoBackend:
+    def __init__(self, access_token: str, timeout: float, max_connections: int):
+        self.access_token = access_token
+        self.timeout = timeout
+        self.max_connections = max_connections
+        self._session = None
+
+    def _get_session(self):
+        # sessão criada sob demanda, dentro do loop que vai usá-la
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.max_connections, ttl_dns_cache=300),
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                headers={"Authorization": f"Bearer {self.access_token}"},
+            )
+        return self._session
+
+    async def create_preference(self, data: dict, idempotency_key: Optional[str] = None) -> dict:
+        headers = {"X-Idempotency-Key": idempotency_key} if idempotency_key else {}
+        async with self._get_session().post(MP_PREFERENCES_URL, json=data, headers=headers) as resp:
+            body = await resp.json(content_type=None)
+            if resp.status >= 400:
+                raise PaymentError(f"Mercado Pago respondeu {resp.status}: {body}")
+            return body
+
+    async def search_payments(self, external_reference: str) -> List[dict]:
+        params = {"external_reference": external_reference, "sort": "date_created", "criteria": "asc"}
+        async with self._get_session().get(MP_PAYMENTS_SEARCH_URL, params=params) as resp:
+            body = await resp.json(content_type=None)
+            if resp.status >= 400:
+                raise PaymentError(f"Mercado Pago respondeu {resp.status}: {body}")
+            return body.get("results") or []
+
+    async def close(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+class FakePSP:
+    """PSP local para testes de carga offline: dorme e devolve links falsos; settle() simula pagamentos."""
+
+    def __init__(self, latency: float = 0.05, jitter: float = 0.0, fail_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.fail_rate = fail_rate
+        self.calls = 0
+        self._ids = itertools.count(1)
+        # external_reference -> pagamentos; preenchido por settle()
+        self.payments: Dict[str, List[dict]] = {}
+
+    async def create_preference(self, data: dict, idempotency_key: Optional[str] = None) -> dict:
+        self.calls += 1
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if self.fail_rate and random.random() < self.fail_rate:
+            raise PaymentError("falha simulada do PSP")
+        pref_id = f"fake-{next(self._ids)}"
+        return {"id": pref_id, "init_point": f"https://psp.fake/checkout/{pref_id}"}
+
+    def settle(self, external_reference: str, status: str = "approved") -> dict:
+        # simula o cliente pagando (ou o PSP recusando) sem o webhook chegar
+        payment = {"id": f"fakepay-{next(self._ids)}", "status": status, "external_reference": external_reference}
+        self.payments.setdefault(external_reference, []).append(payment)
+        return payment
+
+    async def search_payments(self, external_reference: str) -> List[dict]:
+        self.calls += 1
+        await asyncio.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+        if self.fail_rate and random.random() < self.fail_rate:
+            raise PaymentError("falha simulada do PSP")
+        return list(self.payments.get(external_reference, []))
+
+    async def close(self):
+        pass
+
+
+class StubBackend:
+    # sem PSP configurado: não há preferência, usa o link de fallback
+    async def create_preference(self, data: dict, idempotency_key: Optional[str] = None) -> dict:
+        return {}
+
+    async def search_payments(self, external_reference: str) -> List[dict]:
+        return []
+
+    async def close(self):
+        pass
+
+
+def default_backend():
+    if PAYMENT_BACKEND == "fake":
+        return FakePSP(latency=FAKE_PSP_LATENCY_MS / 1000)
+    if MP_ACCESS_TOKEN and PAYMENT_BACKEND in ("", "mercadopago"):
+        return MercadoPagoBackend(MP_ACCESS_TOKEN, timeout=PAYMENT_TIMEOUT_SECONDS, max_connections=PAYMENT_MAX_CONCURRENCY)
+    return StubBackend()
 
-# Abstração simples para pagamento. Você pode plugar outros PSPs futuramente.
 
 class PaymentGateway:
-    def __init__(self):
-        self.mp = None
-        if MP_ACCESS_TOKEN:
+    """Gateway de longa duração: uma instância por processo.
+
+    Limita as chamadas simultâneas ao PSP, aplica timeout em cada uma e guarda
+    os links criados por `cache_key` (hash do conteúdo), para que um checkout
+    repetido com o mesmo conteúdo reaproveite a preferência já existente. Ao
+    PSP vai uma chave por pedido: um pedido novo com o mesmo carrinho ganha
+    uma preferência nova, e só as retentativas do mesmo pedido são deduplicadas.
+    """
+
+    def __init__(self, backend=None, timeout: float = PAYMENT_TIMEOUT_SECONDS, max_concurrency: int = PAYMENT_MAX_CONCURRENCY, cache_ttl: float = 1800.0):
+        self.backend = backend or default_backend()
+        self.timeout = timeout
+        self.cache_ttl = cache_ttl
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._links: Dict[str, PaymentLink] = {}
+
+    def reusable(self, key: str) -> Optional[PaymentLink]:
+        link = self._links.get(key)
+        if link and link.expires_at < time.monotonic():
+            del self._links[key]
+            return None
+        return link
+
+    def forget(self, key: str):
+        self._links.pop(key, None)
+
+    async def create_payment_link(self, order_id: int, title: str, description: str, amount: float, notification_url: Optional[str] = None, cache_key: Optional[str] = None) -> str:
+        preference_data = {
+            "items": [
+                {"title": title, "description": description, "quantity": 1, "currency_id": "BRL", "unit_price": float(amount)}
+            ],
+            "external_reference": str(order_id),
+        }
+        if notification_url:
+            preference_data["notification_url"] = notification_url
+        backend = type(self.backend).__name__
+        queued = time.monotonic()
+        async with self._semaphore:
+            started = time.monotonic()
+            PSP_SLOT_WAIT_SECONDS.observe(started - queued)
+            outcome = "error"
             try:
-                import mercadopago
-                self.mp = mercadopago.SDK(MP_ACCESS_TOKEN)
-            except Exception:
-                self.mp = None
-
-
-    def create_payment_link(self, order_id: int, title: str, description: str, amount: float, notification_url: Optional[str] = None) -> str:
-        # Se Mercado Pago estiver configurado, cria preferência de pagamento
-        if self.mp:
-            preference_data = {
-                "items": [
-                    {"title": title, "description": description, "quantity": 1, "currency_id": "BRL", "unit_price": float(amount)}
-                ],
-                "external_reference": str(order_id),
-            }
-            if notification_url:
-                preference_data["notification_url"] = notification_url
-            pref = self.mp.preference().create(preference_data)
-            # retorna init_point (web) ou sandbox_init_point
-            return pref.get("response", {}).get("init_point") or pref.get("response", {}).get("sandbox_init_point") or f"https://pagamento.exemplo/ordem/{order_id}"
-        # Fallback stub
-        return f"https://pagamento.exemplo/ordem/{order_id}"
\ No newline at end of file
+                psp_key = f"{order_id}:{cache_key}" if cache_key else str(order_id)
+                pref = await asyncio.wait_for(self.backend.create_preference(preference_data, psp_key), self.timeout)
+                outcome = "ok"
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                raise PaymentError(f"PSP não respondeu em {self.timeout:g}s")
+            finally:
+                PSP_SECONDS.observe(time.monotonic() - started, backend=backend, outcome=outcome)
+        # retorna init_point (web) ou sandbox_init_point
+        url = pref.get("init_point") or pref.get("sandbox_init_point") or f"https://pagamento.exemplo/ordem/{order_id}"
+        if cache_key:
+            self._remember(cache_key, PaymentLink(order_id, url, pref.get("id"), time.monotonic() + self.cache_ttl))
+        return url
+
+    async def search_payments(self, external_reference: str) -> List[dict]:
+        # mesma vaga/timeout das criações de preferência: a reconciliação não
+        # pode tirar capacidade do checkout além do limite do gateway
+        backend = type(self.backend).__name__
+        async with self._semaphore:
+            started = time.monotonic()
+            outcome = "error"
+            try:
+                payments = await asyncio.wait_for(self.backend.search_payments(external_reference), self.timeout)
+                outcome = "ok"
+                return payments
+            except asyncio.TimeoutError:
+                outcome = "timeout"
+                raise PaymentError(f"PSP não respondeu em {self.timeout:g}s")
+            finally:
+                PSP_SECONDS.observe(time.monotonic() - started, backend=backend, outcome=f"search_{outcome}")
+
+    def _remember(self, key: str, link: PaymentLink):
+        if len(self._links) >= 4096:
+            now = time.monotonic()
+            self._links = {k: v for k, v in self._links.items() if v.expires_at >= now}
+        self._links[key] = link
+
+    async def close(self):
+        await self.backend.close()
\ No newline at end of file
@@ -0,0 +1,113 @@
+import asyncio
+import time
+from collections import defaultdict, deque
+from typing import Awaitable, Callable, Deque, Dict, Optional
+
+from .. import metrics
+
+STAGE_SECONDS = metrics.histogram("pipeline_stage_seconds", "Latência por etapa/job do TaskPipeline (ack = clique até a resposta)", ("stage",))
+PIPELINE_JOBS = metrics.counter("pipeline_jobs_total", "Jobs do TaskPipeline por resultado", ("job", "result"))
+PIPELINE_QUEUE_DEPTH = metrics.gauge("pipeline_queue_depth", "Jobs aguardando na fila do TaskPipeline")
+PIPELINE_STAGE_ERRORS = metrics.counter("pipeline_stage_errors_total", "Tentativas de etapa que falharam (antes do retry)", ("stage",))
+
+Job = Callable[[], Awaitable[None]]
+
+
+def _percentile(samples, q: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class TaskPipeline:
+    """Fila limitada de trabalho em background para os handlers de interação.
+
+    O handler responde à interação na hora e entrega o trabalho lento (PSP,
+    criação de canal, envio de mensagens) para `submit()`. Dentro do job, cada
+    etapa roda via `stage()`, que aplica retry com backoff exponencial e
+    registra a latência por etapa.
+    """
+
+    def __init__(self, workers: int = 4, max_queue: int = 1000, retries: int = 3, backoff: float = 0.5, samples: int = 1000):
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self._queue: "asyncio.Queue[tuple[str, Job]]" = asyncio.Queue(max_queue)
+        self._tasks: list = []
+        self._latency: Dict[str, Deque[float]] = defaultdict(lambda: deque(maxlen=samples))
+        self._counts: Dict[str, int] = defaultdict(int)
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker(), name=f"pipeline-{i}") for i in range(self.workers)]
+            metrics.REGISTRY.on_collect(lambda: PIPELINE_QUEUE_DEPTH.set(self._queue.qsize()))
+
+    def submit(self, name: str, job: Job) -> bool:
+        try:
+            self._queue.put_nowait((name, job))
+        except asyncio.QueueFull:
+            self._counts[f"{name}.dropped"] += 1
+            PIPELINE_JOBS.inc(job=name, result="dropped")
+            return False
+        return True
+
+    def record(self, name: str, seconds: float):
+        self._latency[name].append(seconds)
+        STAGE_SECONDS.observe(seconds, stage=name)
+
+    def record_ack(self, created_at):
+        # latência clique -> ack, a partir do timestamp da interação no Discord
+        self.record("ack", max(0.0, time.time() - created_at.timestamp()))
+
+    async def stage(self, name: str, fn: Callable[[], Awaitable], retries: Optional[int] = None):
+        attempts = (self.retries if retries is None else retries) + 1
+        for attempt in range(attempts):
+            started = time.monotonic()
+            try:
+                # herda o trace_id do span aberto pelo job (se houver)
+                with metrics.span(f"stage.{name}", attempt=attempt):
+                    result = await fn()
+            except Exception:
+                self._counts[f"{name}.errors"] += 1
+                PIPELINE_STAGE_ERRORS.inc(stage=name)
+                if attempt + 1 >= attempts:
+                    raise
+                await asyncio.sleep(self.backoff * 2 ** attempt)
+            else:
+                self.record(name, time.monotonic() - started)
+                return result
+
+    async def _worker(self):
+        while True:
+            name, job = await self._queue.get()
+            started = time.monotonic()
+            try:
+                await job()
+                self._counts[f"{name}.ok"] += 1
+                PIPELINE_JOBS.inc(job=name, result="ok")
+            except Exception as e:
+                self._counts[f"{name}.failed"] += 1
+                PIPELINE_JOBS.inc(job=name, result="failed")
+                metrics.record_error("pipeline", f"Pipeline job {name} falhou:", e)
+            finally:
+                self.record(name, time.monotonic() - started)
+                self._queue.task_done()
+
+    def stats(self) -> Dict[str, float]:
+        out: Dict[str, float] = {"queue_depth": self._queue.qsize()}
+        out.update(self._counts)
+        for name, samples in self._latency.items():
+            if samples:
+                out[f"{name}.p50_ms"] = _percentile(samples, 0.50) * 1000
+                out[f"{name}.p99_ms"] = _percentile(samples, 0.99) * 1000
+        return out
+
+    async def close(self, timeout: float = 10.0):
+        # espera a fila esvaziar (até `timeout`) e encerra os workers
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        for t in self._tasks:
+            t.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
\ No newline at end of file
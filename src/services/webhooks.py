@@ -0,0 +1,156 @@
+import asyncio
+import hashlib
+import time
+from collections import defaultdict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from .. import metrics
+from ..db import StoreDB
+from .orders import fold_transitions
+
+# chamada depois que um pedido muda de status: notify(order_row, novo_status)
+Notify = Callable[[object, str], Awaitable[None]]
+
+WEBHOOK_EVENTS = metrics.counter("webhook_events_total", "Eventos de webhook processados, por resultado", ("result",))
+WEBHOOK_BATCH_SECONDS = metrics.histogram("webhook_batch_seconds", "Duração de um lote do WebhookProcessor")
+WEBHOOK_LAG_SECONDS = metrics.histogram("webhook_event_lag_seconds", "Tempo entre o recebimento do evento e o fim do processamento", buckets=(0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300))
+
+
+def webhook_event_id(payload: dict, order_id: int, status: str, body: bytes = b"") -> str:
+    # id do pagamento no PSP + status: um reenvio da mesma notificação é
+    # duplicado, uma nova mudança (ex.: recusa de outra tentativa) não. Mesmo
+    # formato dos eventos da reconciliação, que assim não repetem o webhook
+    data = payload.get("data")
+    payment_id = data.get("id") if isinstance(data, dict) else None
+    if payment_id:
+        return f"psp:{payment_id}:{status}"
+    event_id = payload.get("event_id") or payload.get("id")
+    if event_id:
+        return f"{event_id}:{status}"
+    # sem id: só um reenvio byte a byte igual é tratado como duplicado
+    return hashlib.sha256(f"{order_id}:{status}:".encode() + body).hexdigest()
+
+
+class WebhookProcessor:
+    """Consome a fila durável webhook_events.
+
+    O endpoint só grava o evento (deduplicado pelo event_id) e retorna; aqui os
+    workers pegam lotes, agrupam os eventos por pedido, aplicam apenas as
+    transições válidas numa única escrita por pedido e então notificam.
+    """
+
+    def __init__(self, db: StoreDB, notify: Optional[Notify] = None, workers: int = 2, batch_size: int = 50, poll_interval: float = 1.0, max_attempts: int = 5):
+        self.db = db
+        self.notify = notify
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self.max_attempts = max_attempts
+        self._wake = asyncio.Event()
+        self._tasks: list = []
+        self._closing = False
+        self.counts: Dict[str, int] = defaultdict(int)
+        self.last_batch_seconds = 0.0
+
+    def start(self):
+        if not self._tasks:
+            self._closing = False
+            self._tasks = [asyncio.create_task(self._worker(), name=f"webhook-{i}") for i in range(self.workers)]
+
+    def wake(self):
+        self._wake.set()
+
+    async def close(self, timeout: float = 10.0):
+        # deixa os workers terminarem o lote em andamento (até `timeout`);
+        # o que sobrar na fila fica para o próximo start
+        self._closing = True
+        self._wake.set()
+        if self._tasks:
+            _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+            for t in pending:
+                t.cancel()
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def _worker(self):
+        while not self._closing:
+            try:
+                processed = await self.process_batch()
+            except Exception as e:
+                metrics.record_error("webhook_worker", "Webhook worker error:", e)
+                processed = 0
+            if not processed and not self._closing:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def process_batch(self) -> int:
+        events = await self.db.claim_webhook_events(self.batch_size)
+        if not events:
+            return 0
+        started = time.monotonic()
+        by_order: Dict[int, List] = defaultdict(list)
+        for ev in events:
+            by_order[ev["order_id"]].append(ev)
+
+        states: Dict[str, str] = {}
+        for order_id, order_events in by_order.items():
+            try:
+                with metrics.span("webhook.apply", order_id=order_id, events=len(order_events)) as sp:
+                    applied = await self._apply(order_id, [ev["status"] for ev in order_events])
+                    sp["applied"] = applied
+            except Exception as e:
+                metrics.record_error("webhook", f"Webhook: falha no pedido #{order_id}:", e)
+                for ev in order_events:
+                    states[ev["event_id"]] = "failed" if ev["attempts"] >= self.max_attempts else "queued"
+                self.counts["failed"] += len(order_events)
+                WEBHOOK_EVENTS.inc(len(order_events), result="failed")
+                continue
+            state = "done" if applied else "skipped"
+            for ev in order_events:
+                states[ev["event_id"]] = state
+            self.counts[state] += len(order_events)
+            self.counts["coalesced"] += len(order_events) - 1
+            WEBHOOK_EVENTS.inc(len(order_events), result=state)
+            if len(order_events) > 1:
+                WEBHOOK_EVENTS.inc(len(order_events) - 1, result="coalesced")
+
+        await self.db.finish_webhook_events(states)
+        self.last_batch_seconds = time.monotonic() - started
+        WEBHOOK_BATCH_SECONDS.observe(self.last_batch_seconds)
+        now = datetime.utcnow()
+        for ev in events:
+            if states.get(ev["event_id"]) != "queued":
+                WEBHOOK_LAG_SECONDS.observe((now - datetime.fromisoformat(ev["received_at"])).total_seconds())
+        return len(events)
+
+    async def _apply(self, order_id: int, statuses: List[str]) -> bool:
+        # compare-and-set: se outro worker/processo mudou o pedido no meio, relê e refaz
+        for _ in range(3):
+            order = await self.db.get_order(order_id)
+            if not order:
+                return False
+            target = fold_transitions(order["status"], statuses)
+            if target is None:
+                return False
+            if await self.db.set_order_status_if(order_id, order["status"], target):
+                if self.notify:
+                    # falha ao notificar não desfaz nem repete a transição
+                    try:
+                        await self.notify(order, target)
+                    except Exception as e:
+                        self.counts["notify_errors"] += 1
+                        metrics.record_error("webhook_notify", f"Webhook: falha ao notificar pedido #{order_id}:", e)
+                return True
+        raise RuntimeError("pedido alterado concorrentemente")
+
+    async def stats(self) -> Dict[str, float]:
+        out: Dict[str, float] = dict(self.counts)
+        queue = await self.db.webhook_queue_stats()
+        out["queue_depth"] = queue["depth"]
+        out["queue_lag_seconds"] = queue["lag_seconds"]
+        out["last_batch_ms"] = self.last_batch_seconds * 1000
+        return out
\ No newline at end of file
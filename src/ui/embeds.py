@@ -0,0 +1,21 @@
+import discord
+from typing import Dict, Tuple
+from ..catalog import CatalogEntry
+from ..config import PRODUCT_IMAGE_8BALL_GUIDE
+
+# sku -> (versão da entrada, embed pronto); reconstruído só quando o produto muda
+_product_embeds: Dict[str, Tuple[int, discord.Embed]] = {}
+
+
+def product_embed(entry: CatalogEntry) -> discord.Embed:
+    cached = _product_embeds.get(entry.product.sku)
+    if cached is None or cached[0] != entry.version:
+        p = entry.product
+        embed = discord.Embed(title=p.name, description=p.description or "")
+        embed.add_field(name="Preço", value=entry.price_text)
+        if p.sku == "8BALL_GUIDE_PRO" and PRODUCT_IMAGE_8BALL_GUIDE:
+            embed.set_thumbnail(url=PRODUCT_IMAGE_8BALL_GUIDE)
+        cached = (entry.version, embed)
+        _product_embeds[p.sku] = cached
+    # cópia: quem recebe pode alterar o embed sem sujar o template
+    return cached[1].copy()
\ No newline at end of file
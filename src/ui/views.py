@@ -1,85 +1,485 @@
+import asyncio
+import time
+import weakref
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Tuple
+
 import discord
-from typing import Optional
+from .. import metrics
 from ..db import StoreDB
-from ..services.cart import cart_summary, brl
-from ..config import ORDER_LOG_CHANNEL_ID
+from ..models import Product
+from .embeds import product_embed
+from ..services.analytics import Analytics
+from ..services.cart import CartKey, CartStore, cart_summary, brl
+from ..services.guilds import GuildSettings
+from ..services.outbox import Outbox
+from ..services.payments import PaymentGateway, idempotency_key
+from ..services.tasks import TaskPipeline
 
 class CartChannelManager:
-    def __init__(self, db: StoreDB, cart_category_id: Optional[int]):
+    """Registro user -> canal de carrinho.
+
+    A tabela cart_channels é a fonte da verdade; `_index` é a cópia em memória
+    consultada a cada clique (sem varrer guild.channels). A criação de canal é
+    serializada por usuário, então cliques simultâneos não geram canais
+    duplicados.
+    """
+
+    def __init__(self, db: StoreDB, settings: GuildSettings):
         self.db = db
-        self.cart_category_id = cart_category_id
+        # categoria dos canais vem da configuração de cada guild
+        self.settings = settings
+        self._index: Dict[Tuple[int, int], int] = {}
+        self._owners: Dict[int, Tuple[int, int]] = {}
+        self._locks: "weakref.WeakValueDictionary[Tuple[int, int], asyncio.Lock]" = weakref.WeakValueDictionary()
+        self._touched: Dict[int, str] = {}
+        # canal -> mensagem fixada do carrinho (editada pelo Outbox)
+        self._messages: Dict[int, int] = {}
+
+    async def load(self):
+        rows = await self.db.list_cart_channels()
+        for r in rows:
+            self._register(int(r["guild_id"]), int(r["user_id"]), int(r["channel_id"]))
+            if r["message_id"]:
+                self._messages[int(r["channel_id"])] = int(r["message_id"])
+
+    def _register(self, guild_id: int, user_id: int, channel_id: int):
+        old = self._index.get((guild_id, user_id))
+        if old is not None:
+            self._owners.pop(old, None)
+        self._index[(guild_id, user_id)] = channel_id
+        self._owners[channel_id] = (guild_id, user_id)
+
+    def _unregister(self, channel_id: int) -> bool:
+        key = self._owners.pop(channel_id, None)
+        if key is None:
+            return False
+        if self._index.get(key) == channel_id:
+            del self._index[key]
+        self._touched.pop(channel_id, None)
+        self._messages.pop(channel_id, None)
+        return True
+
+    def cart_message(self, channel_id: int) -> Optional[int]:
+        return self._messages.get(channel_id)
+
+    async def set_cart_message(self, channel_id: int, message_id: Optional[int]):
+        if message_id:
+            self._messages[channel_id] = message_id
+        else:
+            self._messages.pop(channel_id, None)
+        await self.db.set_cart_message(channel_id, message_id)
+
+    def _cached(self, guild: discord.Guild, user_id: int) -> Optional[discord.TextChannel]:
+        channel_id = self._index.get((guild.id, user_id))
+        if channel_id is None:
+            return None
+        channel = guild.get_channel(channel_id)
+        if channel is None:
+            # apagado enquanto o bot estava fora; será recriado
+            self._unregister(channel_id)
+            return None
+        self._touched[channel_id] = datetime.utcnow().isoformat()
+        return channel
 
     async def get_or_create(self, interaction: discord.Interaction) -> discord.TextChannel:
         guild = interaction.guild
         assert guild is not None, "Use dentro de um servidor"
-        channel_name = f"carrinho-{interaction.user.name}".replace(" ", "-").lower()
-        existing = discord.utils.get(guild.channels, name=channel_name)
+        user = interaction.user
+        existing = self._cached(guild, user.id)
         if existing:
             return existing
 
-        overwrites = {
-            guild.default_role: discord.PermissionOverwrite(view_channel=False),
-            interaction.user: discord.PermissionOverwrite(view_channel=True, send_messages=True),
-            guild.me: discord.PermissionOverwrite(view_channel=True, send_messages=True),
-        }
-        category = None
-        if self.cart_category_id:
-            category = discord.utils.get(guild.categories, id=self.cart_category_id)
-        return await guild.create_text_channel(channel_name, overwrites=overwrites, category=category)
+        key = (guild.id, user.id)
+        lock = self._locks.setdefault(key, asyncio.Lock())
+        async with lock:
+            existing = self._cached(guild, user.id)
+            if existing:
+                return existing
+            channel_name = f"carrinho-{user.name}".replace(" ", "-").lower()
+            overwrites = {
+                guild.default_role: discord.PermissionOverwrite(view_channel=False),
+                user: discord.PermissionOverwrite(view_channel=True, send_messages=True),
+                guild.me: discord.PermissionOverwrite(view_channel=True, send_messages=True),
+            }
+            category = None
+            config = await self.settings.get(guild.id)
+            if config.cart_category_id:
+                category = guild.get_channel(config.cart_category_id)
+            channel = await guild.create_text_channel(channel_name, overwrites=overwrites, category=category)
+            await self.db.set_cart_channel(guild.id, user.id, channel.id)
+            self._register(guild.id, user.id, channel.id)
+            return channel
 
+    async def reconcile(self, guilds: Iterable[discord.Guild]):
+        # remove do registro canais que sumiram e adota canais de carrinho antigos
+        # (criados antes do registro existir) pelo overwrite do dono
+        gone = []
+        for guild in guilds:
+            config = await self.settings.get(guild.id)
+            for (guild_id, user_id), channel_id in list(self._index.items()):
+                if guild_id == guild.id and guild.get_channel(channel_id) is None:
+                    self._unregister(channel_id)
+                    gone.append(channel_id)
+            for channel in guild.text_channels:
+                if channel.id in self._owners or not channel.name.startswith("carrinho-"):
+                    continue
+                if config.cart_category_id and channel.category_id != config.cart_category_id:
+                    continue
+                owners = [t.id for t in channel.overwrites if not isinstance(t, discord.Role) and t.id != guild.me.id]
+                if len(owners) == 1 and (guild.id, owners[0]) not in self._index:
+                    await self.db.set_cart_channel(guild.id, owners[0], channel.id)
+                    self._register(guild.id, owners[0], channel.id)
+        await self.db.delete_cart_channels(gone)
 
-class ProdutoView(discord.ui.View):
-    def __init__(self, db: StoreDB, sku: str, cart_channel_mgr: CartChannelManager):
-        super().__init__(timeout=None)
+    async def forget_channel(self, channel_id: int):
+        if self._unregister(channel_id):
+            await self.db.delete_cart_channels([channel_id])
+
+    async def reap(self, client: discord.Client, idle_seconds: float) -> int:
+        # apaga canais de carrinho sem uso há mais de `idle_seconds`
+        touched, self._touched = self._touched, {}
+        await self.db.touch_cart_channels(touched)
+        before = (datetime.utcnow() - timedelta(seconds=idle_seconds)).isoformat()
+        reaped = []
+        for r in await self.db.idle_cart_channels(before):
+            channel_id = int(r["channel_id"])
+            guild = client.get_guild(int(r["guild_id"]))
+            if guild is None:
+                # guild de outro shard/processo; não é nossa
+                continue
+            channel = guild.get_channel(channel_id)
+            if channel is not None:
+                try:
+                    await channel.delete(reason="Carrinho inativo")
+                except discord.HTTPException as e:
+                    print("Reaper: falha ao apagar canal", channel_id, e)
+                    continue
+            self._unregister(channel_id)
+            reaped.append(channel_id)
+        await self.db.delete_cart_channels(reaped)
+        return len(reaped)
+
+    async def run_reaper(self, client: discord.Client, idle_seconds: float, interval: float = 600.0):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.reap(client, idle_seconds)
+            except Exception as e:
+                print("Reaper error:", e)
+
+
+class Vitrine:
+    """Handlers dos botões da vitrine; uma instância por bot, sem estado por mensagem.
+
+    Os handlers só fazem o trabalho em memória/banco local e respondem na hora;
+    PSP e canal de carrinho vão para o TaskPipeline em background, e as
+    mensagens saem pelo Outbox (carrinho editado, log agrupado).
+    """
+
+    def __init__(self, db: StoreDB, cart_channel_mgr: CartChannelManager, carts: CartStore, payments: PaymentGateway, tasks: TaskPipeline, outbox: Outbox, settings: GuildSettings, analytics: Analytics):
         self.db = db
-        self.sku = sku
         self.cart_channel_mgr = cart_channel_mgr
+        self.carts = carts
+        self.payments = payments
+        self.tasks = tasks
+        self.outbox = outbox
+        self.settings = settings
+        self.analytics = analytics
 
-    @discord.ui.button(label="➕ Adicionar ao Carrinho", style=discord.ButtonStyle.green)
-    async def add(self, interaction: discord.Interaction, button: discord.ui.Button):
-        cart = self.db.get_cart(interaction.user.id)
-        cart[self.sku] = cart.get(self.sku, 0) + 1
-        self.db.save_cart(interaction.user.id, cart)
+    @staticmethod
+    def _cart_key(interaction: discord.Interaction) -> CartKey:
+        return (interaction.guild_id or 0, interaction.user.id)
 
-        channel = await self.cart_channel_mgr.get_or_create(interaction)
-        text, total, _ = cart_summary(self.db, interaction.user.id)
+    async def add(self, interaction: discord.Interaction, sku: str):
+        cart = await self.carts.add_item(self._cart_key(interaction), sku)
+        if cart == {sku: 1}:
+            # carrinho novo: entra no funil de vendas
+            self.analytics.count_cart(interaction.guild_id)
+        await interaction.response.send_message("Produto adicionado! Abra seu canal de carrinho.", ephemeral=True)
+        self.tasks.record_ack(interaction.created_at)
+        self.tasks.submit("add", lambda: self._post_cart(interaction))
+
+    async def _post_cart(self, interaction: discord.Interaction):
+        channel = await self.tasks.stage("cart_channel", lambda: self.cart_channel_mgr.get_or_create(interaction))
+        # lê o carrinho agora, não no clique: com vários workers um job mais
+        # antigo pode terminar depois e o update_cart fica com o último estado.
+        # Se mudou enquanto o resumo era montado, monta de novo
+        key = self._cart_key(interaction)
+        cart = await self.carts.get(key)
+        while True:
+            text, total, _ = await cart_summary(self.db, key, items=cart)
+            current = await self.carts.get(key)
+            if current == cart:
+                break
+            cart = current
         embed = discord.Embed(title="Seu Carrinho", description=text)
         embed.add_field(name="Total", value=brl(total))
-        await channel.send(f"{interaction.user.mention}, seu carrinho foi atualizado:", embed=embed)
-        await interaction.response.send_message("Produto adicionado! Abra seu canal de carrinho.", ephemeral=True)
+        # cliques em sequência viram um único edit da mensagem fixada
+        self.outbox.update_cart(channel, f"{interaction.user.mention}, seu carrinho:", embed)
 
-    @discord.ui.button(label="🛒 Ver Carrinho", style=discord.ButtonStyle.blurple)
-    async def ver(self, interaction: discord.Interaction, button: discord.ui.Button):
-        text, total, _ = cart_summary(self.db, interaction.user.id)
+    async def ver(self, interaction: discord.Interaction, sku: str):
+        key = self._cart_key(interaction)
+        items = await self.carts.get(key)
+        text, total, _ = await cart_summary(self.db, key, items=items)
         await interaction.response.send_message(embed=discord.Embed(title="Seu Carrinho", description=text), ephemeral=True)
+        self.tasks.record_ack(interaction.created_at)
 
-    @discord.ui.button(label="💳 Checkout", style=discord.ButtonStyle.red)
-    async def checkout(self, interaction: discord.Interaction, button: discord.ui.Button):
-        from ..services.payments import PaymentGateway
-        text, total, items = cart_summary(self.db, interaction.user.id)
+    async def checkout(self, interaction: discord.Interaction, sku: str):
+        key = self._cart_key(interaction)
+        items = await self.carts.get(key)
+        text, total, items = await cart_summary(self.db, key, items=items)
         if not items:
             await interaction.response.send_message("Carrinho vazio!", ephemeral=True)
             return
-        # cria pedido e link de pagamento
-        order_id = self.db.create_order(interaction.user.id, items, total)
-        pg = PaymentGateway()
-        payment_link = pg.create_payment_link(order_id, title="Pedido Discord", description="Produtos digitais", amount=total)
-        self.db.update_order_status(order_id, "aguardando_pagamento", payment_link)
-        self.db.clear_cart(interaction.user.id)
+        # esvazia antes de responder, para um segundo clique não gerar outro pedido
+        await self.carts.clear(key)
+        await interaction.response.send_message("⏳ Gerando seu pedido...", ephemeral=True)
+        self.tasks.record_ack(interaction.created_at)
+        if not self.tasks.submit("checkout", lambda: self._finish_checkout(interaction, items, text, total)):
+            await self._restore_cart(interaction, items)
+
+    async def _finish_checkout(self, interaction: discord.Interaction, items: Dict[str, int], text: str, total: float):
+        # roda num worker do pipeline: o trace_id (id da interação) vai explícito
+        with metrics.span("checkout.finish", trace_id=str(interaction.id), user_id=interaction.user.id) as sp:
+            try:
+                order_id, payment_link = await self._order_with_payment(interaction.guild_id, interaction.user.id, items, total)
+            except Exception:
+                await self._restore_cart(interaction, items)
+                raise
+            sp["order_id"] = order_id
+            await self._deliver_checkout(interaction, order_id, payment_link, text, total)
 
-        channel = await self.cart_channel_mgr.get_or_create(interaction)
+    async def _deliver_checkout(self, interaction: discord.Interaction, order_id: int, payment_link: str, text: str, total: float):
+        # best-effort: o token da interação pode ter expirado; o link segue
+        # para o canal de carrinho de qualquer jeito
+        try:
+            await self.tasks.stage("ack_edit", lambda: interaction.edit_original_response(
+                content=f"Pedido #{order_id} criado! [Clique para pagar]({payment_link}) — o link também foi enviado no seu canal de carrinho."
+            ), retries=0)
+        except discord.HTTPException:
+            pass
+
+        channel = await self.tasks.stage("cart_channel", lambda: self.cart_channel_mgr.get_or_create(interaction))
         embed = discord.Embed(title=f"Pedido #{order_id}", description=text)
         embed.add_field(name="Total", value=brl(total), inline=True)
         embed.add_field(name="Pagamento", value=f"[Clique para pagar]({payment_link})", inline=False)
-        await channel.send(f"{interaction.user.mention}, seu pedido foi gerado:", embed=embed)
-        await interaction.response.send_message("Pedido criado! Link de pagamento enviado no seu canal de carrinho.", ephemeral=True)
-
-        # log interno de pedido
-        if ORDER_LOG_CHANNEL_ID and interaction.guild:
-            log_channel = interaction.guild.get_channel(ORDER_LOG_CHANNEL_ID)
-            if log_channel:
-                log_embed = discord.Embed(title="📝 Novo Pedido", description=f"Pedido #{order_id}")
-                log_embed.add_field(name="Cliente", value=interaction.user.mention)
-                log_embed.add_field(name="Total", value=brl(total))
-                log_embed.add_field(name="Status", value="aguardando_pagamento")
-                await log_channel.send(embed=log_embed)
\ No newline at end of file
+        self.outbox.send(channel, f"{interaction.user.mention}, seu pedido foi gerado:", embed=embed)
+        self.outbox.update_cart(channel, f"{interaction.user.mention}, seu carrinho:", discord.Embed(title="Seu Carrinho", description="Seu carrinho está vazio."))
+
+        # log interno de pedido (agrupado com outros pedidos próximos), no canal da guild
+        log_channel_id = (await self.settings.get(interaction.guild_id)).order_log_channel_id
+        if log_channel_id:
+            log_embed = discord.Embed(title="📝 Novo Pedido", description=f"Pedido #{order_id}")
+            log_embed.add_field(name="Cliente", value=interaction.user.mention)
+            log_embed.add_field(name="Total", value=brl(total))
+            log_embed.add_field(name="Status", value="aguardando_pagamento")
+            self.outbox.log(log_channel_id, log_embed, interaction.guild_id)
+
+    async def _order_with_payment(self, guild_id: Optional[int], user_id: int, items: Dict[str, int], total: float) -> Tuple[int, str]:
+        # reaproveita o pedido/preferência de um checkout idêntico ainda não pago
+        key = idempotency_key(user_id, items, total, guild_id)
+        reused = self.payments.reusable(key)
+        if reused:
+            order = await self.db.get_order(reused.order_id)
+            if order and order["status"] == "aguardando_pagamento":
+                return reused.order_id, reused.url
+            self.payments.forget(key)
+
+        # cria pedido e link de pagamento
+        order_id = await self.tasks.stage("order", lambda: self.db.create_order(user_id, items, total, guild_id=guild_id), retries=0)
+        payment_link = await self.tasks.stage("payment_link", lambda: self.payments.create_payment_link(
+            order_id, title="Pedido Discord", description="Produtos digitais", amount=total, cache_key=key
+        ))
+        await self.tasks.stage("order_status", lambda: self.db.update_order_status(order_id, "aguardando_pagamento", payment_link))
+        return order_id, payment_link
+
+    async def _restore_cart(self, interaction: discord.Interaction, items: Dict[str, int]):
+        key = self._cart_key(interaction)
+        for sku, qty in items.items():
+            await self.carts.add_item(key, sku, qty)
+        try:
+            await interaction.edit_original_response(content="❌ Não foi possível gerar o pagamento agora. Seu carrinho foi mantido, tente novamente.")
+        except discord.HTTPException:
+            pass
+
+
+
+VITRINE_BUTTONS = {
+    "add": ("➕ Adicionar ao Carrinho", discord.ButtonStyle.green),
+    "ver": ("🛒 Ver Carrinho", discord.ButtonStyle.blurple),
+    "checkout": ("💳 Checkout", discord.ButtonStyle.red),
+}
+
+
+class VitrineButton(discord.ui.DynamicItem[discord.ui.Button], template=r"loja:(?P<action>add|ver|checkout):(?P<sku>[^:]+)"):
+    """Botão persistente da vitrine: ação e SKU vão no custom_id.
+
+    Registrado uma vez com bot.add_dynamic_items(); continua funcionando depois
+    de restart/deploy e atende qualquer número de mensagens postadas.
+    """
+
+    def __init__(self, action: str, sku: str):
+        label, style = VITRINE_BUTTONS[action]
+        super().__init__(discord.ui.Button(label=label, style=style, custom_id=f"loja:{action}:{sku}"))
+        self.action = action
+        self.sku = sku
+
+    @staticmethod
+    def accepts(sku: str) -> bool:
+        # o SKU vai no custom_id (máx. 100 caracteres) e ':' separa os campos
+        return bool(sku) and ":" not in sku and len(f"loja:checkout:{sku}") <= 100
+
+    @classmethod
+    async def from_custom_id(cls, interaction: discord.Interaction, item: discord.ui.Button, match):
+        return cls(match["action"], match["sku"])
+
+    async def callback(self, interaction: discord.Interaction):
+        vitrine: Vitrine = interaction.client.vitrine
+        started = time.perf_counter()
+        result = "error"
+        try:
+            with metrics.span(f"button.{self.action}", trace_id=str(interaction.id), user_id=interaction.user.id, sku=self.sku):
+                await getattr(vitrine, self.action)(interaction, self.sku)
+            result = "ok"
+        finally:
+            metrics.INTERACTION_SECONDS.observe(time.perf_counter() - started, kind="button", name=self.action, result=result)
+
+
+def produto_view(sku: str) -> discord.ui.View:
+    # view só para montar os componentes da mensagem; quem responde é o
+    # VitrineButton registrado no bot. stop() antes do envio faz o discord.py
+    # não guardar nada por mensagem no ViewStore.
+    view = discord.ui.View(timeout=None)
+    for action in VITRINE_BUTTONS:
+        view.add_item(VitrineButton(action, sku))
+    view.stop()
+    return view
+
+
+def _order_line(r) -> str:
+    return f"#{r['id']} • user:{r['user_id']} • {r['status']} • R$ {r['total']:.2f}"
+
+
+class PedidosView(discord.ui.View):
+    """Paginação de pedidos por chave: guarda só os filtros e os ids das bordas da página."""
+
+    def __init__(self, db: StoreDB, filters: dict, page_size: int):
+        super().__init__(timeout=300)
+        self.db = db
+        self.filters = filters
+        self.page_size = page_size
+        self.first_id: Optional[int] = None
+        self.last_id: Optional[int] = None
+
+    async def load(self, before_id: Optional[int] = None, after_id: Optional[int] = None) -> Optional[str]:
+        # pede um a mais para saber se existe página além desta
+        rows = await self.db.query_orders(**self.filters, before_id=before_id, after_id=after_id, limit=self.page_size + 1)
+        more = len(rows) > self.page_size
+        rows = rows[-self.page_size:] if after_id is not None else rows[:self.page_size]
+        if not rows:
+            return None
+        self.first_id, self.last_id = rows[0]["id"], rows[-1]["id"]
+        if after_id is not None:
+            self.anterior.disabled, self.proxima.disabled = not more, False
+        elif before_id is not None:
+            self.anterior.disabled, self.proxima.disabled = False, not more
+        else:
+            self.anterior.disabled, self.proxima.disabled = True, not more
+        return "\n".join(_order_line(r) for r in rows)
+
+    @discord.ui.button(label="◀ Anteriores", style=discord.ButtonStyle.gray)
+    async def anterior(self, interaction: discord.Interaction, button: discord.ui.Button):
+        text = await self.load(after_id=self.first_id)
+        await interaction.response.edit_message(content=text or "Sem pedidos mais recentes.", view=self)
+
+    @discord.ui.button(label="Próximos ▶", style=discord.ButtonStyle.gray)
+    async def proxima(self, interaction: discord.Interaction, button: discord.ui.Button):
+        text = await self.load(before_id=self.last_id)
+        await interaction.response.edit_message(content=text or "Sem pedidos mais antigos.", view=self)
+
+
+# limite de opções de um select do Discord
+_SELECT_MAX = 25
+# resultados de busca guardados por /loja (páginas de 25)
+LOJA_RESULTS_MAX = 500
+
+
+class LojaView(discord.ui.View):
+    """Navegação do catálogo para clientes (/loja).
+
+    Categoria sem busca vem direto do catálogo em memória (já ordenado); com
+    busca, do products_fts. A view guarda só a lista de produtos do resultado
+    e a página; o produto escolhido abre o embed com os botões da vitrine.
+    """
+
+    def __init__(self, db: StoreDB, category: Optional[str] = None, query: Optional[str] = None):
+        super().__init__(timeout=300)
+        self.db = db
+        self.category = category
+        self.query = query
+        self.products: List[Product] = []
+        self.page = 0
+
+    async def load(self) -> str:
+        if self.query:
+            self.products = await self.db.search_products(self.query, self.category, limit=LOJA_RESULTS_MAX)
+        else:
+            self.products = await self.db.list_products(self.category)
+        self.page = 0
+        self._render(await self.db.list_categories())
+        return self._header()
+
+    def _pages(self) -> int:
+        return max(1, -(-len(self.products) // _SELECT_MAX))
+
+    def _header(self) -> str:
+        where = self.category or "todas as categorias"
+        if self.query:
+            where += f" • busca: {self.query}"
+        return f"🛍️ **Loja** — {where}\n{len(self.products)} produto(s) • página {self.page + 1}/{self._pages()}"
+
+    def _render(self, categories: Optional[List[str]] = None):
+        start = self.page * _SELECT_MAX
+        page = self.products[start:start + _SELECT_MAX]
+        self.produto.options = [
+            discord.SelectOption(label=p.name[:100], value=p.sku, description=f"{brl(p.price)} • {p.category or 'geral'}"[:100])
+            for p in page
+        ] or [discord.SelectOption(label="Nenhum produto", value="-")]
+        self.produto.disabled = not page
+        if categories is not None:
+            # "todas" + as primeiras categorias; o parâmetro categoria do /loja alcança as demais
+            self.categoria.options = [discord.SelectOption(label="Todas as categorias", value="*", default=self.category is None)] + [
+                discord.SelectOption(label=c[:100], value=c[:100], default=c == self.category)
+                for c in categories[:_SELECT_MAX - 1]
+            ]
+        self.anterior.disabled = self.page == 0
+        self.proxima.disabled = self.page + 1 >= self._pages()
+
+    @discord.ui.select(placeholder="Escolha um produto", row=0)
+    async def produto(self, interaction: discord.Interaction, select: discord.ui.Select):
+        sku = select.values[0]
+        entry = await self.db.get_catalog_entry(sku)
+        if entry is None:
+            await interaction.response.send_message("Produto indisponível.", ephemeral=True)
+            return
+        await interaction.response.send_message(embed=product_embed(entry), view=produto_view(sku), ephemeral=True)
+
+    @discord.ui.select(placeholder="Categoria", row=1)
+    async def categoria(self, interaction: discord.Interaction, select: discord.ui.Select):
+        value = select.values[0]
+        self.category = None if value == "*" else value
+        text = await self.load()
+        await interaction.response.edit_message(content=text, view=self)
+
+    @discord.ui.button(label="◀ Anterior", style=discord.ButtonStyle.gray, row=2)
+    async def anterior(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(0, self.page - 1)
+        self._render()
+        await interaction.response.edit_message(content=self._header(), view=self)
+
+    @discord.ui.button(label="Próxima ▶", style=discord.ButtonStyle.gray, row=2)
+    async def proxima(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = min(self._pages() - 1, self.page + 1)
+        self._render()
+        await interaction.response.edit_message(content=self._header(), view=self)
\ No newline at end of file
@@ -1,12 +1,81 @@
 # src/webapp.py
+from contextlib import asynccontextmanager
+import discord
 from fastapi import FastAPI, Request, Header
-from .config import WEBHOOK_VERIFY_TOKEN, DB_PATH, ORDER_LOG_CHANNEL_ID
+from fastapi.responses import JSONResponse, PlainTextResponse, RedirectResponse
+from . import metrics
+from .config import (
+    WEBHOOK_VERIFY_TOKEN, WEBHOOK_WORKERS,
+    PUBLIC_BASE_URL, DELIVERY_SECRET, DELIVERY_LINK_TTL_HOURS, DELIVERY_WORKERS, DELIVERY_RETRIES,
+    ANALYTICS_TOKEN, METRICS_TOKEN, SHUTDOWN_TIMEOUT_SECONDS,
+)
 from .db import StoreDB
+from .services.analytics import Analytics, day_range
 from .services.cart import brl
+from .services.delivery import DOWNLOADS, DeliveryEngine, download_secret, verify_download
+from .services.orders import map_psp_status
+from .services.webhooks import WebhookProcessor, webhook_event_id
+from datetime import date, timedelta
 import json
+import time
 
-app = FastAPI()
-db = StoreDB(DB_PATH)
+HTTP_SECONDS = metrics.histogram("http_request_seconds", "Latência das rotas HTTP", ("route", "status"))
+WEBHOOK_RECEIVED = metrics.counter("webhook_received_total", "Webhooks recebidos, por resultado do enfileiramento", ("result",))
+WEBHOOK_QUEUE_DEPTH = metrics.gauge("webhook_queue_depth", "Eventos de webhook pendentes (queued/processing)")
+WEBHOOK_QUEUE_LAG = metrics.gauge("webhook_queue_lag_seconds", "Idade do evento pendente mais antigo")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    app.state.download_secret = download_secret(DELIVERY_SECRET)
+    # só leitura dos agregados; quem grava contadores é o Analytics do bot
+    app.state.analytics = Analytics(app.state.db)
+    app.state.delivery = app.state.webhooks = None
+    app.state.stopping = False
+    if app.state.notifier is None:
+        # processo só HTTP (launcher): o webhook só grava na fila; quem aplica
+        # e entrega são os workers do bot, que têm conexão com o Discord
+        yield
+        return
+    delivery = DeliveryEngine(
+        app.state.db, app.state.notifier, app.state.download_secret, PUBLIC_BASE_URL,
+        link_ttl=DELIVERY_LINK_TTL_HOURS * 3600, workers=DELIVERY_WORKERS, retries=DELIVERY_RETRIES,
+    )
+    processor = WebhookProcessor(app.state.db, notify=notify_order_update, workers=WEBHOOK_WORKERS)
+    app.state.delivery = delivery
+    app.state.webhooks = processor
+    delivery.start()
+    processor.start()
+    try:
+        yield
+    finally:
+        # o bot ainda está conectado: eventos e entregas em andamento terminam
+        await processor.close(SHUTDOWN_TIMEOUT_SECONDS)
+        await delivery.close(SHUTDOWN_TIMEOUT_SECONDS)
+
+
+app = FastAPI(lifespan=lifespan)
+# app.state.db, app.state.bot, app.state.notifier e app.state.guild_settings são
+# injetados por main(), compartilhados com o bot (None no processo só HTTP);
+# app.state.local_only indica que o servidor só escuta em 127.0.0.1
+
+
+@app.middleware("http")
+async def time_requests(request: Request, call_next):
+    started = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        return response
+    finally:
+        # template da rota (ex.: /webhook/mp), não o caminho bruto, para não explodir a cardinalidade
+        route = request.scope.get("route")
+        HTTP_SECONDS.observe(time.perf_counter() - started, route=getattr(route, "path", "desconhecida"), status=status)
+
+
+def get_db(request: Request) -> StoreDB:
+    return request.app.state.db
 
 
 @app.get("/")
@@ -14,81 +83,222 @@ async def root():
     return {"ok": True, "service": "discord-sales-bot"}
 
 
+@app.get("/health")
+async def health(request: Request):
+    # processo vivo e event loop respondendo
+    return {"ok": True, "stopping": request.app.state.stopping}
+
+
+def readiness(state) -> dict:
+    checks = {"catalog": state.db.catalog.loaded, "accepting": not state.stopping}
+    if state.bot is not None:
+        checks["bot"] = state.bot.is_ready() and not state.bot.is_closed()
+    return checks
+
+
+@app.get("/ready")
+async def ready(request: Request):
+    # 503 até o catálogo estar em memória e o bot conectado, e de novo ao encerrar
+    checks = readiness(request.app.state)
+    ok = all(checks.values())
+    return JSONResponse({"ok": ok, "checks": checks}, status_code=200 if ok else 503)
+
+
+def _check_ops_token(request: Request, x_token: str | None, authorization: str | None):
+    # /metrics, /stats/* e /debug/traces expõem ids de usuários e pedidos: no
+    # listener público exigem METRICS_TOKEN (x-token ou Bearer, para o Prometheus);
+    # os workers do bot, que só escutam em 127.0.0.1, dispensam
+    if request.app.state.local_only:
+        return None
+    if not METRICS_TOKEN:
+        return JSONResponse({"ok": False, "error": "métricas desativadas neste endereço"}, status_code=404)
+    if x_token != METRICS_TOKEN and authorization != f"Bearer {METRICS_TOKEN}":
+        return JSONResponse({"ok": False, "error": "invalid token"}, status_code=403)
+    return None
+
+
+@app.get("/stats/db")
+async def db_stats(request: Request, x_token: str | None = Header(None), authorization: str | None = Header(None)):
+    denied = _check_ops_token(request, x_token, authorization)
+    if denied is not None:
+        return denied
+    return get_db(request).stats()
+
+
+@app.get("/stats/webhooks")
+async def webhook_stats(request: Request, x_token: str | None = Header(None), authorization: str | None = Header(None)):
+    denied = _check_ops_token(request, x_token, authorization)
+    if denied is not None:
+        return denied
+    processor = request.app.state.webhooks
+    if processor is None:
+        return await get_db(request).webhook_queue_stats()
+    return await processor.stats()
+
+
+@app.get("/stats/delivery")
+async def delivery_stats(request: Request, x_token: str | None = Header(None), authorization: str | None = Header(None)):
+    denied = _check_ops_token(request, x_token, authorization)
+    if denied is not None:
+        return denied
+    out = await get_db(request).delivery_stats()
+    if request.app.state.delivery is not None:
+        out.update(request.app.state.delivery.stats())
+    return out
+
+
+def _report_range(start: str | None, end: str | None, days: int):
+    # [start, end) em 'AAAA-MM-DD'; o que faltar sai de `days` (padrão: últimos 30 dias até hoje)
+    try:
+        end_day = date.fromisoformat(end) if end else date.fromisoformat(day_range(1)[1])
+        start_day = date.fromisoformat(start) if start else end_day - timedelta(days=days)
+    except ValueError:
+        return None
+    return start_day.isoformat(), end_day.isoformat()
+
+
+def _check_analytics_token(x_token: str | None):
+    # sem ANALYTICS_TOKEN configurado os relatórios ficam desligados
+    if not ANALYTICS_TOKEN:
+        return JSONResponse({"ok": False, "error": "relatórios desativados"}, status_code=404)
+    if x_token != ANALYTICS_TOKEN:
+        return JSONResponse({"ok": False, "error": "invalid token"}, status_code=403)
+    return None
+
+
+@app.get("/analytics/report")
+async def analytics_report(request: Request, guild_id: int | None = None, start: str | None = None, end: str | None = None,
+                           days: int = 30, top: int = 10, x_token: str | None = Header(None)):
+    denied = _check_analytics_token(x_token)
+    if denied is not None:
+        return denied
+    period = _report_range(start, end, days)
+    if period is None:
+        return JSONResponse({"ok": False, "error": "datas no formato AAAA-MM-DD"}, status_code=400)
+    return await request.app.state.analytics.report(guild_id, *period, top=min(top, 100))
+
+
+@app.get("/analytics/sales.csv")
+async def analytics_sales_csv(request: Request, guild_id: int | None = None, start: str | None = None, end: str | None = None,
+                              days: int = 30, x_token: str | None = Header(None)):
+    denied = _check_analytics_token(x_token)
+    if denied is not None:
+        return denied
+    period = _report_range(start, end, days)
+    if period is None:
+        return JSONResponse({"ok": False, "error": "datas no formato AAAA-MM-DD"}, status_code=400)
+    body = await request.app.state.analytics.sales_csv(guild_id, *period)
+    return PlainTextResponse(body, media_type="text/csv", headers={
+        "Content-Disposition": f'attachment; filename="vendas_{period[0]}_{period[1]}.csv"',
+    })
+
+
+@app.get("/download/{order_id}/{sku}")
+async def download(request: Request, order_id: int, sku: str, exp: int, sig: str):
+    # link assinado por pedido+SKU; só redireciona enquanto o pedido segue pago
+    if not verify_download(request.app.state.download_secret, order_id, sku, exp, sig):
+        DOWNLOADS.inc(result="invalid")
+        return JSONResponse({"ok": False, "error": "link inválido ou expirado"}, status_code=403)
+    db = get_db(request)
+    order = await db.get_order(order_id)
+    if not order or order["status"] != "pago":
+        DOWNLOADS.inc(result="revoked")
+        return JSONResponse({"ok": False, "error": "pedido não está pago"}, status_code=403)
+    entry = await db.get_catalog_entry(sku)
+    if not entry or not entry.delivery_url:
+        DOWNLOADS.inc(result="missing")
+        return JSONResponse({"ok": False, "error": "produto sem arquivo de entrega"}, status_code=404)
+    DOWNLOADS.inc(result="ok")
+    # o arquivo vem do storage/CDN; o app só valida e redireciona
+    return RedirectResponse(entry.delivery_url, status_code=302, headers={"Cache-Control": "private, no-store"})
+
+
+@app.get("/metrics")
+async def prometheus_metrics(request: Request, x_token: str | None = Header(None), authorization: str | None = Header(None)):
+    denied = _check_ops_token(request, x_token, authorization)
+    if denied is not None:
+        return denied
+    # a fila de webhooks está no banco, então é lida aqui (async) e não num collector
+    queue = await get_db(request).webhook_queue_stats()
+    WEBHOOK_QUEUE_DEPTH.set(queue["depth"])
+    WEBHOOK_QUEUE_LAG.set(queue["lag_seconds"])
+    return PlainTextResponse(metrics.REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+
+@app.get("/debug/traces")
+async def traces(request: Request, trace_id: str | None = None, order_id: int | None = None, limit: int = 100,
+                 x_token: str | None = Header(None), authorization: str | None = Header(None)):
+    denied = _check_ops_token(request, x_token, authorization)
+    if denied is not None:
+        return denied
+    if not metrics.TRACER.enabled:
+        return {"enabled": False, "spans": []}
+    return {"enabled": True, "spans": metrics.TRACER.find(trace_id, order_id, min(limit, 1000))}
+
+
 @app.post("/webhook/mp")
 async def mp_webhook(request: Request, x_token: str | None = Header(None)):
     # validação de segurança simples via header
     if x_token != WEBHOOK_VERIFY_TOKEN:
+        WEBHOOK_RECEIVED.inc(result="rejected")
         return {"ok": False, "error": "invalid token"}
 
-    payload = await request.json()
+    body = await request.body()
+    payload = json.loads(body)
     # Esperado: {"order_id": 123, "status": "approved"}
     order_id = payload.get("order_id")
     status = payload.get("status")
 
     if order_id and status:
-        mapped = {
-            "approved": "pago",
-            "rejected": "pagamento_recusado",
-            "pending": "aguardando_pagamento",
-        }.get(status, status)
-
-        db.update_order_status(int(order_id), mapped)
-
-        try:
-            import discord
-            from .bot import bot  # instância global do discord.py
-
-            # busca pedido no banco
-            order = db.get_order(int(order_id))
-            if order:
-                user_id = int(order["user_id"])
-                items = json.loads(order["items_json"]) or {}
-
-                # 1) DM padrão para o cliente quando aprovado
-                if mapped == "pago":
-                    try:
-                        user = await bot.fetch_user(user_id)
-                        if user:
-                            await user.send(
-                                f"✅ Olá! Seu pagamento do Pedido #{order_id} foi confirmado.\n"
-                                "Nosso time vai entregar o produto diretamente no seu canal de carrinho no Discord.\n"
-                                "Por favor, aguarde 😊"
-                            )
-                    except Exception:
-                        pass
-
-                # 2) Log no canal interno
-                if ORDER_LOG_CHANNEL_ID:
-                    log_channel = bot.get_channel(ORDER_LOG_CHANNEL_ID)
-                    if log_channel:
-                        # monta lista de itens
-                        lines = []
-                        for sku, q in items.items():
-                            row = db.get_product_row(sku)
-                            if row:
-                                lines.append(f"• {row['name']} (x{q})")
-                        items_text = "\n".join(lines) or "(itens indisponíveis)"
-
-                        log_embed = discord.Embed(
-                            title="📦 Atualização de Pedido",
-                            description=f"ID: #{order_id}"
-                        )
-                        log_embed.add_field(name="Cliente ID", value=str(user_id), inline=True)
-                        log_embed.add_field(name="Status", value=mapped, inline=True)
-                        log_embed.add_field(name="Itens", value=items_text, inline=False)
-                        log_embed.add_field(name="Total", value=brl(order["total"]), inline=True)
-                        if order["payment_link"]:
-                            log_embed.add_field(
-                                name="Pagamento",
-                                value=order["payment_link"],
-                                inline=False,
-                            )
-                        try:
-                            await log_channel.send(embed=log_embed)
-                        except Exception:
-                            pass
-        except Exception:
-            # evita crash se o bot ainda não subiu
-            pass
-
-    return {"ok": True}
\ No newline at end of file
+        # só grava na fila durável; o WebhookProcessor aplica e notifica
+        mapped = map_psp_status(status)
+        event_id = webhook_event_id(payload, int(order_id), mapped, body)
+        queued = await get_db(request).enqueue_webhook_event(event_id, int(order_id), mapped, payload)
+        WEBHOOK_RECEIVED.inc(result="queued" if queued else "duplicate")
+        if queued and request.app.state.webhooks is not None:
+            request.app.state.webhooks.wake()
+        return {"ok": True, "queued": queued}
+
+    return {"ok": True}
+
+
+async def notify_order_update(order, mapped: str):
+    db = app.state.db
+    notifier = app.state.notifier
+    order_id = order["id"]
+    user_id = int(order["user_id"])
+    items = json.loads(order["items_json"]) or {}
+
+    # 1) pago: a DM com os links sai pelo DeliveryEngine (pedido já marcado para entrega)
+    if mapped == "pago":
+        app.state.delivery.wake()
+
+    # 2) Log no canal interno da guild do pedido
+    guild_id = int(order["guild_id"]) if order["guild_id"] else None
+    config = await app.state.guild_settings.get(guild_id)
+    if config.order_log_channel_id:
+        # monta lista de itens
+        products = await db.get_products(items)
+        lines = []
+        for sku, q in items.items():
+            p = products.get(sku)
+            if p:
+                lines.append(f"• {p.name} (x{q})")
+        items_text = "\n".join(lines) or "(itens indisponíveis)"
+
+        log_embed = discord.Embed(
+            title="📦 Atualização de Pedido",
+            description=f"ID: #{order_id}"
+        )
+        log_embed.add_field(name="Cliente ID", value=str(user_id), inline=True)
+        log_embed.add_field(name="Status", value=mapped, inline=True)
+        log_embed.add_field(name="Itens", value=items_text, inline=False)
+        log_embed.add_field(name="Total", value=brl(order["total"]), inline=True)
+        if order["payment_link"]:
+            log_embed.add_field(
+                name="Pagamento",
+                value=order["payment_link"],
+                inline=False,
+            )
+        # o log é agrupado pelo Outbox do bot; não espera o envio
+        notifier.post_log(config.order_log_channel_id, log_embed, guild_id)
\ No newline at end of file